@@ -0,0 +1,23 @@
+# Generated by Django 3.1.3 on 2022-10-18 00:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='followers_count',
+            field=models.IntegerField(default=0, null=True),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='followings_count',
+            field=models.IntegerField(default=0, null=True),
+        ),
+    ]
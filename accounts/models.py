@@ -16,6 +16,11 @@ class UserProfile(models.Model):
     # When a user is created, an object of user profile will be created. At this time,
     # the user has no time to set nickname and other information, so set null=True
     nickname = models.CharField(null=True, max_length=200)
+    # denormalized counts of the social graph, updated by FriendshipService.follow / unfollow
+    # and fixed by reconcile_friendship_counts_task. They are stale in the cached profile,
+    # read them through FriendshipService.get_friendship_counts
+    followings_count = models.IntegerField(default=0, null=True)
+    followers_count = models.IntegerField(default=0, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -3,9 +3,13 @@ from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.cache import caches
 from twitter.cache import USER_PROFILE_PATTERN
+from utils.local_cache import LocalCache, copy_instance
 from utils.memcached_helper import MemcachedHelper
+from utils.request_cache import RequestCache
 
 cache = caches['testing'] if settings.TESTING else caches['default']
+# namespace of the profiles in the request scoped memo, see utils.request_cache
+MEMO_NAMESPACE = 'profiles'
 
 
 class UserService:
@@ -16,6 +20,29 @@ class UserService:
 
     @classmethod
     def get_profile_through_cache(cls, user_id):
+        # a profile is fetched at most once per request, whichever user instance asks for it
+        return RequestCache.get_or_load(
+            MEMO_NAMESPACE,
+            user_id,
+            lambda: cls._get_profile_through_cache(user_id),
+        )
+
+    @classmethod
+    def _get_profile_through_cache(cls, user_id):
+        key = USER_PROFILE_PATTERN.format(user_id=user_id)
+        # kept in process in front of memcached, see utils.local_cache
+        local_cache = LocalCache.get_cache(UserProfile.__name__)
+        if local_cache is None:
+            return cls._get_profile_through_memcached(user_id)
+        hit, profile = local_cache.get(key)
+        if hit:
+            return copy_instance(profile)
+        profile = cls._get_profile_through_memcached(user_id)
+        local_cache.set(key, copy_instance(profile))
+        return profile
+
+    @classmethod
+    def _get_profile_through_memcached(cls, user_id):
         key = USER_PROFILE_PATTERN.format(user_id=user_id)
 
         # read from cache first
@@ -26,10 +53,12 @@ class UserService:
 
         # cache miss, read from db
         profile, _ = UserProfile.objects.get_or_create(user_id=user_id)
-        cache.set(key, profile)
+        cache.set(key, profile, MemcachedHelper.get_expire_time())
         return profile
 
     @classmethod
     def invalidate_profile(cls, user_id):
         key = USER_PROFILE_PATTERN.format(user_id=user_id)
-        cache.delete(key)
\ No newline at end of file
+        cache.delete(key)
+        RequestCache.delete(MEMO_NAMESPACE, user_id)
+        LocalCache.invalidate(UserProfile.__name__, key)
\ No newline at end of file
@@ -0,0 +1,117 @@
+"""
+Rows/sec of HBaseModel.init_from_row, compared with the baseline implementation that rescanned
+the class for the field hash on every call (reproduced below as LegacyHBaseModel)
+run in the project container: python -m benchmarks.hbase_models
+"""
+import os
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'twitter.settings')
+django.setup()
+
+from django_hbase.models import HBaseField, IntegerField, TimestampField
+from newsfeeds.models import HBaseNewsFeed
+
+N = 100000
+
+
+class LegacyHBaseModel:
+    """
+    The baseline HBaseModel before the metaclass, only the methods used by init_from_row
+    """
+
+    class Meta:
+        table_name = None
+        row_key = ()
+
+    @classmethod
+    def get_field_hash(cls):
+        field_hash = {}
+        for field in cls.__dict__:
+            field_obj = getattr(cls, field)
+            if isinstance(field_obj, HBaseField):
+                field_hash[field] = field_obj
+        return field_hash
+
+    def __init__(self, **kwargs):
+        for key, field in self.get_field_hash().items():
+            value = kwargs.get(key)
+            setattr(self, key, value)
+
+    @classmethod
+    def init_from_row(cls, row_key, row_data):
+        if not row_data:
+            return None
+        data = cls.deserialize_row_key(row_key)
+        for column_key, column_value in row_data.items():
+            # remove column family
+            column_key = column_key.decode('utf-8')
+            key = column_key[column_key.find(':') + 1:]
+            data[key] = cls.deserialize_field(key, column_value)
+        return cls(**data)
+
+    @classmethod
+    def deserialize_row_key(cls, row_key):
+        data = {}
+        if isinstance(row_key, bytes):
+            row_key = row_key.decode('utf-8')
+
+        # val1:val2 => val1:val2: It is convenient to find a val every time find(':')
+        row_key = row_key + ':'
+        for key in cls.Meta.row_key:
+            index = row_key.find(':')
+            if index == -1:
+                break
+            data[key] = cls.deserialize_field(key, row_key[:index])
+            row_key = row_key[index + 1:]
+        return data
+
+    @classmethod
+    def deserialize_field(cls, key, value):
+        field = cls.get_field_hash()[key]
+        if field.reverse:
+            value = value[::-1]
+        if field.field_type in [IntegerField.field_type, TimestampField.field_type]:
+            return int(value)
+        return value
+
+
+class LegacyHBaseNewsFeed(LegacyHBaseModel):
+    user_id = IntegerField(reverse=True)
+    created_at = TimestampField()
+    tweet_id = IntegerField(column_family='cf')
+
+    class Meta:
+        table_name = 'twitter_newsfeeds'
+        row_key = ('user_id', 'created_at')
+
+
+def build_rows():
+    rows = []
+    for i in range(N):
+        newsfeed = HBaseNewsFeed(user_id=i % 1000 + 1, created_at=1640000000000000 + i, tweet_id=i + 1)
+        row_data = {
+            column_key.encode('utf-8'): column_value.encode('utf-8')
+            for column_key, column_value in HBaseNewsFeed.serialize_row_data(newsfeed.to_dict()).items()
+        }
+        rows.append((newsfeed.row_key, row_data))
+    return rows
+
+
+def benchmark(name, init_from_row, rows):
+    start = time.perf_counter()
+    for row_key, row_data in rows:
+        init_from_row(row_key, row_data)
+    print('{:<25} {:>12.0f} rows/sec'.format(name, len(rows) / (time.perf_counter() - start)))
+
+
+if __name__ == '__main__':
+    rows = build_rows()
+    benchmark(
+        'legacy init_from_row',
+        LegacyHBaseNewsFeed.init_from_row,
+        rows,
+    )
+    benchmark('init_from_row', HBaseNewsFeed.init_from_row, rows)
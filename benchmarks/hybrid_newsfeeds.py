@@ -0,0 +1,82 @@
+"""
+Compare the pure push newsfeed with the hybrid push / pull newsfeed, where the tweets of the
+authors who have more followers than the celebrity threshold are merged at read time
+ - write amplification: newsfeed rows (and redis list pushes) written per tweet,
+   for authors whose follower counts follow a power law
+ - read cost: time of NewsFeedService.merge_newsfeeds for one page and the redis round trips
+   of NewsFeedService.get_merged_newsfeeds, by the number of followed celebrities
+run in the project container: python -m benchmarks.hybrid_newsfeeds
+"""
+import os
+import random
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'twitter.settings')
+django.setup()
+
+from newsfeeds.models import HBaseNewsFeed
+from newsfeeds.services import NewsFeedService
+from utils.paginations import EndlessPagination
+
+N_AUTHORS = 100000
+THRESHOLDS = [None, 1000000, 100000, 10000]
+CELEBRITY_COUNTS = [0, 1, 5, 20, 50]
+N_READS = 1000
+
+
+def build_follower_counts():
+    random.seed(0)
+    return [int(random.paretovariate(1.2)) for _ in range(N_AUTHORS)]
+
+
+def benchmark_writes(follower_counts):
+    for threshold in THRESHOLDS:
+        rows = 0
+        for follower_count in follower_counts:
+            # the own newsfeed of the author is always written
+            rows += 1
+            if threshold is None or follower_count <= threshold:
+                rows += follower_count
+        print('{:<25} {:>10.1f} rows/tweet {:>10} max rows/tweet'.format(
+            'push only' if threshold is None else 'threshold {}'.format(threshold),
+            rows / len(follower_counts),
+            max(
+                count + 1 for count in follower_counts
+                if threshold is None or count <= threshold
+            ),
+        ))
+
+
+def build_source(size, now):
+    created_at = now
+    newsfeeds = []
+    for i in range(size):
+        created_at -= random.randint(1, 10000000)
+        newsfeeds.append(HBaseNewsFeed(user_id=1, created_at=created_at, tweet_id=created_at))
+    return newsfeeds
+
+
+def benchmark_reads():
+    # the first page, the window of get_cached_list_window
+    size = EndlessPagination.page_size + 1
+    now = int(time.time() * 1000000)
+    for celebrity_count in CELEBRITY_COUNTS:
+        sources = [build_source(size, now) for _ in range(celebrity_count + 1)]
+        start = time.perf_counter()
+        for _ in range(N_READS):
+            NewsFeedService.merge_newsfeeds(sources, size)
+        elapsed = time.perf_counter() - start
+        # newsfeeds list + following set + counts MGET + one tweets list per celebrity
+        round_trips = 3 + celebrity_count
+        print('{:<25} {:>10.1f} us/merge {:>10} redis round trips'.format(
+            '{} celebrities'.format(celebrity_count),
+            elapsed / N_READS * 1000000,
+            round_trips,
+        ))
+
+
+if __name__ == '__main__':
+    benchmark_writes(build_follower_counts())
+    benchmark_reads()
@@ -0,0 +1,57 @@
+"""
+Compare the size and the speed of the serializers used by the redis list caches
+run in the project container: python -m benchmarks.redis_serializers
+"""
+import os
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'twitter.settings')
+django.setup()
+
+from tweets.models import Tweet
+from utils.redis_serializers import DjangoModelSerializer, DjangoModelCompactSerializer
+from utils.time_helpers import utc_now
+
+N = 10000
+
+
+def build_tweets():
+    # instances are not saved, the serializers do not need the database
+    return [
+        Tweet(
+            id=i + 1,
+            user_id=i % 100 + 1,
+            content='benchmark tweet content {}'.format(i),
+            created_at=utc_now(),
+            likes_count=i % 50,
+            comments_count=i % 20,
+        )
+        for i in range(N)
+    ]
+
+
+def benchmark(serializer, tweets):
+    start = time.perf_counter()
+    serialized_list = [serializer.serialize(tweet) for tweet in tweets]
+    serialize_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for serialized_data in serialized_list:
+        serializer.deserialize(serialized_data)
+    deserialize_time = time.perf_counter() - start
+
+    total_bytes = sum(len(serialized_data.encode('utf-8')) for serialized_data in serialized_list)
+    print('{:<30} {:>10.1f} bytes/object {:>10.0f} serialize/s {:>10.0f} deserialize/s'.format(
+        serializer.__name__,
+        total_bytes / len(tweets),
+        len(tweets) / serialize_time,
+        len(tweets) / deserialize_time,
+    ))
+
+
+if __name__ == '__main__':
+    tweets = build_tweets()
+    for serializer in [DjangoModelSerializer, DjangoModelCompactSerializer]:
+        benchmark(serializer, tweets)
@@ -1,9 +1,23 @@
 from accounts.api.serializers import UserSerializerForComment
+from comments.constants import COMMENT_COUNT_ATTRS
 from comments.models import Comment
+from django.db import models
 from likes.services import LikeService
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from tweets.models import Tweet
+from utils.redis_helper import RedisHelper
+
+
+class CommentListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        comments = list(data.all() if isinstance(data, models.Manager) else data)
+        # load all the counters of this page through one redis round trip
+        RedisHelper.prefetch_counts(self.context, comments, COMMENT_COUNT_ATTRS)
+        # whether the request user liked the comments of this page, in one redis round trip
+        LikeService.prefetch_liked_object_ids(self.context, Comment, comments)
+        return super(CommentListSerializer, self).to_representation(comments)
 
 
 class CommentSerializer(serializers.ModelSerializer):
@@ -22,12 +36,13 @@ class CommentSerializer(serializers.ModelSerializer):
             'likes_count',
             'has_liked',
         )
+        list_serializer_class = CommentListSerializer
 
     def get_likes_count(self, obj):
-        return obj.like_set.count()
+        return RedisHelper.get_count_from_context(self.context, obj, 'likes_count')
 
     def get_has_liked(self, obj):
-        return LikeService.has_liked(self.context['request'].user, obj)
+        return LikeService.has_liked_from_context(self.context, obj)
 
 
 
@@ -65,6 +80,8 @@ class CommentSerializerForUpdate(serializers.ModelSerializer):
 
     def update(self, instance, validated_data):
         instance.content = validated_data['content']
-        instance.save()
+        # likes_count is only changed by the like listeners with F() updates,
+        # saving it from this instance could overwrite a concurrent like
+        instance.save(update_fields=['content', 'updated_at'])
         # The update method requires return of the modified instance as the return value
         return instance
\ No newline at end of file
@@ -1,7 +1,11 @@
 from rest_framework.test import APIClient
 from comments.models import Comment
+from comments.services import CommentService
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from testing.testcases import TestCase
+from utils.paginations import EndlessPagination
 
 COMMENT_URL = '/api/comments/'
 TWEET_LIST_API = '/api/tweets/'
@@ -113,24 +117,30 @@ class CommentApiTests(TestCase):
         response = self.anonymous_client.get(COMMENT_URL)
         self.assertEqual(response.status_code, 400)
 
+        # tweet_id must be an integer
+        response = self.anonymous_client.get(COMMENT_URL, {'tweet_id': 'abc'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['success'], False)
+
         # can visit with tweet_id
         # No comments at the beginning
         response = self.anonymous_client.get(COMMENT_URL, {
             'tweet_id': self.tweet.id,
         })
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(len(response.data['comments']), 0)
+        self.assertEqual(len(response.data['results']), 0)
 
-        # Comments are sorted in chronological order
+        # Comments are sorted newest first
         self.create_comment(self.wl, self.tweet, '1')
         self.create_comment(self.wl_hsu, self.tweet, '2')
         self.create_comment(self.wl_hsu, self.create_tweet(self.wl_hsu), '3')
         response = self.anonymous_client.get(COMMENT_URL, {
             'tweet_id': self.tweet.id,
         })
-        self.assertEqual(len(response.data['comments']), 2)
-        self.assertEqual(response.data['comments'][0]['content'], '1')
-        self.assertEqual(response.data['comments'][1]['content'], '2')
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(response.data['results'][0]['content'], '2')
+        self.assertEqual(response.data['results'][1]['content'], '1')
+        self.assertEqual(response.data['has_next_page'], False)
 
         # Provide user_id and tweet_id at the same time,
         # only tweet_id will take effect in the filter
@@ -138,7 +148,7 @@ class CommentApiTests(TestCase):
             'tweet_id': self.tweet.id,
             'user_id': self.wl.id,
         })
-        self.assertEqual(len(response.data['comments']), 2)
+        self.assertEqual(len(response.data['results']), 2)
 
     def test_comments_count(self):
         # test tweet detail api
@@ -197,4 +207,85 @@ class CommentApiTests(TestCase):
         response = self.wl_client.get(tweet_url)
         self.assertEqual(response.data['comments_count'], 2)
         self.tweet.refresh_from_db()
-        self.assertEqual(self.tweet.comments_count, 2)
\ No newline at end of file
+        self.assertEqual(self.tweet.comments_count, 2)
+
+    def test_comment_likes_count(self):
+        comments = [self.create_comment(self.wl, self.tweet) for _ in range(3)]
+        self.create_like(self.wl, comments[0])
+        self.create_like(self.wl_hsu, comments[0])
+        like = self.create_like(self.wl_hsu, comments[1])
+        comments[0].refresh_from_db()
+        self.assertEqual(comments[0].likes_count, 2)
+
+        url = TWEET_DETAIL_API.format(self.tweet.id)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.wl_client.get(url)
+        self.assertEqual(
+            [comment['likes_count'] for comment in response.data['comments']],
+            [0, 1, 2],
+        )
+        # the counters come from redis, there is no COUNT of likes per comment
+        count_queries = [query for query in queries if 'COUNT' in query['sql'] and 'likes_like' in query['sql']]
+        self.assertEqual(len(count_queries), 0)
+
+        # cancel updates the column and the cached counter
+        like.delete()
+        comments[1].refresh_from_db()
+        self.assertEqual(comments[1].likes_count, 0)
+        response = self.wl_client.get(COMMENT_URL, {'tweet_id': self.tweet.id})
+        self.assertEqual(response.data['results'][1]['likes_count'], 0)
+
+        # editing a comment keeps its likes_count
+        comment_url = '{}{}/'.format(COMMENT_URL, comments[0].id)
+        response = self.wl_client.put(comment_url, {'content': 'updated'})
+        self.assertEqual(response.status_code, 200)
+        comments[0].refresh_from_db()
+        self.assertEqual(comments[0].likes_count, 2)
+
+    def test_list_pagination(self):
+        page_size = EndlessPagination.page_size
+        comments = [
+            self.create_comment(self.wl, self.tweet, 'comment {}'.format(i))
+            for i in range(page_size + 5)
+        ]
+
+        # the first page comes from the cached newest comments
+        response = self.anonymous_client.get(COMMENT_URL, {'tweet_id': self.tweet.id})
+        self.assertEqual(response.data['has_next_page'], True)
+        self.assertEqual(len(response.data['results']), page_size)
+        self.assertEqual(response.data['results'][0]['id'], comments[-1].id)
+
+        # the next page goes to the database when it is older than the cached list
+        response = self.anonymous_client.get(COMMENT_URL, {
+            'tweet_id': self.tweet.id,
+            'created_at__lt': response.data['results'][-1]['created_at'],
+        })
+        self.assertEqual(response.data['has_next_page'], False)
+        self.assertEqual(
+            [comment['id'] for comment in response.data['results']],
+            [comment.id for comment in comments[4::-1]],
+        )
+
+        # tweet detail embeds the first page only
+        response = self.anonymous_client.get(TWEET_DETAIL_API.format(self.tweet.id))
+        self.assertEqual(len(response.data['comments']), page_size)
+        self.assertEqual(response.data['comments_count'], page_size + 5)
+
+    def test_cached_comments(self):
+        comment = self.create_comment(self.wl, self.tweet, 'first')
+        cached_comments = CommentService.get_cached_comments(self.tweet.id)
+        self.assertEqual([c.id for c in cached_comments], [comment.id])
+
+        # new comments are pushed to the cached list
+        new_comment = self.create_comment(self.wl_hsu, self.tweet, 'second')
+        cached_comments = CommentService.get_cached_comments(self.tweet.id)
+        self.assertEqual([c.id for c in cached_comments], [new_comment.id, comment.id])
+
+        # edits and deletions reload the cached list
+        comment_url = '{}{}/'.format(COMMENT_URL, comment.id)
+        self.wl_client.put(comment_url, {'content': 'updated'})
+        cached_comments = CommentService.get_cached_comments(self.tweet.id)
+        self.assertEqual(cached_comments[1].content, 'updated')
+        self.wl_hsu_client.delete('{}{}/'.format(COMMENT_URL, new_comment.id))
+        cached_comments = CommentService.get_cached_comments(self.tweet.id)
+        self.assertEqual([c.id for c in cached_comments], [comment.id])
@@ -4,6 +4,7 @@ from comments.api.serializers import (
     CommentSerializerForUpdate,
 )
 from comments.models import Comment
+from comments.services import CommentService
 from rest_framework import viewsets, status
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
@@ -12,6 +13,7 @@ from inbox.services import NotificationService
 from utils.permissions import IsObjectOwner
 from django.utils.decorators import method_decorator
 from ratelimit.decorators import ratelimit
+from utils.paginations import EndlessPagination
 
 
 class CommentViewSet(viewsets.GenericViewSet):
@@ -22,6 +24,7 @@ class CommentViewSet(viewsets.GenericViewSet):
     serializer_class = CommentSerializerForCreate
     queryset = Comment.objects.all()
     filterset_fields = ('tweet_id',)
+    pagination_class = EndlessPagination
 
     # POST /api/comments/ -> create
     # GET /api/comments/ -> list
@@ -42,17 +45,28 @@ class CommentViewSet(viewsets.GenericViewSet):
     @required_params(params=['tweet_id'])
     @method_decorator(ratelimit(key='user', rate='3/s', method='GET', block=True))
     def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        comments = self.filter_queryset(queryset).prefetch_related('user').order_by('created_at')
+        # newest first, the newest comments of the tweet are served from the cached list
+        # the filterset does not validate tweet_id any more, it is a part of the cache key
+        try:
+            tweet_id = int(request.query_params['tweet_id'])
+        except ValueError:
+            return Response({
+                'success': False,
+                'message': 'tweet_id should be an integer',
+            }, status=status.HTTP_400_BAD_REQUEST)
+        start, stop = self.paginator.get_cached_list_window(request)
+        cached_comments = CommentService.get_cached_comments(tweet_id, start, stop)
+        page = self.paginator.paginate_cached_list(cached_comments, request)
+        if page is None:
+            # older than the cached list, this query uses the <tweet, created_at> index
+            queryset = Comment.objects.filter(tweet_id=tweet_id).order_by('-created_at')
+            page = self.paginate_queryset(queryset)
         serializer = CommentSerializer(
-            comments,
+            page,
             context={'request': request},
             many=True,
         )
-        return Response(
-            {'comments': serializer.data},
-            status=status.HTTP_200_OK,
-        )
+        return self.get_paginated_response(serializer.data)
 
     @method_decorator(ratelimit(key='user', rate='3/s', method='POST', block=True))
     def create(self, request, *args, **kwargs):
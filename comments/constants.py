@@ -0,0 +1,2 @@
+# the redis counters of a comment, prefetched for a page of comments
+COMMENT_COUNT_ATTRS = ('likes_count',)
@@ -22,4 +22,19 @@ def decr_comments_count(sender, instance, **kwargs):
     # handle comment deletion
     Tweet.objects.filter(id=instance.tweet_id)\
         .update(comments_count=F('comments_count') - 1)
-    RedisHelper.decr_count(instance.tweet, 'comments_count')
\ No newline at end of file
+    RedisHelper.decr_count(instance.tweet, 'comments_count')
+
+
+def update_cached_comments(sender, instance, created, **kwargs):
+    from comments.services import CommentService
+
+    if created:
+        CommentService.push_comment_to_cache(instance)
+    else:
+        CommentService.invalidate_cached_comments(instance.tweet_id)
+
+
+def invalidate_cached_comments(sender, instance, **kwargs):
+    from comments.services import CommentService
+
+    CommentService.invalidate_cached_comments(instance.tweet_id)
@@ -0,0 +1,37 @@
+# Generated by Django 3.1.3 on 2022-10-18 00:00
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_likes_count(apps, schema_editor):
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    Comment = apps.get_model('comments', 'Comment')
+    Like = apps.get_model('likes', 'Like')
+    content_type = ContentType.objects.filter(app_label='comments', model='comment').first()
+    if content_type is None:
+        return
+    # one grouped query on the <content_type, object_id, created_at> index of likes
+    rows = Like.objects.filter(content_type=content_type)\
+        .values('object_id')\
+        .annotate(count=Count('id'))
+    for row in rows:
+        Comment.objects.filter(id=row['object_id']).update(likes_count=row['count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('likes', '0001_initial'),
+        ('comments', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='likes_count',
+            field=models.IntegerField(default=0, null=True),
+        ),
+        migrations.RunPython(backfill_likes_count, migrations.RunPython.noop),
+    ]
@@ -4,8 +4,13 @@ from django.db import models
 from likes.models import Like
 from tweets.models import Tweet
 from utils.memcached_helper import MemcachedHelper
-from comments.listeners import incr_comments_count, decr_comments_count
-from django.db.models.signals import post_save, pre_delete
+from comments.listeners import (
+    decr_comments_count,
+    incr_comments_count,
+    invalidate_cached_comments,
+    update_cached_comments,
+)
+from django.db.models.signals import post_delete, post_save, pre_delete
 
 
 class Comment(models.Model):
@@ -16,6 +21,7 @@ class Comment(models.Model):
     user = models.ForeignKey(User, null=True, on_delete=models.SET_NULL)
     tweet = models.ForeignKey(Tweet, null=True, on_delete=models.SET_NULL)
     content = models.TextField(max_length=140)
+    likes_count = models.IntegerField(default=0, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -44,4 +50,6 @@ class Comment(models.Model):
 
 
 post_save.connect(incr_comments_count, sender=Comment)
-pre_delete.connect(decr_comments_count, sender=Comment)
\ No newline at end of file
+pre_delete.connect(decr_comments_count, sender=Comment)
+post_save.connect(update_cached_comments, sender=Comment)
+post_delete.connect(invalidate_cached_comments, sender=Comment)
@@ -0,0 +1,52 @@
+from comments.models import Comment
+from comments.tasks import refresh_cached_comments_task
+from twitter.cache import TWEET_COMMENTS_PATTERN
+from utils.redis_helper import RedisHelper
+
+
+def lazy_load_comments(tweet_id):
+    def _lazy_load(limit):
+        # uses the <tweet, created_at> index
+        return Comment.objects.filter(tweet_id=tweet_id).order_by('-created_at')[:limit]
+    return _lazy_load
+
+
+class CommentService(object):
+
+    @classmethod
+    def get_serializer(cls):
+        return RedisHelper.get_serializer(TWEET_COMMENTS_PATTERN)
+
+    @classmethod
+    def get_cached_comments(cls, tweet_id, start=0, stop=-1):
+        # the newest REDIS_LIST_LENGTH_LIMIT comments of the tweet, newest first
+        key = TWEET_COMMENTS_PATTERN.format(tweet_id=tweet_id)
+        return RedisHelper.load_objects_through_cache(
+            key,
+            lazy_load_comments(tweet_id),
+            serializer=cls.get_serializer(),
+            start=start,
+            stop=stop,
+            refresh=lambda: refresh_cached_comments_task.delay(tweet_id),
+        )
+
+    @classmethod
+    def refresh_cached_comments(cls, tweet_id):
+        key = TWEET_COMMENTS_PATTERN.format(tweet_id=tweet_id)
+        RedisHelper.refresh_objects_in_cache(key, lazy_load_comments(tweet_id), cls.get_serializer())
+
+    @classmethod
+    def push_comment_to_cache(cls, comment):
+        key = TWEET_COMMENTS_PATTERN.format(tweet_id=comment.tweet_id)
+        RedisHelper.push_object(
+            key,
+            comment,
+            lazy_load_comments(comment.tweet_id),
+            serializer=cls.get_serializer(),
+        )
+
+    @classmethod
+    def invalidate_cached_comments(cls, tweet_id):
+        # edits and deletions are rare, the list is reloaded instead of being patched
+        key = TWEET_COMMENTS_PATTERN.format(tweet_id=tweet_id)
+        RedisHelper.invalidate_objects(key)
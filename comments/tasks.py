@@ -0,0 +1,9 @@
+from celery import shared_task
+from utils.time_constants import ONE_HOUR
+
+
+@shared_task(routing_key='default', time_limit=ONE_HOUR)
+def refresh_cached_comments_task(tweet_id):
+    # import is written in it to avoid circular dependencies
+    from comments.services import CommentService
+    CommentService.refresh_cached_comments(tweet_id)
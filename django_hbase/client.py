@@ -1,14 +1,74 @@
+from contextlib import contextmanager
 from django.conf import settings
+from thriftpy2.thrift import TException
 
 import happybase
+import socket
+import threading
 
 
 class HBaseClient:
-    conn = None
+    """
+    A happybase Connection is not thread-safe, so every operation checks out its own connection
+    from a ConnectionPool and returns it when done:
+        with HBaseClient.connection() as conn:
+            conn.table(...)
+    When the thrift transport is broken (e.g. a timeout), the pool refreshes the connection
+    before putting it back, so the next checkout reconnects automatically.
+    """
+    pool = None
+    lock = threading.Lock()
+    # nesting depth of the checkouts of every thread
+    local = threading.local()
+    metrics = {'in_use': 0, 'waits': 0, 'errors': 0}
 
     @classmethod
-    def get_connection(cls):
-        if cls.conn:
-            return cls.conn
-        cls.conn = happybase.Connection(settings.HBASE_HOST)
-        return cls.conn
\ No newline at end of file
+    def get_pool(cls):
+        if cls.pool:
+            return cls.pool
+        with cls.lock:
+            if cls.pool is None:
+                cls.pool = happybase.ConnectionPool(
+                    size=settings.HBASE_POOL_SIZE,
+                    host=settings.HBASE_HOST,
+                    timeout=settings.HBASE_CONNECTION_TIMEOUT,
+                )
+        return cls.pool
+
+    @classmethod
+    def incr_metric(cls, name, delta=1):
+        with cls.lock:
+            cls.metrics[name] += delta
+
+    @classmethod
+    def get_pool_metrics(cls):
+        with cls.lock:
+            return dict(cls.metrics, size=settings.HBASE_POOL_SIZE)
+
+    @classmethod
+    @contextmanager
+    def connection(cls):
+        pool = cls.get_pool()
+        # the pool gives the connection of the thread back to the nested checkouts
+        # (e.g. get_table inside rewrite_row_keys), only the outermost one is counted
+        depth = getattr(cls.local, 'depth', 0)
+        if depth == 0:
+            with cls.lock:
+                # in_use includes the checkouts waiting for a connection
+                if cls.metrics['in_use'] >= settings.HBASE_POOL_SIZE:
+                    cls.metrics['waits'] += 1
+                cls.metrics['in_use'] += 1
+        cls.local.depth = depth + 1
+        try:
+            # raises happybase.NoConnectionsAvailable if no connection is returned within the timeout
+            with pool.connection(timeout=settings.HBASE_POOL_TIMEOUT) as conn:
+                try:
+                    yield conn
+                except (TException, socket.error):
+                    if depth == 0:
+                        cls.incr_metric('errors')
+                    raise
+        finally:
+            cls.local.depth = depth
+            if depth == 0:
+                cls.incr_metric('in_use', -1)
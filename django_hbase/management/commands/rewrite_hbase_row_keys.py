@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+from django_hbase.models import HBaseModel
+
+
+class Command(BaseCommand):
+    help = 'Rewrite the rows of a HBaseModel table from Meta.dual_read_row_key_codec into Meta.row_key_codec'
+
+    def add_arguments(self, parser):
+        parser.add_argument('model_class_name', help='e.g. HBaseNewsFeed')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        for model_class in HBaseModel.__subclasses__():
+            if model_class.__name__ == options['model_class_name']:
+                break
+        else:
+            raise CommandError('HBaseModel {} not found'.format(options['model_class_name']))
+
+        rewritten = model_class.rewrite_row_keys(batch_size=options['batch_size'])
+        self.stdout.write('{} rows of {} rewritten'.format(rewritten, model_class.get_table_name()))
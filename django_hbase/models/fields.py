@@ -1,20 +1,75 @@
+import struct
+
+
 class HBaseField:
     field_type = None
+    # number of bytes in a binary row key, None means the field can not be used in a binary row key
+    binary_width = None
 
     def __init__(self, reverse=False, column_family=None):
         self.reverse = reverse
         self.column_family = column_family
 
+    def serialize(self, value):
+        value = str(value)
+        if self.reverse:
+            value = value[::-1]
+        return value
+
+    def deserialize(self, value):
+        # value can be str (row key) or bytes (column value)
+        if self.reverse:
+            value = value[::-1]
+        return value
+
+    def serialize_binary(self, value):
+        raise NotImplementedError
+
+    def deserialize_binary(self, value):
+        raise NotImplementedError
+
+
+class BinaryIntegerMixin:
+    # unsigned 64 bits big endian, keeps the numeric order in the lexicographical order of bytes
+    binary_width = 8
 
-class IntegerField(HBaseField):
+    def serialize_binary(self, value):
+        # the values of a scan range can come from the query params as str
+        value = struct.pack('>Q', int(value))
+        if self.reverse:
+            value = value[::-1]
+        return value
+
+    def deserialize_binary(self, value):
+        if self.reverse:
+            value = value[::-1]
+        return struct.unpack('>Q', value)[0]
+
+
+class IntegerField(BinaryIntegerMixin, HBaseField):
     field_type = 'int'
 
     def __init__(self, *args, **kwargs):
         super(IntegerField, self).__init__(*args, **kwargs)
 
+    def serialize(self, value):
+        # Because the collation is in lexicographical order, there may be a sort of 1 10 2
+        # The solution is to fix the number of bits of int to 16 bits (multiples of 8 are easier to use space),
+        # and fill in 0 for insufficient bits
+        value = str(value).rjust(16, '0')
+        if self.reverse:
+            value = value[::-1]
+        return value
 
-class TimestampField(HBaseField):
+    def deserialize(self, value):
+        return int(super(IntegerField, self).deserialize(value))
+
+
+class TimestampField(BinaryIntegerMixin, HBaseField):
     field_type = 'timestamp'
 
     def __init__(self, *args, **kwargs):
-        super(TimestampField, self).__init__( *args, **kwargs)
\ No newline at end of file
+        super(TimestampField, self).__init__( *args, **kwargs)
+
+    def deserialize(self, value):
+        return int(super(TimestampField, self).deserialize(value))
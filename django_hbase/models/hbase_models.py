@@ -1,48 +1,120 @@
+from contextlib import contextmanager
 from django.conf import settings
 from django_hbase.client import HBaseClient
-from django_hbase.models import HBaseField, IntegerField, TimestampField
+from django_hbase.models import HBaseField
 from django_hbase.models.exceptions import BadRowKeyError, EmptyColumnError
+from django_hbase.models.row_key_codecs import get_row_key_codec
 
 
-class HBaseModel:
+class HBaseModelBase(type):
+    """
+    Collect the field metadata once when the model class is created,
+    instead of scanning the class every time a row is serialized or deserialized:
+     - _field_hash: all fields in definition order
+     - _row_key_fields: (key, field) of the row key in Meta.row_key order
+     - _column_fields: (key, field, column_key) of the column fields
+     - _column_key_map: column_key in bytes => (key, field), to decode the rows returned by happybase
+     - _row_key_codec / _dual_read_codec: see Meta.row_key_codec and Meta.dual_read_row_key_codec,
+       they can be overridden by settings.HBASE_ROW_KEY_CODECS
+    The fields are removed from the class and the instances use __slots__ to store the values
+    """
+
+    def __new__(mcs, name, bases, attrs):
+        field_hash = {}
+        for base in bases:
+            field_hash.update(getattr(base, '_field_hash', {}))
+        own_fields = [
+            key
+            for key, value in attrs.items()
+            if isinstance(value, HBaseField)
+        ]
+        for key in own_fields:
+            field_hash[key] = attrs.pop(key)
+        attrs['__slots__'] = tuple(own_fields)
+        attrs['_field_hash'] = field_hash
+
+        cls = super(HBaseModelBase, mcs).__new__(mcs, name, bases, attrs)
+        cls._row_key_fields = tuple(
+            (key, field_hash[key])
+            for key in cls.Meta.row_key
+        )
+        cls._column_fields = tuple(
+            (key, field, '{}:{}'.format(field.column_family, key))
+            for key, field in field_hash.items()
+            if field.column_family
+        )
+        cls._column_key_map = {
+            column_key.encode('utf-8'): (key, field)
+            for key, field, column_key in cls._column_fields
+        }
+        # settings.HBASE_ROW_KEY_CODECS overrides the codec options of Meta by model name
+        codec_options = {
+            option: getattr(cls.Meta, option, default)
+            for option, default in [
+                ('row_key_codec', 'string'),
+                ('row_key_salt_buckets', 0),
+                ('dual_read_row_key_codec', None),
+            ]
+        }
+        codec_options.update(getattr(settings, 'HBASE_ROW_KEY_CODECS', {}).get(name, {}))
+        cls._row_key_codec = get_row_key_codec(
+            codec_options['row_key_codec'],
+            codec_options['row_key_salt_buckets'],
+        )
+        dual_read_codec = codec_options['dual_read_row_key_codec']
+        cls._dual_read_codec = get_row_key_codec(dual_read_codec) if dual_read_codec else None
+        return cls
+
+
+class HBaseModel(metaclass=HBaseModelBase):
 
     class Meta:
         table_name = None
         row_key = ()
+        # 'string': b"val1:val2", 'binary': fixed width big endian values, see row_key_codecs
+        row_key_codec = 'string'
+        # only for the binary codec, the number of salt buckets in front of the row key
+        row_key_salt_buckets = 0
+        # while the table is being rewritten from another codec (rewrite_row_keys),
+        # rows of both codecs are read, new rows are written with row_key_codec only.
+        # It doubles the round trips of get / delete and loads whole scans into memory,
+        # so it should only be set for the time of the rewrite
+        dual_read_row_key_codec = None
 
     @classmethod
+    @contextmanager
     def get_table(cls):
-        conn = HBaseClient.get_connection()
-        return conn.table(cls.get_table_name())
+        # the table can only be used inside the with block, the connection goes back to the pool after it
+        with HBaseClient.connection() as conn:
+            yield conn.table(cls.get_table_name())
 
     @property
     def row_key(self):
-        return self.serialize_row_key(self.__dict__)
+        return self.serialize_row_key(self.to_dict())
 
     @classmethod
     def get_field_hash(cls):
-        field_hash = {}
-        for field in cls.__dict__:
-            field_obj = getattr(cls, field)
-            if isinstance(field_obj, HBaseField):
-                field_hash[field] = field_obj
-        return field_hash
+        return cls._field_hash
 
     def __init__(self, **kwargs):
-        for key, field in self.get_field_hash().items():
-            value = kwargs.get(key)
-            setattr(self, key, value)
+        for key in self._field_hash:
+            setattr(self, key, kwargs.get(key))
+
+    def to_dict(self):
+        return {
+            key: getattr(self, key)
+            for key in self._field_hash
+        }
 
     @classmethod
     def init_from_row(cls, row_key, row_data):
         if not row_data:
             return None
         data = cls.deserialize_row_key(row_key)
+        column_key_map = cls._column_key_map
         for column_key, column_value in row_data.items():
-            # remove column family
-            column_key = column_key.decode('utf-8')
-            key = column_key[column_key.find(':') + 1:]
-            data[key] = cls.deserialize_field(key, column_value)
+            key, field = column_key_map[column_key]
+            data[key] = field.deserialize(column_value)
         return cls(**data)
 
     @classmethod
@@ -52,83 +124,48 @@ class HBaseModel:
         {key1: val1} => b"val1"
         {key1: val1, key2: val2} => b"val1:val2"
         {key1: val1, key2: val2, key3: val3} => b"val1:val2:val3"
+        with the binary codec the values are fixed width bytes without delimiter
         """
-        field_hash = cls.get_field_hash()
-        values = []
-        for key, field in field_hash.items():
-            if field.column_family:
-                continue
-            value = data.get(key)
-            if value is None:
-                if not is_prefix:
-                    raise BadRowKeyError(f"{key} is missing in row key")
-                break
-            value = cls.serialize_field(field, value)
-            if ':' in value:
-                raise BadRowKeyError(f"{key} should not contain ':' in value: {value}")
-            values.append(value)
-        return bytes(':'.join(values), encoding='utf-8')
+        return cls._row_key_codec.serialize(cls._row_key_fields, data, is_prefix)
+
+    @classmethod
+    def get_row_key_codec(cls, row_key):
+        if cls._dual_read_codec is not None and cls._dual_read_codec.owns(row_key):
+            return cls._dual_read_codec
+        return cls._row_key_codec
 
     @classmethod
     def deserialize_row_key(cls, row_key):
         """
-        "val1" => {'key1': val1, 'key2': None, 'key3': None}
-        "val1:val2" => {'key1': val1, 'key2': val2, 'key3': None}
+        "val1" => {'key1': val1}
+        "val1:val2" => {'key1': val1, 'key2': val2}
         "val1:val2:val3" => {'key1': val1, 'key2': val2, 'key3': val3}
         """
-        data = {}
-        if isinstance(row_key, bytes):
-            row_key = row_key.decode('utf-8')
-
-        # val1:val2 => val1:val2: It is convenient to find a val every time find(':')
-        row_key = row_key + ':'
-        for key in cls.Meta.row_key:
-            index = row_key.find(':')
-            if index == -1:
-                break
-            data[key] = cls.deserialize_field(key, row_key[:index])
-            row_key = row_key[index + 1:]
-        return data
+        if isinstance(row_key, str):
+            row_key = row_key.encode('utf-8')
+        codec = cls.get_row_key_codec(row_key)
+        return codec.deserialize(cls._row_key_fields, row_key)
 
     @classmethod
     def serialize_field(cls, field, value):
-        value = str(value)
-        if isinstance(field, IntegerField):
-            # Because the collation is in lexicographical order, there may be a sort of 1 10 2
-            # The solution is to fix the number of bits of int to 16 bits (multiples of 8 are easier to use space),
-            # and fill in 0 for insufficient bits
-            value = str(value)
-            while len(value) < 16:
-                value = '0' + value
-        if field.reverse:
-            value = value[::-1]
-        return value
+        return field.serialize(value)
 
     @classmethod
     def deserialize_field(cls, key, value):
-        field = cls.get_field_hash()[key]
-        if field.reverse:
-            value = value[::-1]
-        if field.field_type in [IntegerField.field_type, TimestampField.field_type]:
-            return int(value)
-        return value
+        return cls._field_hash[key].deserialize(value)
 
     @classmethod
     def serialize_row_data(cls, data):
         row_data = {}
-        field_hash = cls.get_field_hash()
-        for key, field in field_hash.items():
-            if not field.column_family:
-                continue
-            column_key = '{}:{}'.format(field.column_family, key)
+        for key, field, column_key in cls._column_fields:
             column_value = data.get(key)
             if column_value is None:
                 continue
-            row_data[column_key] = cls.serialize_field(field, column_value)
+            row_data[column_key] = field.serialize(column_value)
         return row_data
 
     def save(self, batch=None):
-        row_data = self.serialize_row_data(self.__dict__)
+        row_data = self.serialize_row_data(self.to_dict())
         # If row_data is empty, that is, no column key values need to be stored, hbase will not store it directly
         # the row_key, so we can raise an exception to alert the caller and avoid storing nulls
         if len(row_data) == 0:
@@ -136,16 +173,48 @@ class HBaseModel:
         if batch:
             batch.put(self.row_key, row_data)
         else:
-            table = self.get_table()
-            table.put(self.row_key, row_data)
+            with self.get_table() as table:
+                table.put(self.row_key, row_data)
 
     @classmethod
     def get(cls, **kwargs):
         row_key = cls.serialize_row_key(kwargs)
-        table = cls.get_table()
-        row = table.row(row_key)
+        with cls.get_table() as table:
+            row = table.row(row_key)
+            if not row and cls._dual_read_codec is not None:
+                # the row may not be rewritten yet
+                row_key = cls._dual_read_codec.serialize(cls._row_key_fields, kwargs)
+                row = table.row(row_key)
         return cls.init_from_row(row_key, row)
 
+    @classmethod
+    def batch_get(cls, batch_kwargs, columns=None):
+        """
+        Get the rows of many row keys in one thrift call
+        [{key1: val1, key2: val2}, ...] => [instance or None, ...] in the same order
+        columns: only load these column fields, the other column fields are None
+        """
+        row_keys = [cls.serialize_row_key(kwargs) for kwargs in batch_kwargs]
+        column_keys = cls.get_column_keys(columns) if columns else None
+        with cls.get_table() as table:
+            rows = dict(table.rows(row_keys, columns=column_keys))
+            if cls._dual_read_codec is not None:
+                # the rows that are not rewritten yet
+                legacy_row_keys = {
+                    row_key: cls._dual_read_codec.serialize(cls._row_key_fields, kwargs)
+                    for row_key, kwargs in zip(row_keys, batch_kwargs)
+                    if row_key not in rows
+                }
+                if legacy_row_keys:
+                    legacy_rows = dict(table.rows(list(legacy_row_keys.values()), columns=column_keys))
+                    for row_key, legacy_row_key in legacy_row_keys.items():
+                        if legacy_row_key in legacy_rows:
+                            rows[row_key] = legacy_rows[legacy_row_key]
+        return [
+            cls.init_from_row(row_key, rows.get(row_key))
+            for row_key in row_keys
+        ]
+
     @classmethod
     def create(cls, batch=None, **kwargs):
         instance = cls(**kwargs)
@@ -154,12 +223,12 @@ class HBaseModel:
 
     @classmethod
     def batch_create(cls, batch_data):
-        table = cls.get_table()
-        batch = table.batch()
         results = []
-        for data in batch_data:
-            results.append(cls.create(batch=batch, **data))
-        batch.send()
+        with cls.get_table() as table:
+            batch = table.batch()
+            for data in batch_data:
+                results.append(cls.create(batch=batch, **data))
+            batch.send()
         return results
 
     @classmethod
@@ -174,55 +243,168 @@ class HBaseModel:
     def drop_table(cls):
         if not settings.TESTING:
             raise Exception('You can not drop table outside of unit tests')
-        conn = HBaseClient.get_connection()
-        conn.delete_table(cls.get_table_name(), True)
+        with HBaseClient.connection() as conn:
+            conn.delete_table(cls.get_table_name(), True)
 
     @classmethod
     def create_table(cls):
         if not settings.TESTING:
             raise Exception('You can not create table outside of unit tests')
-        conn = HBaseClient.get_connection()
-        tables = [table.decode('utf-8') for table in conn.tables()]
-        if cls.get_table_name() in tables:
-            return
-        column_families = {
-            field.column_family: dict()
-            for key, field in cls.get_field_hash().items()
-            if field.column_family is not None
-        }
-        conn.create_table(cls.get_table_name(), column_families)
+        with HBaseClient.connection() as conn:
+            tables = [table.decode('utf-8') for table in conn.tables()]
+            if cls.get_table_name() in tables:
+                return
+            column_families = {
+                field.column_family: dict()
+                for key, field, column_key in cls._column_fields
+            }
+            conn.create_table(cls.get_table_name(), column_families)
 
 
     @classmethod
-    def serialize_row_key_from_tuple(cls, row_key_tuple):
+    def serialize_row_key_from_tuple(cls, row_key_tuple, codec=None):
         if row_key_tuple is None:
             return None
         data = {
             key: value
             for key, value in zip(cls.Meta.row_key, row_key_tuple)
         }
-        return cls.serialize_row_key(data, is_prefix=True)
+        if codec is None:
+            return cls.serialize_row_key(data, is_prefix=True)
+        return codec.serialize(cls._row_key_fields, data, is_prefix=True)
 
     @classmethod
-    def filter(cls, start=None, stop=None, prefix=None, limit=None, reverse=False):
-        # serialize tuple to str
-        row_start = cls.serialize_row_key_from_tuple(start)
-        row_stop = cls.serialize_row_key_from_tuple(stop)
-        row_prefix = cls.serialize_row_key_from_tuple(prefix)
+    def get_column_keys(cls, keys):
+        field_hash = cls._field_hash
+        return [
+            '{}:{}'.format(field_hash[key].column_family, key)
+            for key in keys
+        ]
 
-        # scan table
-        table = cls.get_table()
-        rows = table.scan(row_start, row_stop, row_prefix, limit=limit, reverse=reverse)
+    @classmethod
+    def scan(
+        cls,
+        codec,
+        start=None,
+        stop=None,
+        prefix=None,
+        limit=None,
+        reverse=False,
+        batch_size=1000,
+        columns=None,
+        keys_only=False,
+    ):
+        # serialize tuple to bytes
+        row_start = cls.serialize_row_key_from_tuple(start, codec)
+        row_stop = cls.serialize_row_key_from_tuple(stop, codec)
+        row_prefix = cls.serialize_row_key_from_tuple(prefix, codec)
+        # only the row keys are returned by the region servers, the column values are dropped
+        scan_filter = b'FirstKeyOnlyFilter() AND KeyOnlyFilter()' if keys_only else None
+        column_keys = cls.get_column_keys(columns) if columns else None
 
-        # deserialize to instance list
-        results = []
+        # scan table, happybase fetches batch_size rows per thrift call,
+        # the connection goes back to the pool when the generator is exhausted or closed
+        with cls.get_table() as table:
+            yield from table.scan(
+                row_start,
+                row_stop,
+                row_prefix,
+                columns=column_keys,
+                filter=scan_filter,
+                batch_size=batch_size,
+                limit=limit,
+                reverse=reverse,
+            )
+
+    @classmethod
+    def iter_filter(
+        cls,
+        start=None,
+        stop=None,
+        prefix=None,
+        limit=None,
+        reverse=False,
+        batch_size=1000,
+        columns=None,
+        keys_only=False,
+    ):
+        """
+        Generator version of filter, the rows are deserialized one by one while scanning,
+        so that scanning a large range does not load it into memory at once.
+        columns: only load these column fields, the other column fields are None
+        keys_only: yield the row key dicts {key1: val1, key2: val2} instead of instances
+        """
+        if cls._dual_read_codec is not None:
+            # merging the rows of two codecs needs all of them, see filter
+            for instance in cls.filter(start, stop, prefix, limit, reverse, columns=columns):
+                if keys_only:
+                    yield {key: getattr(instance, key) for key in cls.Meta.row_key}
+                else:
+                    yield instance
+            return
+
+        rows = cls.scan(
+            cls._row_key_codec,
+            start,
+            stop,
+            prefix,
+            limit,
+            reverse,
+            batch_size=batch_size,
+            columns=columns,
+            keys_only=keys_only,
+        )
         for row_key, row_data in rows:
-            instance = cls.init_from_row(row_key, row_data)
-            results.append(instance)
-        return results
+            if keys_only:
+                yield cls.deserialize_row_key(row_key)
+            else:
+                yield cls.init_from_row(row_key, row_data)
+
+    @classmethod
+    def filter(cls, start=None, stop=None, prefix=None, limit=None, reverse=False, columns=None):
+        if cls._dual_read_codec is None:
+            return list(cls.iter_filter(start, stop, prefix, limit, reverse, columns=columns))
+
+        # the table is being rewritten, scan the rows of both codecs and merge them
+        # in the order of the new row keys, a row found by both scans is kept once
+        instances = {}
+        for codec in [cls._row_key_codec, cls._dual_read_codec]:
+            rows = cls.scan(codec, start, stop, prefix, limit, reverse, columns=columns)
+            for row_key, row_data in rows:
+                instance = cls.init_from_row(row_key, row_data)
+                instances.setdefault(instance.row_key, instance)
+        results = [
+            instances[row_key]
+            for row_key in sorted(instances, reverse=reverse)
+        ]
+        return results[:limit] if limit else results
 
     @classmethod
     def delete(cls, **kwargs):
         row_key = cls.serialize_row_key(kwargs)
-        table = cls.get_table()
-        return table.delete(row_key)
\ No newline at end of file
+        with cls.get_table() as table:
+            if cls._dual_read_codec is not None:
+                table.delete(cls._dual_read_codec.serialize(cls._row_key_fields, kwargs))
+            return table.delete(row_key)
+
+    @classmethod
+    def rewrite_row_keys(cls, batch_size=1000):
+        """
+        Rewrite the rows stored with Meta.dual_read_row_key_codec into Meta.row_key_codec.
+        Reads keep working during the rewrite because both codecs are read, so it can run online.
+        Remove dual_read_row_key_codec from Meta after it is done.
+        """
+        if cls._dual_read_codec is None:
+            raise BadRowKeyError(f'{cls.__name__} has no dual_read_row_key_codec to rewrite from')
+        rewritten = 0
+        with cls.get_table() as table:
+            batch = table.batch(batch_size=batch_size)
+            for row_key, row_data in table.scan(batch_size=batch_size):
+                if not cls._dual_read_codec.owns(row_key):
+                    continue
+                instance = cls.init_from_row(row_key, row_data)
+                batch.put(instance.row_key, row_data)
+                batch.delete(row_key)
+                rewritten += 1
+            batch.send()
+        return rewritten
@@ -0,0 +1,97 @@
+from django_hbase.models.exceptions import BadRowKeyError
+
+
+class StringRowKeyCodec:
+    """
+    The row key values are joined by ':'
+    {key1: val1, key2: val2, key3: val3} => b"val1:val2:val3"
+    """
+    name = 'string'
+
+    def serialize(self, row_key_fields, data, is_prefix=False):
+        values = []
+        for key, field in row_key_fields:
+            value = data.get(key)
+            if value is None:
+                if not is_prefix:
+                    raise BadRowKeyError(f"{key} is missing in row key")
+                break
+            value = field.serialize(value)
+            if ':' in value:
+                raise BadRowKeyError(f"{key} should not contain ':' in value: {value}")
+            values.append(value)
+        return bytes(':'.join(values), encoding='utf-8')
+
+    def deserialize(self, row_key_fields, row_key):
+        if isinstance(row_key, bytes):
+            row_key = row_key.decode('utf-8')
+        # zip stops at the shorter one, so a prefix row key only fills the first keys
+        return {
+            key: field.deserialize(value)
+            for (key, field), value in zip(row_key_fields, row_key.split(':'))
+        }
+
+    def owns(self, row_key):
+        # string row keys start with a digit
+        return row_key[:1] >= b'0'
+
+
+class BinaryRowKeyCodec:
+    """
+    1 leading byte followed by the fixed width big endian value of every row key field
+    {key1: val1, key2: val2} => b"\\x00" + 8 bytes of val1 + 8 bytes of val2
+    There is no delimiter, every value is found by its offset. Big endian keeps the numeric order
+    of the values, reverse=True fields reverse the bytes to spread the rows across the regions.
+    The leading byte is the salt bucket (first row key value % salt_buckets) when salt_buckets is set,
+    otherwise it is 0. It is always smaller than b"0", so binary row keys can not be mistaken
+    for string row keys when a table is being rewritten from one codec to the other.
+    """
+    name = 'binary'
+    max_salt_buckets = 32
+
+    def __init__(self, salt_buckets=0):
+        if salt_buckets > self.max_salt_buckets:
+            raise BadRowKeyError(f'salt_buckets should not be larger than {self.max_salt_buckets}')
+        self.salt_buckets = salt_buckets
+
+    def get_salt(self, value):
+        if not self.salt_buckets:
+            return b'\x00'
+        return bytes([int(value) % self.salt_buckets])
+
+    def serialize(self, row_key_fields, data, is_prefix=False):
+        values = []
+        for key, field in row_key_fields:
+            value = data.get(key)
+            if value is None:
+                if not is_prefix:
+                    raise BadRowKeyError(f"{key} is missing in row key")
+                break
+            if field.binary_width is None:
+                raise BadRowKeyError(f"{key} can not be serialized into a binary row key")
+            if not values:
+                values.append(self.get_salt(value))
+            values.append(field.serialize_binary(value))
+        return b''.join(values)
+
+    def deserialize(self, row_key_fields, row_key):
+        data = {}
+        offset = 1
+        for key, field in row_key_fields:
+            value = row_key[offset: offset + field.binary_width]
+            if len(value) < field.binary_width:
+                break
+            data[key] = field.deserialize_binary(value)
+            offset += field.binary_width
+        return data
+
+    def owns(self, row_key):
+        return row_key[:1] < b'0'
+
+
+def get_row_key_codec(name, salt_buckets=0):
+    if name == StringRowKeyCodec.name:
+        return StringRowKeyCodec()
+    if name == BinaryRowKeyCodec.name:
+        return BinaryRowKeyCodec(salt_buckets)
+    raise BadRowKeyError(f'Unknown row key codec {name}')
@@ -1,9 +1,29 @@
 from accounts.api.serializers import UserSerializerForFriendship
-from accounts.services import UserService
+from django.contrib.auth.models import User
 from friendships.models import Friendship
 from friendships.services import FriendshipService
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
+from utils.memcached_helper import MemcachedHelper
+
+
+class FriendshipListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        friendships = list(data)
+        user_ids = [self.child.get_user_id(friendship) for friendship in friendships]
+        # load all the users of this page through one memcached round trip
+        users = MemcachedHelper.prefetch_objects(self.context, User, user_ids)
+        # the friendships of the users that do not exist anymore are skipped
+        friendships = [friendship for friendship, user in zip(friendships, users) if user is not None]
+        user_ids = [user.id for user in users if user is not None]
+        # check all the users of this page against the following set through one redis round trip
+        if not self.context['request'].user.is_anonymous:
+            self.context['followed_user_ids'] = FriendshipService.get_followed_user_ids(
+                self.context['request'].user.id,
+                user_ids,
+            )
+        return super(FriendshipListSerializer, self).to_representation(friendships)
 
 
 class BaseFriendshipSerializer(serializers.Serializer):
@@ -11,6 +31,9 @@ class BaseFriendshipSerializer(serializers.Serializer):
     created_at = serializers.SerializerMethodField()
     has_followed = serializers.SerializerMethodField()
 
+    class Meta:
+        list_serializer_class = FriendshipListSerializer
+
     def update(self, instance, validated_data):
         pass
 
@@ -20,22 +43,27 @@ class BaseFriendshipSerializer(serializers.Serializer):
     def get_user_id(self, obj):
         raise NotImplementedError
 
-    def _get_following_user_id_set(self):
-        if self.context['request'].user.is_anonymous:
-            return {}
-        if hasattr(self, '_cached_following_user_id_set'):
-            return self._cached_following_user_id_set
-        user_id_set = FriendshipService.get_following_user_id_set(
-            self.context['request'].user.id,
-        )
-        setattr(self, '_cached_following_user_id_set', user_id_set)
-        return user_id_set
-
     def get_has_followed(self, obj):
-        return self.get_user_id(obj) in self._get_following_user_id_set()
+        if self.context['request'].user.is_anonymous:
+            return False
+        user_id = self.get_user_id(obj)
+        # prefetched by FriendshipListSerializer for a page
+        followed_user_ids = self.context.get('followed_user_ids')
+        if followed_user_ids is None:
+            followed_user_ids = FriendshipService.get_followed_user_ids(
+                self.context['request'].user.id,
+                [user_id],
+            )
+        return user_id in followed_user_ids
 
     def get_user(self, obj):
-        user = UserService.get_user_by_id(self.get_user_id(obj))
+        user = MemcachedHelper.get_object_from_context(
+            self.context,
+            User,
+            self.get_user_id(obj),
+        )
+        if user is None:
+            return None
         return UserSerializerForFriendship(user).data
 
     def get_created_at(self, obj):
@@ -0,0 +1 @@
+RECONCILE_BATCH_SIZE = 1000
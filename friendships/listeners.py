@@ -1,4 +1,10 @@
-def invalidate_following_cache(sender, instance, **kwargs):
+def friendship_created(sender, instance, created, **kwargs):
     # import Write it in the function to avoid circular dependencies
     from friendships.services import FriendshipService
-    FriendshipService.invalidate_following_cache(instance.from_user_id)
\ No newline at end of file
+    if created:
+        FriendshipService.handle_follow(instance.from_user_id, instance.to_user_id)
+
+
+def friendship_deleted(sender, instance, **kwargs):
+    from friendships.services import FriendshipService
+    FriendshipService.handle_unfollow(instance.from_user_id, instance.to_user_id)
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from friendships.models import HBaseFollowing, HBaseFollowingIndex
+
+
+class Command(BaseCommand):
+    help = 'Fill twitter_following_index with the existing rows of twitter_followings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        count = 0
+        with HBaseFollowingIndex.get_table() as table:
+            # the batch is sent every batch_size puts
+            batch = table.batch(batch_size=batch_size)
+            for following in HBaseFollowing.iter_filter(batch_size=batch_size):
+                # followings are scanned in the order of created_at, so a duplicated follow
+                # keeps the latest created_at, the same as FriendshipService.follow
+                HBaseFollowingIndex.create(
+                    batch=batch,
+                    from_user_id=following.from_user_id,
+                    to_user_id=following.to_user_id,
+                    created_at=following.created_at,
+                )
+                count += 1
+            batch.send()
+        self.stdout.write('{} followings indexed'.format(count))
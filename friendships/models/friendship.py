@@ -1,7 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save, pre_delete
-from friendships.listeners import invalidate_following_cache
+from django.db.models.signals import post_save, post_delete
+from friendships.listeners import friendship_created, friendship_deleted
 from utils.memcached_helper import MemcachedHelper
 
 
@@ -41,6 +41,6 @@ class Friendship(models.Model):
         return MemcachedHelper.get_object_through_cache(User, self.to_user_id)
 
 
-# hook up with listeners to invalidate cache
-pre_delete.connect(invalidate_following_cache, sender=Friendship)
-post_save.connect(invalidate_following_cache, sender=Friendship)
\ No newline at end of file
+# hook up with listeners to update the cached following set and the counts
+post_save.connect(friendship_created, sender=Friendship)
+post_delete.connect(friendship_deleted, sender=Friendship)
\ No newline at end of file
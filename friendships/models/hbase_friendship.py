@@ -36,4 +36,24 @@ class HBaseFollower(models.HBaseModel):
 
     class Meta:
         row_key = ('to_user_id', 'created_at')
-        table_name = 'twitter_followers'
\ No newline at end of file
+        table_name = 'twitter_followers'
+
+
+class HBaseFollowingIndex(models.HBaseModel):
+    """
+    Store the follow time of from_user_id -> to_user_id, row_key is from_user_id + to_user_id
+    support query：
+     - Whether A has followed B, with a single row get instead of scanning all followings of A
+     - When A followed B, to locate the rows of HBaseFollowing and HBaseFollower
+    It is maintained by FriendshipService.follow / unfollow,
+    existing data is filled by python manage.py backfill_following_index
+    """
+    # row key
+    from_user_id = models.IntegerField(reverse=True)
+    to_user_id = models.IntegerField()
+    # column key
+    created_at = models.TimestampField(column_family='cf')
+
+    class Meta:
+        table_name = 'twitter_following_index'
+        row_key = ('from_user_id', 'to_user_id')
@@ -1,49 +1,111 @@
-from django.conf import settings
-from django.core.cache import caches
+from accounts.models import UserProfile
+from accounts.services import UserService
+from django.db.models import F
 from gatekeeper.models import GateKeeper
-from friendships.models import HBaseFollowing, HBaseFollower, Friendship
-from twitter.cache import FOLLOWINGS_PATTERN
+from friendships.models import HBaseFollowing, HBaseFollower, HBaseFollowingIndex, Friendship
+from twitter.cache import (
+    USER_FOLLOWINGS_PATTERN,
+    USER_FOLLOWINGS_COUNT_PATTERN,
+    USER_FOLLOWERS_COUNT_PATTERN,
+)
+from utils.redis_client import RedisClient
+from utils.redis_helper import RedisHelper
 
 import time
 
-cache = caches['testing'] if settings.TESTING else caches['default']
-
 
 class FriendshipService(object):
 
     @classmethod
-    def get_follower_ids(cls, to_user_id):
+    def get_follower_id_batches(cls, to_user_id, batch_size):
+        """
+        Yield the follower ids of to_user_id in lists of at most batch_size ids.
+        The followers are streamed from the database, only one batch is kept in memory
+        """
         if not GateKeeper.is_switch_on('switch_friendship_to_hbase'):
-            friendships = Friendship.objects.filter(to_user_id=to_user_id)
+            follower_ids = Friendship.objects.filter(
+                to_user_id=to_user_id,
+            ).values_list('from_user_id', flat=True).iterator(chunk_size=batch_size)
         else:
-            friendships = HBaseFollower.filter(prefix=(to_user_id, None))
-        return [friendship.from_user_id for friendship in friendships]
+            followers = HBaseFollower.iter_filter(
+                prefix=(to_user_id, None),
+                batch_size=batch_size,
+                columns=['from_user_id'],
+            )
+            follower_ids = (follower.from_user_id for follower in followers)
+
+        batch_ids = []
+        for follower_id in follower_ids:
+            batch_ids.append(follower_id)
+            if len(batch_ids) == batch_size:
+                yield batch_ids
+                batch_ids = []
+        if batch_ids:
+            yield batch_ids
 
     @classmethod
-    def get_following_user_id_set(cls, from_user_id):
-        # <TODO> cache in redis set
+    def load_following_user_ids(cls, from_user_id):
         if not GateKeeper.is_switch_on('switch_friendship_to_hbase'):
-            friendships = Friendship.objects.filter(from_user_id=from_user_id)
-        else:
-            friendships = HBaseFollowing.filter(prefix=(from_user_id, None))
-        user_id_set = set([
-            fs.to_user_id
-            for fs in friendships
-        ])
-        return user_id_set
+            return Friendship.objects.filter(
+                from_user_id=from_user_id,
+            ).values_list('to_user_id', flat=True)
+        followings = HBaseFollowing.filter(prefix=(from_user_id, None), columns=['to_user_id'])
+        return [following.to_user_id for following in followings]
+
+    @classmethod
+    def get_following_user_id_set(cls, from_user_id):
+        # the followings are cached in a redis set, which is updated by follow / unfollow
+        key = USER_FOLLOWINGS_PATTERN.format(user_id=from_user_id)
+        return RedisHelper.load_id_set_through_cache(
+            key,
+            lambda: cls.load_following_user_ids(from_user_id),
+        )
+
+    @classmethod
+    def get_followed_user_ids(cls, from_user_id, to_user_ids):
+        # check a page of users against the following set in one redis round trip
+        key = USER_FOLLOWINGS_PATTERN.format(user_id=from_user_id)
+        return RedisHelper.get_ids_in_set(
+            key,
+            to_user_ids,
+            lambda: cls.load_following_user_ids(from_user_id),
+        )
+
+    @classmethod
+    def add_following_to_cache(cls, from_user_id, to_user_id):
+        key = USER_FOLLOWINGS_PATTERN.format(user_id=from_user_id)
+        RedisHelper.add_id_to_set(key, to_user_id)
+
+    @classmethod
+    def remove_following_from_cache(cls, from_user_id, to_user_id):
+        key = USER_FOLLOWINGS_PATTERN.format(user_id=from_user_id)
+        RedisHelper.remove_id_from_set(key, to_user_id)
+
+    @classmethod
+    def handle_follow(cls, from_user_id, to_user_id):
+        # import is written in it to avoid circular dependencies
+        from newsfeeds.services import NewsFeedService
+        cls.add_following_to_cache(from_user_id, to_user_id)
+        cls.update_friendship_counts(from_user_id, to_user_id, 1)
+        NewsFeedService.handle_follow(from_user_id, to_user_id)
+
+    @classmethod
+    def handle_unfollow(cls, from_user_id, to_user_id):
+        from newsfeeds.services import NewsFeedService
+        cls.remove_following_from_cache(from_user_id, to_user_id)
+        cls.update_friendship_counts(from_user_id, to_user_id, -1)
+        NewsFeedService.handle_unfollow(from_user_id, to_user_id)
 
     @classmethod
     def invalidate_following_cache(cls, from_user_id):
-        key = FOLLOWINGS_PATTERN.format(user_id=from_user_id)
-        cache.delete(key)
+        RedisHelper.invalidate_id_sets([USER_FOLLOWINGS_PATTERN.format(user_id=from_user_id)])
 
     @classmethod
     def get_follow_instance(cls, from_user_id, to_user_id):
-        followings = HBaseFollowing.filter(prefix=(from_user_id, None))
-        for follow in followings:
-            if follow.to_user_id == to_user_id:
-                return follow
-        return None
+        index = HBaseFollowingIndex.get(from_user_id=from_user_id, to_user_id=to_user_id)
+        if index is None:
+            return None
+        return HBaseFollowing.get(from_user_id=from_user_id, created_at=index.created_at)
 
     @classmethod
     def has_followed(cls, from_user_id, to_user_id):
@@ -56,8 +118,8 @@ class FriendshipService(object):
                 to_user_id=to_user_id,
             ).exists()
 
-        instance = cls.get_follow_instance(from_user_id, to_user_id)
-        return instance is not None
+        index = HBaseFollowingIndex.get(from_user_id=from_user_id, to_user_id=to_user_id)
+        return index is not None
 
     @classmethod
     def follow(cls, from_user_id, to_user_id):
@@ -65,7 +127,7 @@ class FriendshipService(object):
             return None
 
         if not GateKeeper.is_switch_on('switch_friendship_to_hbase'):
-            # create data in mysql
+            # create data in mysql, the following set and the counts are updated by the post_save listener
             return Friendship.objects.create(
                 from_user_id=from_user_id,
                 to_user_id=to_user_id,
@@ -78,11 +140,18 @@ class FriendshipService(object):
             to_user_id=to_user_id,
             created_at=now,
         )
-        return HBaseFollowing.create(
+        HBaseFollowingIndex.create(
             from_user_id=from_user_id,
             to_user_id=to_user_id,
             created_at=now,
         )
+        following = HBaseFollowing.create(
+            from_user_id=from_user_id,
+            to_user_id=to_user_id,
+            created_at=now,
+        )
+        cls.handle_follow(from_user_id, to_user_id)
+        return following
 
     @classmethod
     def unfollow(cls, from_user_id, to_user_id):
@@ -99,23 +168,146 @@ class FriendshipService(object):
             # then when a certain data of B is deleted, The association in A is also removed.
             # So CASCADE is very dangerous, we generally better not use it, but replace it with on_delete=models.
             # SET_NULL, which can at least avoid the domino effect caused by accidental deletion.
+            # The following set and the counts are updated by the post_delete listener.
             deleted, _ = Friendship.objects.filter(
                 from_user_id=from_user_id,
                 to_user_id=to_user_id,
             ).delete()
             return deleted
 
-        instance = cls.get_follow_instance(from_user_id, to_user_id)
-        if instance is None:
+        index = HBaseFollowingIndex.get(from_user_id=from_user_id, to_user_id=to_user_id)
+        if index is None:
             return 0
 
-        HBaseFollowing.delete(from_user_id=from_user_id, created_at=instance.created_at)
-        HBaseFollower.delete(to_user_id=to_user_id, created_at=instance.created_at)
+        HBaseFollowing.delete(from_user_id=from_user_id, created_at=index.created_at)
+        HBaseFollower.delete(to_user_id=to_user_id, created_at=index.created_at)
+        HBaseFollowingIndex.delete(from_user_id=from_user_id, to_user_id=to_user_id)
+        cls.handle_unfollow(from_user_id, to_user_id)
         return 1
 
+    @classmethod
+    def _incr_profile_count(cls, user_id, attr, delta):
+        # we cannot use profile.followings_count += 1; profile.save(), it is not an atomic operation
+        updated = UserProfile.objects.filter(user_id=user_id).update(**{attr: F(attr) + delta})
+        if not updated:
+            # the profile is created lazily, it may not exist yet
+            UserProfile.objects.get_or_create(user_id=user_id)
+            UserProfile.objects.filter(user_id=user_id).update(**{attr: F(attr) + delta})
+
+    @classmethod
+    def update_friendship_counts(cls, from_user_id, to_user_id, delta):
+        cls._incr_profile_count(from_user_id, 'followings_count', delta)
+        cls._incr_profile_count(to_user_id, 'followers_count', delta)
+
+        conn = RedisClient.get_connection()
+        for key in [
+            USER_FOLLOWINGS_COUNT_PATTERN.format(user_id=from_user_id),
+            USER_FOLLOWERS_COUNT_PATTERN.format(user_id=to_user_id),
+        ]:
+            # only update the cached counts, a missing count is loaded from the profile on the next read
+            if conn.exists(key):
+                conn.incrby(key, delta)
+
+    @classmethod
+    def get_friendship_counts(cls, user_ids):
+        """
+        Return {user_id: {'followings_count': x, 'followers_count': y}} for a page of users.
+        The cached counts are read by one MGET, the missing ones are loaded by one query
+        of the profiles and cached in one pipeline.
+        """
+        if not user_ids:
+            return {}
+        conn = RedisClient.get_connection()
+        keys = []
+        for user_id in user_ids:
+            keys.append(USER_FOLLOWINGS_COUNT_PATTERN.format(user_id=user_id))
+            keys.append(USER_FOLLOWERS_COUNT_PATTERN.format(user_id=user_id))
+        values = conn.mget(keys)
+
+        counts = {}
+        missing_user_ids = []
+        for index, user_id in enumerate(user_ids):
+            followings_count, followers_count = values[index * 2], values[index * 2 + 1]
+            if followings_count is None or followers_count is None:
+                missing_user_ids.append(user_id)
+                continue
+            counts[user_id] = {
+                'followings_count': int(followings_count),
+                'followers_count': int(followers_count),
+            }
+        if not missing_user_ids:
+            return counts
+
+        # users without a profile have no friendships yet
+        missing_counts = {
+            user_id: {'followings_count': 0, 'followers_count': 0}
+            for user_id in missing_user_ids
+        }
+        profiles = UserProfile.objects.filter(user_id__in=missing_user_ids).values_list(
+            'user_id', 'followings_count', 'followers_count',
+        )
+        for user_id, followings_count, followers_count in profiles:
+            missing_counts[user_id] = {
+                'followings_count': followings_count or 0,
+                'followers_count': followers_count or 0,
+            }
+
+        pipeline = conn.pipeline(transaction=False)
+        for user_id, user_counts in missing_counts.items():
+            # nx: do not overwrite the count loaded and increased by someone else meanwhile
+            pipeline.set(
+                USER_FOLLOWINGS_COUNT_PATTERN.format(user_id=user_id),
+                user_counts['followings_count'],
+                ex=RedisHelper.get_expire_time(),
+                nx=True,
+            )
+            pipeline.set(
+                USER_FOLLOWERS_COUNT_PATTERN.format(user_id=user_id),
+                user_counts['followers_count'],
+                ex=RedisHelper.get_expire_time(),
+                nx=True,
+            )
+        pipeline.execute()
+        counts.update(missing_counts)
+        return counts
+
     @classmethod
     def get_following_count(cls, from_user_id):
+        return cls.get_friendship_counts([from_user_id])[from_user_id]['followings_count']
+
+    @classmethod
+    def get_follower_count(cls, to_user_id):
+        return cls.get_friendship_counts([to_user_id])[to_user_id]['followers_count']
+
+    @classmethod
+    def count_friendships(cls, user_id):
+        # count the social graph itself, it is slow for large accounts and only used to reconcile the counts
         if not GateKeeper.is_switch_on('switch_friendship_to_hbase'):
-            return Friendship.objects.filter(from_user_id=from_user_id).count()
-        followings = HBaseFollowing.filter(prefix=(from_user_id, None))
-        return len(followings)
\ No newline at end of file
+            followings_count = Friendship.objects.filter(from_user_id=user_id).count()
+            followers_count = Friendship.objects.filter(to_user_id=user_id).count()
+        else:
+            followings = HBaseFollowing.iter_filter(prefix=(user_id, None), keys_only=True)
+            followings_count = sum(1 for _ in followings)
+            followers = HBaseFollower.iter_filter(prefix=(user_id, None), keys_only=True)
+            followers_count = sum(1 for _ in followers)
+        return {'followings_count': followings_count, 'followers_count': followers_count}
+
+    @classmethod
+    def reconcile_friendship_counts(cls, user_id):
+        """
+        Fix the counts of the profile from the social graph, returns whether they were wrong
+        """
+        counts = cls.count_friendships(user_id)
+        profile, _ = UserProfile.objects.get_or_create(user_id=user_id)
+        if profile.followings_count == counts['followings_count'] \
+                and profile.followers_count == counts['followers_count']:
+            return False
+
+        UserProfile.objects.filter(id=profile.id).update(**counts)
+        UserService.invalidate_profile(user_id)
+        conn = RedisClient.get_connection()
+        conn.delete(
+            USER_FOLLOWINGS_COUNT_PATTERN.format(user_id=user_id),
+            USER_FOLLOWERS_COUNT_PATTERN.format(user_id=user_id),
+        )
+        return True
\ No newline at end of file
@@ -0,0 +1,20 @@
+from celery import shared_task
+from django.contrib.auth.models import User
+from friendships.constants import RECONCILE_BATCH_SIZE
+from friendships.services import FriendshipService
+from utils.time_constants import ONE_HOUR
+
+
+@shared_task(routing_key='default', time_limit=ONE_HOUR)
+def reconcile_friendship_counts_task(user_ids=None):
+    # the counts are increased / decreased by follow and unfollow, they can drift when
+    # one of the writes fails, so they are recounted from the social graph periodically
+    if user_ids is None:
+        user_ids = User.objects.values_list('id', flat=True).iterator(chunk_size=RECONCILE_BATCH_SIZE)
+
+    total, fixed = 0, 0
+    for user_id in user_ids:
+        total += 1
+        if FriendshipService.reconcile_friendship_counts(user_id):
+            fixed += 1
+    return "{} of {} users reconciled".format(fixed, total)
@@ -1,7 +1,11 @@
 from friendships.services import FriendshipService
+from friendships.tasks import reconcile_friendship_counts_task
+from gatekeeper.models import GateKeeper
 from testing.testcases import TestCase
 from django_hbase.models import EmptyColumnError, BadRowKeyError
-from friendships.models import HBaseFollowing, HBaseFollower
+from django.core.management import call_command
+from friendships.models import HBaseFollowing, HBaseFollower, HBaseFollowingIndex
+from io import StringIO
 
 import time
 
@@ -28,6 +32,99 @@ class FriendshipServiceTests(TestCase):
         user_id_set = FriendshipService.get_following_user_id_set(self.wl.id)
         self.assertSetEqual(user_id_set, {user1.id, user2.id})
 
+    def test_following_cache(self):
+        user1 = self.create_user('user1')
+        self.assertSetEqual(FriendshipService.get_following_user_id_set(self.wl.id), set())
+
+        # the cached set is updated by follow / unfollow instead of being invalidated
+        for switch_on in [True, False]:
+            if switch_on:
+                GateKeeper.turn_on('switch_friendship_to_hbase')
+            else:
+                GateKeeper.set_kv('switch_friendship_to_hbase', 'percent', 0)
+            FriendshipService.follow(self.wl.id, user1.id)
+            FriendshipService.follow(self.wl.id, self.wl_hsu.id)
+            self.assertSetEqual(
+                FriendshipService.get_following_user_id_set(self.wl.id),
+                {user1.id, self.wl_hsu.id},
+            )
+            FriendshipService.unfollow(self.wl.id, user1.id)
+            self.assertSetEqual(
+                FriendshipService.get_followed_user_ids(self.wl.id, [user1.id, self.wl_hsu.id]),
+                {self.wl_hsu.id},
+            )
+            FriendshipService.unfollow(self.wl.id, self.wl_hsu.id)
+            self.assertSetEqual(FriendshipService.get_following_user_id_set(self.wl.id), set())
+
+    def test_has_followed(self):
+        self.assertEqual(FriendshipService.has_followed(self.wl.id, self.wl_hsu.id), False)
+        self.create_friendship(from_user=self.wl, to_user=self.wl_hsu)
+        self.assertEqual(FriendshipService.has_followed(self.wl.id, self.wl_hsu.id), True)
+        self.assertEqual(FriendshipService.has_followed(self.wl_hsu.id, self.wl.id), False)
+        instance = FriendshipService.get_follow_instance(self.wl.id, self.wl_hsu.id)
+        self.assertEqual(instance.to_user_id, self.wl_hsu.id)
+
+        self.assertEqual(FriendshipService.unfollow(self.wl.id, self.wl_hsu.id), 1)
+        self.assertEqual(FriendshipService.has_followed(self.wl.id, self.wl_hsu.id), False)
+        self.assertEqual(FriendshipService.get_follow_instance(self.wl.id, self.wl_hsu.id), None)
+        self.assertEqual(FriendshipService.unfollow(self.wl.id, self.wl_hsu.id), 0)
+
+    def test_backfill_following_index(self):
+        ts = int(time.time() * 1000000)
+        HBaseFollowing.create(from_user_id=self.wl.id, to_user_id=self.wl_hsu.id, created_at=ts)
+        self.assertEqual(FriendshipService.has_followed(self.wl.id, self.wl_hsu.id), False)
+
+        call_command('backfill_following_index', stdout=StringIO())
+        self.assertEqual(FriendshipService.has_followed(self.wl.id, self.wl_hsu.id), True)
+        index = HBaseFollowingIndex.get(from_user_id=self.wl.id, to_user_id=self.wl_hsu.id)
+        self.assertEqual(index.created_at, ts)
+
+    def test_friendship_counts(self):
+        user1 = self.create_user('user1')
+        self.create_friendship(from_user=self.wl, to_user=self.wl_hsu)
+        self.assertEqual(FriendshipService.get_following_count(self.wl.id), 1)
+        self.assertEqual(FriendshipService.get_follower_count(self.wl_hsu.id), 1)
+
+        # cached counts are increased, the others are loaded from the profiles in one batch
+        self.create_friendship(from_user=self.wl, to_user=user1)
+        self.create_friendship(from_user=user1, to_user=self.wl_hsu)
+        counts = FriendshipService.get_friendship_counts([self.wl.id, self.wl_hsu.id, user1.id])
+        self.assertEqual(counts[self.wl.id], {'followings_count': 2, 'followers_count': 0})
+        self.assertEqual(counts[self.wl_hsu.id], {'followings_count': 0, 'followers_count': 2})
+        self.assertEqual(counts[user1.id], {'followings_count': 1, 'followers_count': 1})
+
+        FriendshipService.unfollow(self.wl.id, user1.id)
+        self.assertEqual(FriendshipService.get_following_count(self.wl.id), 1)
+        self.assertEqual(FriendshipService.get_follower_count(user1.id), 0)
+
+    def test_reconcile_friendship_counts(self):
+        self.create_friendship(from_user=self.wl, to_user=self.wl_hsu)
+        self.assertEqual(FriendshipService.reconcile_friendship_counts(self.wl.id), False)
+
+        # a follow written without the counts
+        ts = int(time.time() * 1000000)
+        HBaseFollowing.create(from_user_id=self.wl_hsu.id, to_user_id=self.wl.id, created_at=ts)
+        HBaseFollower.create(from_user_id=self.wl_hsu.id, to_user_id=self.wl.id, created_at=ts)
+        self.assertEqual(FriendshipService.get_follower_count(self.wl.id), 0)
+
+        result = reconcile_friendship_counts_task([self.wl.id, self.wl_hsu.id])
+        self.assertEqual(result, '2 of 2 users reconciled')
+        self.assertEqual(FriendshipService.get_follower_count(self.wl.id), 1)
+        self.assertEqual(FriendshipService.get_following_count(self.wl_hsu.id), 1)
+
+    def test_get_follower_id_batches(self):
+        followers = [self.create_user('follower{}'.format(i)) for i in range(5)]
+        for follower in followers:
+            self.create_friendship(from_user=follower, to_user=self.wl)
+
+        batches = list(FriendshipService.get_follower_id_batches(self.wl.id, 2))
+        self.assertEqual([len(batch_ids) for batch_ids in batches], [2, 2, 1])
+        self.assertSetEqual(
+            set(follower_id for batch_ids in batches for follower_id in batch_ids),
+            set(follower.id for follower in followers),
+        )
+        self.assertEqual(list(FriendshipService.get_follower_id_batches(self.wl_hsu.id, 2)), [])
+
 
 class HBaseTests(TestCase):
 
@@ -133,4 +230,45 @@ class HBaseTests(TestCase):
         results = HBaseFollowing.filter(start=(1, results[1].created_at, None), limit=2, reverse=True)
         self.assertEqual(len(results), 2)
         self.assertEqual(results[0].to_user_id, 3)
-        self.assertEqual(results[1].to_user_id, 2)
\ No newline at end of file
+        self.assertEqual(results[1].to_user_id, 2)
+
+    def test_iter_filter(self):
+        for to_user_id in range(2, 5):
+            HBaseFollowing.create(from_user_id=1, to_user_id=to_user_id, created_at=self.ts_now)
+
+        followings = HBaseFollowing.iter_filter(prefix=(1, None), batch_size=2)
+        self.assertEqual(isinstance(followings, list), False)
+        self.assertEqual([f.to_user_id for f in followings], [2, 3, 4])
+
+        results = list(HBaseFollowing.iter_filter(prefix=(1, None), limit=2, reverse=True))
+        self.assertEqual([f.to_user_id for f in results], [4, 3])
+
+        # column projection
+        results = list(HBaseFollowing.iter_filter(prefix=(1, None), columns=['to_user_id']))
+        self.assertEqual([f.to_user_id for f in results], [2, 3, 4])
+
+        # keys only
+        results = list(HBaseFollowing.iter_filter(prefix=(1, None), keys_only=True))
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0]['from_user_id'], 1)
+        self.assertEqual(results[0]['created_at'] < results[1]['created_at'], True)
+        self.assertEqual('to_user_id' in results[0], False)
+
+    def test_batch_get(self):
+        ts = self.ts_now
+        HBaseFollowing.create(from_user_id=1, to_user_id=2, created_at=ts)
+        HBaseFollowing.create(from_user_id=3, to_user_id=4, created_at=ts)
+
+        results = HBaseFollowing.batch_get([
+            {'from_user_id': 3, 'created_at': ts},
+            {'from_user_id': 5, 'created_at': ts},
+            {'from_user_id': 1, 'created_at': ts},
+        ])
+        self.assertEqual(results[0].to_user_id, 4)
+        self.assertEqual(results[1], None)
+        self.assertEqual(results[2].to_user_id, 2)
+
+        results = HBaseFollowing.batch_get([{'from_user_id': 1, 'created_at': ts}], columns=['to_user_id'])
+        self.assertEqual(results[0].from_user_id, 1)
+        self.assertEqual(results[0].to_user_id, 2)
+        self.assertEqual(HBaseFollowing.batch_get([]), [])
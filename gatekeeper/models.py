@@ -1,26 +1,91 @@
+from django.conf import settings
 from utils.redis_client import RedisClient
+from utils.request_cache import RequestCache
+
+import time
+import uuid
+
+# set to a new token by every write to any gatekeeper,
+# a process drops its snapshot of the gatekeepers when the token changes
+GATEKEEPER_VERSION_KEY = 'gatekeeper_version'
+# namespace of the gatekeepers in the request scoped memo, see utils.request_cache
+MEMO_NAMESPACE = 'gatekeeper'
 
 
 class GateKeeper(object):
+    # in process snapshot of the gatekeeper hashes, {gk_name: {field: value}},
+    # a gatekeeper is added the first time it is read, a missing one is kept as {}
+    snapshot = {}
+    snapshot_version = None
+    snapshot_checked_at = None
+
+    @classmethod
+    def get_snapshot(cls):
+        """
+        The snapshot is trusted for GATEKEEPER_SNAPSHOT_TTL seconds, then the version key
+        is checked (one GET) and the snapshot is dropped if any gatekeeper has been written since.
+        The writes in this process drop the snapshot right away.
+        """
+        now = time.monotonic()
+        checked_at = cls.snapshot_checked_at
+        if checked_at is not None and now - checked_at < settings.GATEKEEPER_SNAPSHOT_TTL:
+            return cls.snapshot
+
+        version = RedisClient.get_connection().get(GATEKEEPER_VERSION_KEY)
+        if checked_at is None or version != cls.snapshot_version:
+            cls.snapshot = {}
+            cls.snapshot_version = version
+        cls.snapshot_checked_at = now
+        return cls.snapshot
+
+    @classmethod
+    def invalidate_snapshot(cls):
+        cls.snapshot_checked_at = None
+
+    @classmethod
+    def get_hash(cls, gk_name):
+        # a request sees the same value of a gatekeeper from start to end,
+        # and does not check the snapshot version again for it
+        return RequestCache.get_or_load(MEMO_NAMESPACE, gk_name, lambda: cls._get_hash(gk_name))
+
+    @classmethod
+    def _get_hash(cls, gk_name):
+        snapshot = cls.get_snapshot()
+        if gk_name not in snapshot:
+            conn = RedisClient.get_connection()
+            snapshot[gk_name] = conn.hgetall(f'gatekeeper:{gk_name}')
+        return snapshot[gk_name]
 
     @classmethod
     def get(cls, gk_name):
-        conn = RedisClient.get_connection()
-        name = f'gatekeeper:{gk_name}'
-        if not conn.exists(name):
+        redis_hash = cls.get_hash(gk_name)
+        if not redis_hash:
             return {'percent': 0, 'description': ''}
 
-        redis_hash = conn.hgetall(name)
         return {
             'percent': int(redis_hash.get(b'percent', 0)),
             'description': str(redis_hash.get(b'description', '')),
         }
 
+    @classmethod
+    def get_value(cls, gk_name, key, default=None):
+        # for the gatekeepers holding a config value instead of a percent
+        value = cls.get_hash(gk_name).get(key.encode('utf-8'))
+        if value is None:
+            return default
+        return value.decode('utf-8')
+
     @classmethod
     def set_kv(cls, gk_name, key, value):
         conn = RedisClient.get_connection()
         name = f'gatekeeper:{gk_name}'
-        conn.hset(name, key, value)
+        # hset + the new version in one MULTI/EXEC pipeline
+        pipeline = conn.pipeline()
+        pipeline.hset(name, key, value)
+        pipeline.set(GATEKEEPER_VERSION_KEY, uuid.uuid4().hex)
+        pipeline.execute()
+        cls.invalidate_snapshot()
+        RequestCache.delete(MEMO_NAMESPACE, gk_name)
 
     @classmethod
     def is_switch_on(cls, gk_name):
@@ -32,4 +97,4 @@ class GateKeeper(object):
 
     @classmethod
     def in_gk(cls, gk_name, user_id):
-        return user_id % 100 < cls.get(gk_name)['percent']
\ No newline at end of file
+        return user_id % 100 < cls.get(gk_name)['percent']
@@ -1,5 +1,9 @@
+from django.test import override_settings
 from testing.testcases import TestCase
-from gatekeeper.models import GateKeeper
+from gatekeeper.models import GateKeeper, GATEKEEPER_VERSION_KEY
+from utils.redis_client import RedisClient
+
+import time
 
 
 class GateKeeperTests(TestCase):
@@ -19,4 +23,28 @@ class GateKeeperTests(TestCase):
 
         GateKeeper.set_kv('gk_name', 'percent', 100)
         self.assertEqual(GateKeeper.is_switch_on('gk_name'), True)
-        self.assertEqual(GateKeeper.in_gk('gk_name', 1), True)
\ No newline at end of file
+        self.assertEqual(GateKeeper.in_gk('gk_name', 1), True)
+
+    @override_settings(GATEKEEPER_SNAPSHOT_TTL=60)
+    def test_snapshot(self):
+        conn = RedisClient.get_connection()
+        self.assertEqual(GateKeeper.is_switch_on('gk_name'), False)
+
+        # another process writes the hash, the snapshot is trusted within the ttl
+        conn.hset('gatekeeper:gk_name', 'percent', 100)
+        conn.set(GATEKEEPER_VERSION_KEY, 'another version')
+        self.assertEqual(GateKeeper.is_switch_on('gk_name'), False)
+
+        # the version key is checked after the ttl
+        GateKeeper.snapshot_checked_at = time.monotonic() - 61
+        self.assertEqual(GateKeeper.is_switch_on('gk_name'), True)
+
+        # an unchanged version keeps the snapshot
+        conn.hset('gatekeeper:gk_name', 'percent', 0)
+        GateKeeper.snapshot_checked_at = time.monotonic() - 61
+        self.assertEqual(GateKeeper.is_switch_on('gk_name'), True)
+
+        # the writes in this process are seen right away
+        GateKeeper.set_kv('gk_name', 'percent', 20)
+        self.assertEqual(GateKeeper.is_switch_on('gk_name'), False)
+        self.assertEqual(GateKeeper.get_value('gk_name', 'percent'), '20')
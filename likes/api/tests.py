@@ -145,18 +145,18 @@ class LikeApiTests(TestCase):
         anonymous_client = APIClient()
         response = anonymous_client.get(COMMENT_LIST_API, {'tweet_id': tweet.id})
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(response.data['comments'][0]['has_liked'], False)
-        self.assertEqual(response.data['comments'][0]['likes_count'], 0)
+        self.assertEqual(response.data['results'][0]['has_liked'], False)
+        self.assertEqual(response.data['results'][0]['likes_count'], 0)
 
         # test comments list api
         response = self.wl_hsu_client.get(COMMENT_LIST_API, {'tweet_id': tweet.id})
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(response.data['comments'][0]['has_liked'], False)
-        self.assertEqual(response.data['comments'][0]['likes_count'], 0)
+        self.assertEqual(response.data['results'][0]['has_liked'], False)
+        self.assertEqual(response.data['results'][0]['likes_count'], 0)
         self.create_like(self.wl_hsu, comment)
         response = self.wl_hsu_client.get(COMMENT_LIST_API, {'tweet_id': tweet.id})
-        self.assertEqual(response.data['comments'][0]['has_liked'], True)
-        self.assertEqual(response.data['comments'][0]['likes_count'], 1)
+        self.assertEqual(response.data['results'][0]['has_liked'], True)
+        self.assertEqual(response.data['results'][0]['likes_count'], 1)
 
         # test tweet detail api
         self.create_like(self.wl, comment)
@@ -1,35 +1,53 @@
 from utils.redis_helper import RedisHelper
 
 
-def incr_likes_count(sender, instance, created, **kwargs):
+def get_likes_count_models():
+    # the models with a likes_count column, the likes of the other models are not counted
+    from comments.models import Comment
     from tweets.models import Tweet
+
+    return (Tweet, Comment)
+
+
+def incr_likes_count(sender, instance, created, **kwargs):
     from django.db.models import F
 
     if not created:
         return
 
     model_class = instance.content_type.model_class()
-    if model_class != Tweet:
-
+    if model_class not in get_likes_count_models():
         return
 
     # we cannot use tweet.likes_count += 1; tweet.save() so this operation is not an atomic operation,
     # we must use an update statement to be an atomic operation
-    Tweet.objects.filter(id=instance.object_id).update(likes_count=F('likes_count') + 1)
-    tweet = instance.content_object
-    RedisHelper.incr_count(tweet, 'likes_count')
+    model_class.objects.filter(id=instance.object_id).update(likes_count=F('likes_count') + 1)
+    target = instance.content_object
+    RedisHelper.incr_count(target, 'likes_count')
 
 
 def decr_likes_count(sender, instance, **kwargs):
-    from tweets.models import Tweet
     from django.db.models import F
 
     model_class = instance.content_type.model_class()
-    if model_class != Tweet:
+    if model_class not in get_likes_count_models():
+        return
+
+    # handle likes cancel
+    model_class.objects.filter(id=instance.object_id).update(likes_count=F('likes_count') - 1)
+    target = instance.content_object
+    RedisHelper.decr_count(target, 'likes_count')
+
+
+def add_like_to_cache(sender, instance, created, **kwargs):
+    from likes.services import LikeService
 
+    if not created:
         return
+    LikeService.add_like_to_cache(instance)
+
+
+def remove_like_from_cache(sender, instance, **kwargs):
+    from likes.services import LikeService
 
-    # handle tweet likes cancel
-    Tweet.objects.filter(id=instance.object_id).update(likes_count=F('likes_count') - 1)
-    tweet = instance.content_object
-    RedisHelper.decr_count(tweet, 'likes_count')
\ No newline at end of file
+    LikeService.remove_like_from_cache(instance)
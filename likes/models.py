@@ -3,8 +3,13 @@ from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.db import models
 from utils.memcached_helper import MemcachedHelper
-from django.db.models.signals import pre_delete, post_save
-from likes.listeners import incr_likes_count, decr_likes_count
+from django.db.models.signals import post_delete, pre_delete, post_save
+from likes.listeners import (
+    add_like_to_cache,
+    decr_likes_count,
+    incr_likes_count,
+    remove_like_from_cache,
+)
 
 
 class Like(models.Model):
@@ -42,4 +47,6 @@ class Like(models.Model):
 
 
 pre_delete.connect(decr_likes_count, sender=Like)
-post_save.connect(incr_likes_count, sender=Like)
\ No newline at end of file
+post_save.connect(incr_likes_count, sender=Like)
+post_save.connect(add_like_to_cache, sender=Like)
+post_delete.connect(remove_like_from_cache, sender=Like)
@@ -1,15 +1,140 @@
+from django.conf import settings
 from likes.models import Like
 from django.contrib.contenttypes.models import ContentType
+from twitter.cache import USER_LIKES_PATTERN
+from utils.redis_helper import RedisHelper
+from utils.request_cache import RequestCache
+
+# namespace of the liked flags in the request scoped memo, {(user_id, content_type_id, object_id): has_liked}
+MEMO_NAMESPACE = 'liked'
 
 
 class LikeService(object):
 
+    @classmethod
+    def get_member(cls, content_type_id, object_id):
+        # member of the liked objects of a user in redis
+        return '{}:{}'.format(content_type_id, object_id)
+
+    @classmethod
+    def get_timestamp(cls, created_at):
+        return int(created_at.timestamp() * 1000000)
+
+    @classmethod
+    def load_recent_likes(cls, user_id):
+        """
+        The newest REDIS_LIKES_LENGTH_LIMIT likes of the user as ({member: timestamp}, window_start).
+        Every like newer than window_start is loaded, window_start is 0 when all the likes are loaded.
+        The likes of the user are found by the user prefix of the <user, content_type, object_id> index
+        """
+        limit = settings.REDIS_LIKES_LENGTH_LIMIT
+        likes = Like.objects.filter(user_id=user_id).order_by('-created_at').values_list(
+            'content_type_id',
+            'object_id',
+            'created_at',
+        )[:limit + 1]
+        likes = list(likes)
+        window_start = 0
+        if len(likes) > limit:
+            window_start = cls.get_timestamp(likes[limit][2])
+            likes = likes[:limit]
+        scored_members = {
+            cls.get_member(content_type_id, object_id): cls.get_timestamp(created_at)
+            for content_type_id, object_id, created_at in likes
+        }
+        return scored_members, window_start
+
+    @classmethod
+    def add_like_to_cache(cls, like):
+        RedisHelper.add_to_window_set(
+            USER_LIKES_PATTERN.format(user_id=like.user_id),
+            cls.get_member(like.content_type_id, like.object_id),
+            cls.get_timestamp(like.created_at),
+            settings.REDIS_LIKES_LENGTH_LIMIT,
+        )
+        RequestCache.set(MEMO_NAMESPACE, (like.user_id, like.content_type_id, like.object_id), True)
+
+    @classmethod
+    def remove_like_from_cache(cls, like):
+        RedisHelper.remove_from_window_set(
+            USER_LIKES_PATTERN.format(user_id=like.user_id),
+            cls.get_member(like.content_type_id, like.object_id),
+        )
+        RequestCache.set(MEMO_NAMESPACE, (like.user_id, like.content_type_id, like.object_id), False)
+
     @classmethod
     def has_liked(cls, user, target):
         if user.is_anonymous:
             return False
-        return Like.objects.filter(
-            content_type=ContentType.objects.get_for_model(target.__class__),
-            object_id=target.id,
-            user=user,
-        ).exists()
\ No newline at end of file
+        return target.id in cls.get_liked_object_ids(user, [target])
+
+    @classmethod
+    def get_liked_object_ids(cls, user, targets):
+        """
+        The ids of the targets (of the same model) liked by user, checked against the recent likes
+        of the user in redis in one round trip. A target can only have an uncached like if it was
+        created before the cached window, those are checked in one query on the
+        <user, content_type, object_id> index, most pages do not need the database at all
+        """
+        if user.is_anonymous or not targets:
+            return set()
+        # ContentType.objects caches the content types in process
+        content_type = ContentType.objects.get_for_model(targets[0].__class__)
+        # the targets already checked by this request are not checked again
+        memo = RequestCache.get_namespace(MEMO_NAMESPACE)
+        if memo is None:
+            return cls._get_liked_object_ids(user, content_type, targets)
+        memo_keys = {target.id: (user.id, content_type.id, target.id) for target in targets}
+        missing_targets = [target for target in targets if memo_keys[target.id] not in memo]
+        liked_object_ids = cls._get_liked_object_ids(user, content_type, missing_targets)
+        for target in missing_targets:
+            memo[memo_keys[target.id]] = target.id in liked_object_ids
+        return set(target.id for target in targets if memo[memo_keys[target.id]])
+
+    @classmethod
+    def _get_liked_object_ids(cls, user, content_type, targets):
+        if not targets:
+            return set()
+        members = [cls.get_member(content_type.id, target.id) for target in targets]
+        window_start, scores = RedisHelper.get_scores_in_window_set(
+            USER_LIKES_PATTERN.format(user_id=user.id),
+            members,
+            lambda: cls.load_recent_likes(user.id),
+        )
+
+        liked_object_ids = set()
+        older_object_ids = []
+        for target, member in zip(targets, members):
+            if member in scores:
+                liked_object_ids.add(target.id)
+            elif cls.get_timestamp(target.created_at) <= window_start:
+                older_object_ids.append(target.id)
+        if older_object_ids:
+            liked_object_ids.update(Like.objects.filter(
+                user=user,
+                content_type=content_type,
+                object_id__in=older_object_ids,
+            ).values_list('object_id', flat=True))
+        return liked_object_ids
+
+    @classmethod
+    def get_context_key(cls, model_class):
+        return 'prefetched_liked:{}'.format(model_class.__name__)
+
+    @classmethod
+    def prefetch_liked_object_ids(cls, context, model_class, targets):
+        """
+        List serializers call this once per page, whether the request user has liked
+        each target is kept in the serializer context as {object_id: has_liked}
+        """
+        liked_object_ids = cls.get_liked_object_ids(context['request'].user, targets)
+        prefetched = context.setdefault(cls.get_context_key(model_class), {})
+        for target in targets:
+            prefetched[target.id] = target.id in liked_object_ids
+
+    @classmethod
+    def has_liked_from_context(cls, context, target):
+        prefetched = context.get(cls.get_context_key(target.__class__), {})
+        if target.id in prefetched:
+            return prefetched[target.id]
+        return cls.has_liked(context['request'].user, target)
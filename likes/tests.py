@@ -0,0 +1,100 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from likes.services import LikeService
+from testing.testcases import TestCase
+from twitter.cache import USER_LIKES_PATTERN
+from utils.redis_client import RedisClient
+from utils.redis_helper import RedisHelper
+
+
+class LikeServiceTests(TestCase):
+
+    def setUp(self):
+        super(LikeServiceTests, self).setUp()
+        self.wl = self.create_user('wl')
+        self.wl_hsu = self.create_user('wl_hsu')
+
+    def count_like_queries(self, queries):
+        return len([query for query in queries if 'likes_like' in query['sql']])
+
+    def test_has_liked(self):
+        tweet = self.create_tweet(self.wl_hsu)
+        comment = self.create_comment(self.wl_hsu, tweet)
+        self.assertEqual(LikeService.has_liked(self.wl, tweet), False)
+
+        # the liked set is cached, likes and cancels update it
+        like = self.create_like(self.wl, tweet)
+        self.assertEqual(LikeService.has_liked(self.wl, tweet), True)
+        self.assertEqual(LikeService.has_liked(self.wl, comment), False)
+        self.assertEqual(LikeService.has_liked(self.wl_hsu, tweet), False)
+        like.delete()
+        self.assertEqual(LikeService.has_liked(self.wl, tweet), False)
+
+        # loaded from the database after the cache is cleared
+        self.create_like(self.wl, comment)
+        RedisClient.clear()
+        self.assertEqual(LikeService.has_liked(self.wl, comment), True)
+        self.assertEqual(LikeService.has_liked(self.wl, tweet), False)
+
+    def test_has_liked_queries(self):
+        tweet = self.create_tweet(self.wl_hsu)
+        self.create_like(self.wl, tweet)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(LikeService.has_liked(self.wl, tweet), True)
+        self.assertEqual(self.count_like_queries(queries), 1)
+
+        # the cached liked set answers without mysql
+        new_tweet = self.create_tweet(self.wl_hsu)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(LikeService.has_liked(self.wl, tweet), True)
+            self.assertEqual(LikeService.has_liked(self.wl, new_tweet), False)
+        self.assertEqual(self.count_like_queries(queries), 0)
+
+    def test_liked_window(self):
+        # REDIS_LIKES_LENGTH_LIMIT is 5 in testing
+        tweets = [self.create_tweet(self.wl_hsu) for _ in range(7)]
+        for tweet in tweets:
+            self.create_like(self.wl, tweet)
+        conn = RedisClient.get_connection()
+        key = USER_LIKES_PATTERN.format(user_id=self.wl.id)
+
+        # only the 5 newest likes are cached, the 2 oldest tweets are checked in one query
+        with CaptureQueriesContext(connection) as queries:
+            liked_ids = LikeService.get_liked_object_ids(self.wl, tweets)
+        self.assertSetEqual(liked_ids, set(tweet.id for tweet in tweets))
+        self.assertEqual(self.count_like_queries(queries), 2)
+        self.assertEqual(conn.zcard(key), 6)
+
+        # a tweet created after the window can not have an uncached like
+        new_tweet = self.create_tweet(self.wl_hsu)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(LikeService.has_liked(self.wl, new_tweet), False)
+        self.assertEqual(self.count_like_queries(queries), 0)
+
+        # a new like drops the oldest one and moves the window
+        self.create_like(self.wl, new_tweet)
+        self.assertEqual(conn.zcard(key), 6)
+        self.assertEqual(LikeService.has_liked(self.wl, new_tweet), True)
+        self.assertEqual(LikeService.has_liked(self.wl, tweets[2]), True)
+        liked_ids = LikeService.get_liked_object_ids(self.wl, tweets + [new_tweet])
+        self.assertEqual(len(liked_ids), 8)
+
+    def test_like_while_loading(self):
+        tweets = [self.create_tweet(self.wl_hsu) for _ in range(2)]
+        self.create_like(self.wl, tweets[0])
+        RedisClient.clear()
+        conn = RedisClient.get_connection()
+        key = USER_LIKES_PATTERN.format(user_id=self.wl.id)
+
+        def lazy_load_window():
+            # tweets[1] is liked after the likes were read from the database
+            recent_likes = LikeService.load_recent_likes(self.wl.id)
+            self.create_like(self.wl, tweets[1])
+            return recent_likes
+
+        RedisHelper.get_scores_in_window_set(key, [], lazy_load_window)
+        # the outdated likes are not cached, they are loaded again on the next read
+        self.assertEqual(conn.exists(key), False)
+        self.assertEqual(LikeService.has_liked(self.wl, tweets[1]), True)
+        self.assertEqual(conn.exists(key), True)
@@ -1,11 +1,44 @@
+from django.contrib.auth.models import User
+from likes.services import LikeService
 from rest_framework import serializers
 from tweets.api.serializers import TweetSerializer
+from tweets.constants import TWEET_COUNT_ATTRS
+from tweets.models import Tweet
+from utils.memcached_helper import MemcachedHelper
+from utils.redis_helper import RedisHelper
+
+
+class NewsFeedListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        newsfeeds = list(data)
+        # load the tweets of this page and then their users, one memcached round trip each,
+        # the counters of the tweets and whether they are liked, one redis round trip each
+        tweets = MemcachedHelper.prefetch_objects(
+            self.context,
+            Tweet,
+            [newsfeed.tweet_id for newsfeed in newsfeeds],
+        )
+        MemcachedHelper.prefetch_objects(
+            self.context,
+            User,
+            [tweet.user_id for tweet in tweets if tweet is not None],
+        )
+        # the newsfeeds of the tweets that do not exist anymore are skipped
+        newsfeeds = [newsfeed for newsfeed, tweet in zip(newsfeeds, tweets) if tweet is not None]
+        tweets = [tweet for tweet in tweets if tweet is not None]
+        RedisHelper.prefetch_counts(self.context, tweets, TWEET_COUNT_ATTRS)
+        LikeService.prefetch_liked_object_ids(self.context, Tweet, tweets)
+        return super(NewsFeedListSerializer, self).to_representation(newsfeeds)
 
 
 class NewsFeedSerializer(serializers.Serializer):
     tweet = serializers.SerializerMethodField()
     created_at = serializers.SerializerMethodField()
 
+    class Meta:
+        list_serializer_class = NewsFeedListSerializer
+
     def update(self, instance, validated_data):
         pass
 
@@ -13,7 +46,10 @@ class NewsFeedSerializer(serializers.Serializer):
         pass
 
     def get_tweet(self, obj):
-        return TweetSerializer(obj.cached_tweet, context=self.context).data
+        tweet = MemcachedHelper.get_object_from_context(self.context, Tweet, obj.tweet_id)
+        if tweet is None:
+            return None
+        return TweetSerializer(tweet, context=self.context).data
 
     def get_created_at(self, obj):
-        return obj.created_at
\ No newline at end of file
+        return obj.created_at
@@ -3,8 +3,12 @@ from testing.testcases import TestCase
 from gatekeeper.models import GateKeeper
 from newsfeeds.models import NewsFeed, HBaseNewsFeed
 from utils.paginations import EndlessPagination
+from newsfeeds.constants import CELEBRITY_GK
 from newsfeeds.services import NewsFeedService
 from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django_hbase.models.row_key_codecs import get_row_key_codec
 
 
 NEWSFEEDS_URL = '/api/newsfeeds/'
@@ -57,6 +61,82 @@ class NewsFeedApiTests(TestCase):
         self.assertEqual(len(response.data['results']), 2)
         self.assertEqual(response.data['results'][0]['tweet']['id'], posted_tweet_id)
 
+    def test_list_with_celebrity(self):
+        # wl_hsu has 2 followers
+        GateKeeper.set_kv(CELEBRITY_GK, 'threshold', 2)
+        self.wl_client.post(FOLLOW_URL.format(self.wl_hsu.id))
+        self.wl_client.post(POST_TWEETS_URL, {'content': 'Hello World'})
+        response = self.wl_hsu_client.post(POST_TWEETS_URL, {'content': 'Hello Twitter'})
+        posted_tweet_id = response.data['id']
+
+        # the tweet of wl_hsu is not fanned out but pulled
+        self.assertEqual(len(NewsFeedService.get_cached_newsfeeds(self.wl.id)), 1)
+        response = self.wl_client.get(NEWSFEEDS_URL)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(response.data['results'][0]['tweet']['id'], posted_tweet_id)
+
+        created_at = response.data['results'][0]['created_at']
+        response = self.wl_client.get(NEWSFEEDS_URL, {'created_at__lt': created_at})
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['tweet']['content'], 'Hello World')
+
+    def test_list_with_celebrity_past_cache(self):
+        # wl_hsu has 2 followers before wl
+        GateKeeper.set_kv(CELEBRITY_GK, 'threshold', 2)
+        self.wl_client.post(FOLLOW_URL.format(self.wl_hsu.id))
+        other_user = self.create_user('other_user')
+        tweets = []
+        for i in range(settings.REDIS_LIST_LENGTH_LIMIT + EndlessPagination.page_size):
+            celebrity_tweet = self.create_tweet(self.wl_hsu)
+            tweet = self.create_tweet(other_user)
+            self.create_newsfeed(self.wl, tweet)
+            tweets.extend([celebrity_tweet, tweet])
+
+        # the pages older than the cached lists also merge the tweets of the celebrity
+        results = self._paginate_to_get_newsfeeds(self.wl_client)
+        self.assertEqual(
+            [newsfeed['tweet']['id'] for newsfeed in results],
+            [tweet.id for tweet in tweets[::-1]],
+        )
+
+    def test_list_queries(self):
+        tweets = [self.create_tweet(self.wl_hsu) for i in range(3)]
+        for tweet in tweets:
+            self.create_newsfeed(self.wl, tweet)
+        self.create_like(self.wl, tweets[1])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.wl_client.get(NEWSFEEDS_URL)
+        self.assertEqual(
+            [newsfeed['tweet']['has_liked'] for newsfeed in response.data['results']],
+            [False, True, False],
+        )
+        # has_liked of the whole page is loaded in one query
+        like_queries = [query for query in queries if 'likes_like' in query['sql']]
+        self.assertEqual(len(like_queries), 1)
+
+    def test_list_skips_deleted_tweets(self):
+        tweets = [self.create_tweet(self.wl_hsu) for i in range(3)]
+        for tweet in tweets:
+            self.create_newsfeed(self.wl, tweet)
+        response = self.wl_client.get(NEWSFEEDS_URL)
+        self.assertEqual(len(response.data['results']), 3)
+
+        # the newsfeed is left behind when its tweet is deleted
+        tweets[1].delete()
+        response = self.wl_client.get(NEWSFEEDS_URL)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [newsfeed['tweet']['id'] for newsfeed in response.data['results']],
+            [tweets[2].id, tweets[0].id],
+        )
+
+        # the missing tweet is remembered, the tweets are not queried again
+        with CaptureQueriesContext(connection) as queries:
+            response = self.wl_client.get(NEWSFEEDS_URL)
+        self.assertEqual(len(response.data['results']), 2)
+        tweet_queries = [query for query in queries if 'FROM `tweets_tweet`' in query['sql']]
+        self.assertEqual(len(tweet_queries), 0)
+
     def test_pagination(self):
         page_size = EndlessPagination.page_size
         followed_user = self.create_user('followed')
@@ -169,6 +249,47 @@ class NewsFeedApiTests(TestCase):
             results.extend(response.data['results'])
         return results
 
+    def _create_newsfeeds(self, user, count):
+        author = self.create_user('author_of_{}'.format(user.username))
+        return [
+            self.create_newsfeed(user, self.create_tweet(author, 'feed{}'.format(i)))
+            for i in range(count)
+        ]
+
+    def _assert_paginate_past_cache(self, user, client, old_count=0):
+        # old_count newsfeeds are written with the row key codec in use before the others
+        if old_count:
+            old_newsfeeds = self._create_newsfeeds(user, old_count)
+            HBaseNewsFeed._row_key_codec = get_row_key_codec('binary')
+        else:
+            old_newsfeeds = []
+        count = settings.REDIS_LIST_LENGTH_LIMIT + EndlessPagination.page_size - old_count
+        newsfeeds = (old_newsfeeds + self._create_newsfeeds(user, count))[::-1]
+        # the pages older than the cached list are scanned from hbase
+        results = self._paginate_to_get_newsfeeds(client)
+        self.assertEqual(
+            [newsfeed['created_at'] for newsfeed in results],
+            [newsfeed.created_at for newsfeed in newsfeeds],
+        )
+
+    def test_hbase_pagination_past_cache(self):
+        # the string row key by default
+        self._assert_paginate_past_cache(self.wl, self.wl_client)
+
+        row_key_codec, dual_read_codec = HBaseNewsFeed._row_key_codec, HBaseNewsFeed._dual_read_codec
+        try:
+            # opted in to the binary row key
+            HBaseNewsFeed._row_key_codec = get_row_key_codec('binary')
+            self._assert_paginate_past_cache(self.wl_hsu, self.wl_hsu_client)
+
+            # while the row keys are rewritten, the oldest newsfeeds still have string row keys
+            HBaseNewsFeed._row_key_codec = get_row_key_codec('string')
+            HBaseNewsFeed._dual_read_codec = get_row_key_codec('string')
+            user, client = self.create_user_and_client('dual_read')
+            self._assert_paginate_past_cache(user, client, EndlessPagination.page_size)
+        finally:
+            HBaseNewsFeed._row_key_codec, HBaseNewsFeed._dual_read_codec = row_key_codec, dual_read_codec
+
     def test_redis_list_limit(self):
         list_limit = settings.REDIS_LIST_LENGTH_LIMIT
         page_size = 20
@@ -18,14 +18,23 @@ class NewsFeedViewSet(viewsets.GenericViewSet):
 
     @method_decorator(ratelimit(key='user', rate='5/s', method='GET', block=True))
     def list(self, request):
-        cached_newsfeeds = NewsFeedService.get_cached_newsfeeds(request.user.id)
-        page = self.paginator.paginate_cached_list(cached_newsfeeds, request)
+        start, stop = self.paginator.get_cached_list_window(request)
+        # the tweets of the followed celebrities are merged in, they are not fanned out
+        cached_newsfeeds, is_complete = NewsFeedService.get_merged_newsfeeds(request.user.id, start, stop)
+        page = self.paginator.paginate_cached_list(cached_newsfeeds, request, is_complete)
         if page is None:
             if GateKeeper.is_switch_on('switch_newsfeed_to_hbase'):
                 page = self.paginator.paginate_hbase(HBaseNewsFeed, (request.user.id,), request)
             else:
                 queryset = NewsFeed.objects.filter(user=request.user)
                 page = self.paginate_queryset(queryset)
+            page, self.paginator.has_next_page = NewsFeedService.merge_celebrity_newsfeeds(
+                request.user.id,
+                page,
+                self.paginator.has_next_page,
+                request.query_params.get('created_at__lt'),
+                self.paginator.page_size,
+            )
         serializer = NewsFeedSerializer(
             page,
             context={'request': request},
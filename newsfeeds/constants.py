@@ -1,3 +1,8 @@
 from django.conf import settings
 
-FANOUT_BATCH_SIZE = 1000 if not settings.TESTING else 3
\ No newline at end of file
+FANOUT_BATCH_SIZE = 1000 if not settings.TESTING else 3
+# The tweets of the authors who have more followers than the threshold are not fanned out,
+# they are merged into the newsfeeds of the followers when the newsfeeds are read.
+# The threshold can be changed online by GateKeeper.set_kv(CELEBRITY_GK, 'threshold', x)
+CELEBRITY_GK = 'newsfeed_celebrity'
+DEFAULT_CELEBRITY_THRESHOLD = 100000
@@ -13,6 +13,7 @@ class HBaseNewsFeed(models.HBaseModel):
     class Meta:
         table_name = 'twitter_newsfeeds'
         row_key = ('user_id', 'created_at')
+        # the binary row key is opted in by settings.HBASE_ROW_KEY_CODECS, see README
 
     def __str__(self):
         return '{} inbox of {}: {}'.format(self.created_at, self.user_id, self.tweet_id)
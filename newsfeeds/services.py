@@ -1,9 +1,22 @@
+from django.conf import settings
+from friendships.services import FriendshipService
 from gatekeeper.models import GateKeeper
+from newsfeeds.constants import CELEBRITY_GK, DEFAULT_CELEBRITY_THRESHOLD
 from newsfeeds.models import NewsFeed, HBaseNewsFeed
-from twitter.cache import USER_NEWSFEEDS_PATTERN
+from operator import attrgetter
+from tweets.models import Tweet
+from tweets.services import TweetService
+from twitter.cache import USER_NEWSFEEDS_PATTERN, USER_CELEBRITY_FOLLOWINGS_PATTERN
 from utils.redis_helper import RedisHelper
-from newsfeeds.tasks import fanout_newsfeeds_main_task
-from utils.redis_serializers import DjangoModelSerializer, HBaseModelSerializer
+from newsfeeds.tasks import (
+    fanout_newsfeeds_main_task,
+    refresh_cached_newsfeeds_task,
+    invalidate_celebrity_followings_task,
+)
+from utils.redis_serializers import HBaseModelSerializer
+from utils.time_helpers import parse_created_at
+
+import heapq
 
 
 def lazy_load_newsfeeds(user_id):
@@ -33,18 +46,204 @@ class NewsFeedService(object):
 
 
     @classmethod
-    def get_cached_newsfeeds(cls, user_id):
+    def get_serializer(cls):
+        if GateKeeper.is_switch_on('switch_newsfeed_to_hbase'):
+            return HBaseModelSerializer
+        return RedisHelper.get_serializer(USER_NEWSFEEDS_PATTERN)
+
+    @classmethod
+    def get_cached_newsfeeds(cls, user_id, start=0, stop=-1):
         key = USER_NEWSFEEDS_PATTERN.format(user_id=user_id)
+        serializer = cls.get_serializer()
+        return RedisHelper.load_objects_through_cache(
+            key,
+            lazy_load_newsfeeds(user_id),
+            serializer=serializer,
+            start=start,
+            stop=stop,
+            refresh=lambda: refresh_cached_newsfeeds_task.delay(user_id),
+        )
+
+    @classmethod
+    def refresh_cached_newsfeeds(cls, user_id):
+        key = USER_NEWSFEEDS_PATTERN.format(user_id=user_id)
+        RedisHelper.refresh_objects_in_cache(key, lazy_load_newsfeeds(user_id), cls.get_serializer())
+
+    @classmethod
+    def get_celebrity_threshold(cls):
+        return int(GateKeeper.get_value(CELEBRITY_GK, 'threshold', DEFAULT_CELEBRITY_THRESHOLD))
+
+    @classmethod
+    def is_celebrity(cls, user_id):
+        return FriendshipService.get_follower_count(user_id) > cls.get_celebrity_threshold()
+
+    @classmethod
+    def get_celebrity_followings_key(cls, user_id, threshold=None):
+        if threshold is None:
+            threshold = cls.get_celebrity_threshold()
+        return USER_CELEBRITY_FOLLOWINGS_PATTERN.format(user_id=user_id, threshold=threshold)
+
+    @classmethod
+    def load_followed_celebrity_ids(cls, user_id):
+        # checks the follower count of every following, only done when the set is not cached
+        following_user_ids = list(FriendshipService.get_following_user_id_set(user_id))
+        counts = FriendshipService.get_friendship_counts(following_user_ids)
+        threshold = cls.get_celebrity_threshold()
+        return [
+            following_user_id
+            for following_user_id in following_user_ids
+            if counts[following_user_id]['followers_count'] > threshold
+        ]
+
+    @classmethod
+    def get_followed_celebrity_ids(cls, user_id):
+        # the celebrities followed by user_id are cached in a redis set, which is updated by
+        # follow / unfollow and dropped for all the followers of a user crossing the threshold
+        return RedisHelper.load_id_set_through_cache(
+            cls.get_celebrity_followings_key(user_id),
+            lambda: cls.load_followed_celebrity_ids(user_id),
+        )
+
+    @classmethod
+    def handle_follow(cls, from_user_id, to_user_id):
+        # the follower count of to_user_id is already increased
+        threshold = cls.get_celebrity_threshold()
+        followers_count = FriendshipService.get_follower_count(to_user_id)
+        if followers_count <= threshold:
+            return
+        RedisHelper.add_id_to_set(cls.get_celebrity_followings_key(from_user_id, threshold), to_user_id)
+        if followers_count == threshold + 1:
+            # to_user_id just became a celebrity, the sets of the other followers do not have it
+            invalidate_celebrity_followings_task.delay(to_user_id)
+
+    @classmethod
+    def handle_unfollow(cls, from_user_id, to_user_id):
+        # the follower count of to_user_id is already decreased
+        threshold = cls.get_celebrity_threshold()
+        RedisHelper.remove_id_from_set(cls.get_celebrity_followings_key(from_user_id, threshold), to_user_id)
+        if FriendshipService.get_follower_count(to_user_id) == threshold:
+            # to_user_id is not a celebrity any more, its tweets are fanned out again
+            invalidate_celebrity_followings_task.delay(to_user_id)
+
+    @classmethod
+    def invalidate_celebrity_followings(cls, user_ids):
+        RedisHelper.invalidate_id_sets([cls.get_celebrity_followings_key(user_id) for user_id in user_ids])
+
+    @classmethod
+    def tweet_to_newsfeed(cls, user_id, tweet):
+        # an unsaved newsfeed of a pulled tweet, it is paginated and serialized like the pushed ones
         if GateKeeper.is_switch_on('switch_newsfeed_to_hbase'):
-            serializer = HBaseModelSerializer
-        else:
-            serializer = DjangoModelSerializer
-        return RedisHelper.load_objects(key, lazy_load_newsfeeds(user_id), serializer=serializer)
+            return HBaseNewsFeed(user_id=user_id, created_at=tweet.timestamp, tweet_id=tweet.id)
+        return NewsFeed(user_id=user_id, tweet_id=tweet.id, created_at=tweet.created_at)
+
+    @classmethod
+    def merge_newsfeeds(cls, sources, size=None):
+        """
+        k-way merge of lists of newsfeeds in the reverse order of created_at.
+        size is the number of objects loaded for each list (None for the whole list),
+        a list that is cut by size or by REDIS_LIST_LENGTH_LIMIT is only complete down to
+        its last object, so the merged list stops at the newest of these last objects.
+        Returns the merged newsfeeds and whether the cached lists contain all the data.
+        """
+        lower_bound = None
+        for newsfeeds in sources:
+            if not newsfeeds:
+                continue
+            if len(newsfeeds) == size or len(newsfeeds) >= settings.REDIS_LIST_LENGTH_LIMIT:
+                if lower_bound is None or newsfeeds[-1].created_at > lower_bound:
+                    lower_bound = newsfeeds[-1].created_at
+        is_complete = all(len(newsfeeds) < settings.REDIS_LIST_LENGTH_LIMIT for newsfeeds in sources)
+
+        merged_newsfeeds = []
+        for newsfeed in cls.iter_merged_newsfeeds(sources):
+            if lower_bound is not None and newsfeed.created_at < lower_bound:
+                break
+            merged_newsfeeds.append(newsfeed)
+        return merged_newsfeeds, is_complete
+
+    @classmethod
+    def iter_merged_newsfeeds(cls, sources):
+        tweet_ids = set()
+        for newsfeed in heapq.merge(*sources, key=attrgetter('created_at'), reverse=True):
+            # the tweets pushed before the author became a celebrity are also pulled
+            if newsfeed.tweet_id in tweet_ids:
+                continue
+            tweet_ids.add(newsfeed.tweet_id)
+            yield newsfeed
+
+    @classmethod
+    def get_merged_newsfeeds(cls, user_id, start=0, stop=-1):
+        """
+        The cached newsfeeds of user_id merged with the cached tweets of the celebrities
+        user_id follows, whose tweets are not fanned out.
+        Returns the newsfeeds in [start, stop] and whether the cached lists contain all the data.
+        The newsfeeds older than the cached lists are read from the database by the caller
+        and merged with the tweets of the celebrities by merge_celebrity_newsfeeds.
+        """
+        newsfeeds = cls.get_cached_newsfeeds(user_id, 0, stop)
+        celebrity_ids = cls.get_followed_celebrity_ids(user_id)
+        if not celebrity_ids:
+            return newsfeeds[start:], len(newsfeeds) < settings.REDIS_LIST_LENGTH_LIMIT
+
+        sources = [newsfeeds]
+        for celebrity_id in celebrity_ids:
+            tweets = TweetService.get_cached_tweets(celebrity_id, 0, stop)
+            sources.append([cls.tweet_to_newsfeed(user_id, tweet) for tweet in tweets])
+        size = None if stop == -1 else stop + 1
+        merged_newsfeeds, is_complete = cls.merge_newsfeeds(sources, size)
+        return merged_newsfeeds[start:], is_complete
+
+    @classmethod
+    def load_celebrity_newsfeeds(cls, user_id, celebrity_id, created_at__lt, limit):
+        tweets = Tweet.objects.filter(user_id=celebrity_id)
+        if created_at__lt is not None:
+            tweets = tweets.filter(created_at__lt=parse_created_at(created_at__lt))
+        return [
+            cls.tweet_to_newsfeed(user_id, tweet)
+            for tweet in tweets.order_by('-created_at')[:limit]
+        ]
+
+    @classmethod
+    def merge_celebrity_newsfeeds(cls, user_id, page, has_next_page, created_at__lt, page_size):
+        """
+        Merge the tweets of the celebrities user_id follows into a page older than the cached lists.
+        page is the newest page_size newsfeeds older than created_at__lt read from the database,
+        the newest page_size + 1 tweets of every celebrity are read by an index range scan each.
+        Returns the merged page and whether there is a next page.
+        """
+        celebrity_ids = cls.get_followed_celebrity_ids(user_id)
+        if not celebrity_ids:
+            return page, has_next_page
+
+        sources = [list(page)]
+        for celebrity_id in celebrity_ids:
+            newsfeeds = cls.load_celebrity_newsfeeds(user_id, celebrity_id, created_at__lt, page_size + 1)
+            has_next_page = has_next_page or len(newsfeeds) > page_size
+            sources.append(newsfeeds)
+        merged_newsfeeds = list(cls.iter_merged_newsfeeds(sources))
+        has_next_page = has_next_page or len(merged_newsfeeds) > page_size
+        return merged_newsfeeds[:page_size], has_next_page
 
     @classmethod
     def push_newsfeed_to_cache(cls, newsfeed):
         key = USER_NEWSFEEDS_PATTERN.format(user_id=newsfeed.user_id)
-        RedisHelper.push_object(key, newsfeed, lazy_load_newsfeeds(newsfeed.user_id))
+        RedisHelper.push_object(
+            key,
+            newsfeed,
+            lazy_load_newsfeeds(newsfeed.user_id),
+            serializer=cls.get_serializer(),
+        )
+
+    @classmethod
+    def push_newsfeeds_to_cache(cls, newsfeeds):
+        # one pipeline for the whole batch, the followers whose newsfeeds are not cached are skipped
+        RedisHelper.push_objects_bulk(
+            [
+                (USER_NEWSFEEDS_PATTERN.format(user_id=newsfeed.user_id), newsfeed)
+                for newsfeed in newsfeeds
+            ],
+            serializer=cls.get_serializer(),
+        )
 
     @classmethod
     def create(cls, **kwargs):
@@ -64,6 +263,5 @@ class NewsFeedService(object):
             newsfeeds = [NewsFeed(**params) for params in batch_params]
             NewsFeed.objects.bulk_create(newsfeeds)
         # bulk create 不会触发 post_save 的 signal，所以需要手动 push 到 cache 里
-        for newsfeed in newsfeeds:
-            NewsFeedService.push_newsfeed_to_cache(newsfeed)
+        cls.push_newsfeeds_to_cache(newsfeeds)
         return newsfeeds
\ No newline at end of file
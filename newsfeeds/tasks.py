@@ -37,15 +37,35 @@ def fanout_newsfeeds_main_task(tweet_id, created_at, tweet_user_id):
         created_at=created_at,
     )
 
-    # Get all follower ids, split according to batch size
-    follower_ids = FriendshipService.get_follower_ids(tweet_user_id)
-    index = 0
-    while index < len(follower_ids):
-        batch_ids = follower_ids[index: index + FANOUT_BATCH_SIZE]
+    # The followers of a celebrity pull the tweet when they read their newsfeeds
+    if NewsFeedService.is_celebrity(tweet_user_id):
+        return 'Celebrity tweet, fanout skipped.'
+
+    # Stream the follower ids in batches, so that the followers of a user with millions of followers
+    # are never loaded into memory at once
+    follower_count, batch_count = 0, 0
+    for batch_ids in FriendshipService.get_follower_id_batches(tweet_user_id, FANOUT_BATCH_SIZE):
         fanout_newsfeeds_batch_task.delay(tweet_id, created_at, batch_ids)
-        index += FANOUT_BATCH_SIZE
+        follower_count += len(batch_ids)
+        batch_count += 1
 
     return '{} newsfeeds going to fanout, {} batches created.'.format(
-        len(follower_ids),
-        (len(follower_ids) - 1) // FANOUT_BATCH_SIZE + 1,
-    )
\ No newline at end of file
+        follower_count,
+        batch_count,
+    )
+
+
+@shared_task(routing_key='default', time_limit=ONE_HOUR)
+def refresh_cached_newsfeeds_task(user_id):
+    # import is written in it to avoid circular dependencies
+    from newsfeeds.services import NewsFeedService
+    NewsFeedService.refresh_cached_newsfeeds(user_id)
+
+
+@shared_task(routing_key='default', time_limit=ONE_HOUR)
+def invalidate_celebrity_followings_task(user_id):
+    # import is written in it to avoid circular dependencies
+    from newsfeeds.services import NewsFeedService
+    # user_id crossed the celebrity threshold, the followers load their sets again on the next read
+    for batch_ids in FriendshipService.get_follower_id_batches(user_id, FANOUT_BATCH_SIZE):
+        NewsFeedService.invalidate_celebrity_followings(batch_ids)
@@ -1,3 +1,5 @@
+from friendships.services import FriendshipService
+from newsfeeds.constants import CELEBRITY_GK
 from newsfeeds.services import NewsFeedService
 from testing.testcases import TestCase
 from twitter.cache import USER_NEWSFEEDS_PATTERN
@@ -51,6 +53,62 @@ class NewsFeedServiceTests(TestCase):
         feeds = NewsFeedService.get_cached_newsfeeds(self.wl.id)
         self.assertEqual([f.created_at for f in feeds], [feed2.created_at, feed1.created_at])
 
+    def test_merge_newsfeeds(self):
+        sources = [
+            [HBaseNewsFeed(user_id=1, created_at=ts, tweet_id=ts) for ts in [9, 6, 3]],
+            [HBaseNewsFeed(user_id=1, created_at=ts, tweet_id=ts) for ts in [8, 7, 6]],
+            [],
+        ]
+        newsfeeds, is_complete = NewsFeedService.merge_newsfeeds(sources)
+        self.assertEqual([f.created_at for f in newsfeeds], [9, 8, 7, 6, 3])
+        self.assertEqual(is_complete, True)
+
+        # the second list is cut at 6, what is older than 6 may be missing
+        newsfeeds, is_complete = NewsFeedService.merge_newsfeeds(sources, size=3)
+        self.assertEqual([f.created_at for f in newsfeeds], [9, 8, 7, 6])
+
+    def test_get_merged_newsfeeds(self):
+        GateKeeper.set_kv(CELEBRITY_GK, 'threshold', 0)
+        self.create_friendship(self.wl, self.wl_hsu)
+        celebrity_tweet = self.create_tweet(self.wl_hsu)
+        self.create_newsfeed(self.wl, self.create_tweet(self.wl))
+        self.create_tweet(self.wl_hsu)
+
+        newsfeeds, is_complete = NewsFeedService.get_merged_newsfeeds(self.wl.id)
+        self.assertEqual(len(newsfeeds), 3)
+        self.assertEqual(is_complete, True)
+        self.assertEqual(newsfeeds[2].tweet_id, celebrity_tweet.id)
+
+        newsfeeds, _ = NewsFeedService.get_merged_newsfeeds(self.wl.id, 0, 0)
+        self.assertEqual(len(newsfeeds), 1)
+
+    def test_get_followed_celebrity_ids(self):
+        GateKeeper.set_kv(CELEBRITY_GK, 'threshold', 1)
+        celebrity = self.create_user('celebrity')
+        for i in range(2):
+            self.create_friendship(self.create_user('follower{}'.format(i)), celebrity)
+        self.create_friendship(self.wl, self.wl_hsu)
+        self.assertEqual(NewsFeedService.get_followed_celebrity_ids(self.wl.id), set())
+
+        # follow / unfollow update the cached set
+        conn = RedisClient.get_connection()
+        key = NewsFeedService.get_celebrity_followings_key(self.wl.id)
+        self.create_friendship(self.wl, celebrity)
+        self.assertEqual(conn.sismember(key, celebrity.id), True)
+        self.assertEqual(NewsFeedService.get_followed_celebrity_ids(self.wl.id), {celebrity.id})
+        FriendshipService.unfollow(self.wl.id, celebrity.id)
+        self.assertEqual(NewsFeedService.get_followed_celebrity_ids(self.wl.id), set())
+
+        # wl_hsu becomes a celebrity, the sets of its followers are loaded again
+        self.create_friendship(celebrity, self.wl_hsu)
+        self.assertEqual(conn.exists(key), 0)
+        self.assertEqual(NewsFeedService.get_followed_celebrity_ids(self.wl.id), {self.wl_hsu.id})
+
+        # the sets of the old threshold are not read
+        GateKeeper.set_kv(CELEBRITY_GK, 'threshold', 2)
+        self.assertEqual(NewsFeedService.get_followed_celebrity_ids(self.wl.id), set())
+
+
 
 class NewsFeedTaskTests(TestCase):
 
@@ -99,4 +157,15 @@ class NewsFeedTaskTests(TestCase):
             cached_list = NewsFeedService.get_cached_newsfeeds(self.wl.id)
             self.assertEqual(len(cached_list), 3)
             cached_list = NewsFeedService.get_cached_newsfeeds(self.wl_hsu.id)
-            self.assertEqual(len(cached_list), 3)
\ No newline at end of file
+            self.assertEqual(len(cached_list), 3)
+
+        def test_fanout_celebrity(self):
+            self.create_friendship(self.wl_hsu, self.wl)
+            GateKeeper.set_kv(CELEBRITY_GK, 'threshold', 0)
+            tweet = self.create_tweet(self.wl, 'celebrity tweet')
+            msg = fanout_newsfeeds_main_task(tweet.id, tweet.timestamp, self.wl.id)
+            self.assertEqual(msg, 'Celebrity tweet, fanout skipped.')
+            self.assertEqual(len(NewsFeedService.get_cached_newsfeeds(self.wl.id)), 1)
+            self.assertEqual(len(NewsFeedService.get_cached_newsfeeds(self.wl_hsu.id)), 0)
+            newsfeeds, _ = NewsFeedService.get_merged_newsfeeds(self.wl_hsu.id)
+            self.assertEqual([f.tweet_id for f in newsfeeds], [tweet.id])
\ No newline at end of file
@@ -1,17 +1,39 @@
 from accounts.api.serializers import UserSerializerForTweet
 from comments.api.serializers import CommentSerializer
+from comments.services import CommentService
+from django.contrib.auth.models import User
+from django.db import models
 from likes.api.serializers import LikeSerializer
 from likes.services import LikeService
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
-from tweets.constants import TWEET_PHOTOS_UPLOAD_LIMIT
+from tweets.constants import TWEET_COUNT_ATTRS, TWEET_PHOTOS_UPLOAD_LIMIT
 from tweets.models import Tweet
 from tweets.services import TweetService
+from utils.memcached_helper import MemcachedHelper
+from utils.paginations import EndlessPagination
 from utils.redis_helper import RedisHelper
 
 
+class TweetListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        tweets = list(data.all() if isinstance(data, models.Manager) else data)
+        # load all the users of this page through one memcached round trip
+        MemcachedHelper.prefetch_objects(
+            self.context,
+            User,
+            [tweet.user_id for tweet in tweets],
+        )
+        # load all the counters of this page through one redis round trip
+        RedisHelper.prefetch_counts(self.context, tweets, TWEET_COUNT_ATTRS)
+        # whether the request user liked the tweets of this page, in one redis round trip
+        LikeService.prefetch_liked_object_ids(self.context, Tweet, tweets)
+        return super(TweetListSerializer, self).to_representation(tweets)
+
+
 class TweetSerializer(serializers.ModelSerializer):
-    user = UserSerializerForTweet(source='cached_user')
+    user = serializers.SerializerMethodField()
     comments_count = serializers.SerializerMethodField()
     likes_count = serializers.SerializerMethodField()
     has_liked = serializers.SerializerMethodField()
@@ -29,15 +51,23 @@ class TweetSerializer(serializers.ModelSerializer):
             'has_liked',
             'photo_urls',
         )
+        list_serializer_class = TweetListSerializer
+
+    def get_user(self, obj):
+        user = MemcachedHelper.get_object_from_context(self.context, User, obj.user_id)
+        # the user can be deleted, the tweet is kept with user SET_NULL
+        if user is None:
+            return None
+        return UserSerializerForTweet(user).data
 
     def get_likes_count(self, obj):
-        return RedisHelper.get_count(obj, 'likes_count')
+        return RedisHelper.get_count_from_context(self.context, obj, 'likes_count')
 
     def get_comments_count(self, obj):
-        return RedisHelper.get_count(obj, 'comments_count')
+        return RedisHelper.get_count_from_context(self.context, obj, 'comments_count')
 
     def get_has_liked(self, obj):
-        return LikeService.has_liked(self.context['request'].user, obj)
+        return LikeService.has_liked_from_context(self.context, obj)
 
     def get_photo_urls(self, obj):
         photo_urls = []
@@ -48,8 +78,8 @@ class TweetSerializer(serializers.ModelSerializer):
 
 class TweetSerializerForDetail(TweetSerializer):
 
-    comments = CommentSerializer(source='comment_set', many=True)
-    likes = LikeSerializer(source='like_set', many=True)
+    comments = serializers.SerializerMethodField()
+    likes = serializers.SerializerMethodField()
 
     class Meta:
         model = Tweet
@@ -67,6 +97,17 @@ class TweetSerializerForDetail(TweetSerializer):
             'photo_urls',
         )
 
+    def get_comments(self, obj):
+        # only the first page (newest first) from the cached comments of the tweet,
+        # the next pages are loaded by the comment list api
+        comments = CommentService.get_cached_comments(obj.id, 0, EndlessPagination.page_size - 1)
+        return CommentSerializer(comments, context=self.context, many=True).data
+
+    def get_likes(self, obj):
+        # only the newest page of likes, likes_count has the total
+        likes = obj.like_set[:EndlessPagination.page_size]
+        return LikeSerializer(likes, context=self.context, many=True).data
+
 
 class TweetSerializerForCreate(serializers.ModelSerializer):
     content = serializers.CharField(min_length=6, max_length=140)
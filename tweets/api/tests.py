@@ -1,4 +1,6 @@
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APIClient
 from testing.testcases import TestCase
 from tweets.models import Tweet, TweetPhoto
@@ -46,6 +48,18 @@ class TweetApiTests(TestCase):
         self.assertEqual(response.data['results'][0]['id'], self.tweets2[1].id)
         self.assertEqual(response.data['results'][1]['id'], self.tweets2[0].id)
 
+    def test_list_api_queries(self):
+        self.create_like(self.user1, self.tweets1[0])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.user1_client.get(TWEET_LIST_API, {'user_id': self.user1.id})
+        self.assertEqual(
+            [tweet['has_liked'] for tweet in response.data['results']],
+            [False, False, True],
+        )
+        # has_liked of the whole page is loaded in one query
+        like_queries = [query for query in queries if 'likes_like' in query['sql']]
+        self.assertEqual(len(like_queries), 1)
+
     def test_create_api(self):
         # must login
         response = self.anonymous_client.post(TWEET_CREATE_API)
@@ -40,7 +40,8 @@ class TweetViewSet(viewsets.GenericViewSet):
     def list(self, request, *args, **kwargs):
         user_id = request.query_params['user_id']
         tweets = Tweet.objects.filter(user_id=user_id).prefetch_related('user')
-        cached_tweets = TweetService.get_cached_tweets(user_id)
+        start, stop = self.paginator.get_cached_list_window(request)
+        cached_tweets = TweetService.get_cached_tweets(user_id, start, stop)
         page = self.paginator.paginate_cached_list(cached_tweets, request)
         if page is None:
             # This query will be translated as
@@ -10,4 +10,6 @@ TWEET_PHOTO_STATUS_CHOICES = (
     (TweetPhotoStatus.REJECTED, 'Rejected'),
 )
 
-TWEET_PHOTOS_UPLOAD_LIMIT = 9
\ No newline at end of file
+TWEET_PHOTOS_UPLOAD_LIMIT = 9
+# the redis counters of a tweet, prefetched for a page of tweets
+TWEET_COUNT_ATTRS = ('likes_count', 'comments_count')
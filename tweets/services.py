@@ -2,6 +2,7 @@ from tweets.models import TweetPhoto
 from twitter.cache import USER_TWEETS_PATTERN
 from utils.redis_helper import RedisHelper
 from tweets.models import Tweet
+from tweets.tasks import refresh_cached_tweets_task
 
 def lazy_load_tweets(user_id):
     def _lazy_load(limit):
@@ -24,11 +25,32 @@ class TweetService(object):
         TweetPhoto.objects.bulk_create(photos)
 
     @classmethod
-    def get_cached_tweets(cls, user_id):
+    def get_serializer(cls):
+        return RedisHelper.get_serializer(USER_TWEETS_PATTERN)
+
+    @classmethod
+    def get_cached_tweets(cls, user_id, start=0, stop=-1):
+        key = USER_TWEETS_PATTERN.format(user_id=user_id)
+        return RedisHelper.load_objects_through_cache(
+            key,
+            lazy_load_tweets(user_id),
+            serializer=cls.get_serializer(),
+            start=start,
+            stop=stop,
+            refresh=lambda: refresh_cached_tweets_task.delay(user_id),
+        )
+
+    @classmethod
+    def refresh_cached_tweets(cls, user_id):
         key = USER_TWEETS_PATTERN.format(user_id=user_id)
-        return RedisHelper.load_objects(key, lazy_load_tweets(user_id))
+        RedisHelper.refresh_objects_in_cache(key, lazy_load_tweets(user_id), cls.get_serializer())
 
     @classmethod
     def push_tweet_to_cache(cls, tweet):
         key = USER_TWEETS_PATTERN.format(user_id=tweet.user_id)
-        RedisHelper.push_object(key, tweet, lazy_load_tweets(tweet.user_id))
\ No newline at end of file
+        RedisHelper.push_object(
+            key,
+            tweet,
+            lazy_load_tweets(tweet.user_id),
+            serializer=cls.get_serializer(),
+        )
\ No newline at end of file
@@ -0,0 +1,9 @@
+from celery import shared_task
+from utils.time_constants import ONE_HOUR
+
+
+@shared_task(routing_key='default', time_limit=ONE_HOUR)
+def refresh_cached_tweets_task(user_id):
+    # import is written in it to avoid circular dependencies
+    from tweets.services import TweetService
+    TweetService.refresh_cached_tweets(user_id)
@@ -1,5 +1,11 @@
-FOLLOWINGS_PATTERN = 'followings:{user_id}'
 USER_PROFILE_PATTERN = 'userprofile:{user_id}'
 # redis
 USER_TWEETS_PATTERN = 'user_tweets:{user_id}'
-USER_NEWSFEEDS_PATTERN = 'user_newsfeeds:{user_id}'
\ No newline at end of file
+USER_NEWSFEEDS_PATTERN = 'user_newsfeeds:{user_id}'
+USER_FOLLOWINGS_PATTERN = 'user_followings:{user_id}'
+# the threshold is a part of the key, the sets are loaded again when it changes
+USER_CELEBRITY_FOLLOWINGS_PATTERN = 'user_celebrity_followings:{user_id}:{threshold}'
+USER_FOLLOWINGS_COUNT_PATTERN = 'user_followings_count:{user_id}'
+USER_FOLLOWERS_COUNT_PATTERN = 'user_followers_count:{user_id}'
+USER_LIKES_PATTERN = 'user_likes:{user_id}'
+TWEET_COMMENTS_PATTERN = 'tweet_comments:{tweet_id}'
@@ -1,6 +1,8 @@
 import os
 
 from celery import Celery
+from celery.signals import task_postrun, task_prerun
+from utils.request_cache import RequestCache
 
 # set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'twitter.settings')
@@ -19,4 +21,15 @@ app.autodiscover_tasks()
 
 @app.task(bind=True)
 def debug_task(self):
-    print(f'Request: {self.request!r}')
\ No newline at end of file
+    print(f'Request: {self.request!r}')
+
+
+@task_prerun.connect
+def open_request_cache(task_id=None, **kwargs):
+    # every task gets its own request scoped memo, like a request does
+    RequestCache.open_task_scope(task_id)
+
+
+@task_postrun.connect
+def close_request_cache(task_id=None, **kwargs):
+    RequestCache.close_task_scope(task_id)
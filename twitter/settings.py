@@ -47,6 +47,7 @@ INSTALLED_APPS = [
     'notifications',
 
     # project apps
+    'django_hbase',
     'accounts',
     'tweets',
     'friendships',
@@ -68,6 +69,8 @@ REST_FRAMEWORK = {
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # opens the request scoped memo of the services, see utils.request_cache
+    'utils.request_cache.RequestCacheMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -113,6 +116,16 @@ DATABASES = {
 
 # HBase Database
 HBASE_HOST = 'hbase'
+# happybase connections are not thread-safe, every thread checks out one from the pool
+HBASE_POOL_SIZE = 10
+# seconds to wait for a free connection in the pool
+HBASE_POOL_TIMEOUT = 5
+# thrift socket timeout in milliseconds
+HBASE_CONNECTION_TIMEOUT = 10000
+# opt in to another row key codec per HBaseModel, overriding the codec options of its Meta, e.g.
+# {'HBaseNewsFeed': {'row_key_codec': 'binary', 'dual_read_row_key_codec': 'string'}}
+# an existing table is migrated by python manage.py rewrite_hbase_row_keys, see README
+HBASE_ROW_KEY_CODECS = {}
 
 
 
@@ -192,8 +205,56 @@ CACHES = {
 REDIS_HOST = 'redis'
 REDIS_PORT = 6379
 REDIS_DB = 0 if TESTING else 1
+REDIS_POOL_SIZE = 50
+# seconds to wait for a free connection in the pool
+REDIS_POOL_TIMEOUT = 5
+REDIS_SOCKET_TIMEOUT = 5
+# connections idle for more than this many seconds are pinged before being used
+REDIS_HEALTH_CHECK_INTERVAL = 30
 REDIS_KEY_EXPIRE_TIME = 7 * 86400  # in seconds
 REDIS_LIST_LENGTH_LIMIT = 1000 if not TESTING else 20
+# number of the most recent likes of a user kept in redis
+REDIS_LIKES_LENGTH_LIMIT = 1000 if not TESTING else 5
+# milliseconds a loader holds the lock to fill a cached list from the database
+REDIS_FILL_LOCK_TIMEOUT = 5000
+# seconds a loader waits for the lock holder to fill a cached list before loading it by itself
+REDIS_FILL_WAIT_TIMEOUT = 0.2
+REDIS_FILL_WAIT_INTERVAL = 0.02
+# The ttl of every cached key is spread by +/- this ratio
+CACHE_EXPIRE_JITTER = 0.1
+# XFetch early recompute, the larger the earlier, 0 turns it off
+CACHE_XFETCH_BETA = 1.0
+# An early recomputed list keeps being served while a celery task refreshes it,
+# otherwise the request that triggers the recompute reloads the list by itself
+REDIS_STALE_WHILE_REVALIDATE = True
+# seconds between two scheduled refreshes of the same list
+REDIS_REFRESH_INTERVAL = 30
+# seconds a process trusts its snapshot of the gatekeepers before checking the version key,
+# 0 in testing so that the gatekeepers flushed with redis are seen right away
+GATEKEEPER_SNAPSHOT_TTL = 1 if not TESTING else 0
+# seconds memcached remembers that an object does not exist, the creation of the object
+# deletes it right away, this only bounds how long a missed deletion lasts
+MEMCACHED_TOMBSTONE_TIMEOUT = 60
+# in process LRU in front of memcached for the hot objects, see utils/local_cache.py.
+# Off in testing, the tests clear memcached and expect the objects to be reloaded
+LOCAL_CACHE_ENABLED = not TESTING
+# seconds an object is kept in process, it bounds how long a missed invalidation is served
+LOCAL_CACHE_TTL = 5
+# model name => max number of objects kept in process, the other models are not kept
+LOCAL_CACHE_SIZES = {
+    'User': 10000,
+    'UserProfile': 10000,
+    'Tweet': 10000,
+}
+# Serializers of the cached lists in redis, keyed by the key patterns in twitter/cache.py.
+# The compact serializer can still read the data cached by DjangoModelSerializer,
+# so a key pattern can be switched without flushing redis.
+# Key patterns not listed here use DjangoModelSerializer
+REDIS_LIST_SERIALIZERS = {
+    'user_tweets:{user_id}': 'utils.redis_serializers.DjangoModelCompactSerializer',
+    'user_newsfeeds:{user_id}': 'utils.redis_serializers.DjangoModelCompactSerializer',
+    'tweet_comments:{tweet_id}': 'utils.redis_serializers.DjangoModelCompactSerializer',
+}
 
 # Celery Configuration Options
 # Use the following command to run the worker process (a process that only executes asynchronous tasks,
@@ -206,6 +267,13 @@ CELERY_QUEUES = (
     Queue('default', routing_key='default'),
     Queue('newsfeeds', routing_key='newsfeeds'),
 )
+# periodic tasks, run the scheduler by celery -A twitter beat -l INFO
+CELERY_BEAT_SCHEDULE = {
+    'reconcile-friendship-counts': {
+        'task': 'friendships.tasks.reconcile_friendship_counts_task',
+        'schedule': 24 * 60 * 60,  # in seconds
+    },
+}
 
 
 # Rate Limiter
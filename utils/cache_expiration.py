@@ -0,0 +1,46 @@
+"""
+Expiration helpers shared by RedisHelper and MemcachedHelper
+ - jitter: the keys created together (a fanout, a page of objects) do not expire together
+ - XFetch probabilistic early recompute (Vattani et al., Optimal Probabilistic Cache Stampede Prevention):
+   a key is recomputed before it expires with a probability growing as the expiration gets closer,
+   scaled by delta, the time it took to compute the value last time
+"""
+from django.conf import settings
+
+import math
+import random
+import time
+
+
+def jitter(expire_time):
+    spread = expire_time * settings.CACHE_EXPIRE_JITTER
+    return int(expire_time + random.uniform(-spread, spread))
+
+
+def should_recompute_early(ttl, delta):
+    # ttl and delta are in the same unit, recompute when delta * beta * -ln(rand) >= ttl
+    if not ttl or ttl <= 0 or not delta:
+        return False
+    # 1 - random() is in (0, 1], log(0) is not defined
+    return delta * settings.CACHE_XFETCH_BETA * -math.log(1 - random.random()) >= ttl
+
+
+class CachedValue:
+    """
+    A value cached in memcached with what XFetch needs, memcached does not return the ttl of a key
+    """
+    __slots__ = ('value', 'expire_at', 'delta')
+
+    def __init__(self, value, expire_time, delta):
+        self.value = value
+        self.expire_at = time.time() + expire_time
+        self.delta = delta
+
+    def __getstate__(self):
+        return self.value, self.expire_at, self.delta
+
+    def __setstate__(self, state):
+        self.value, self.expire_at, self.delta = state
+
+    def should_recompute_early(self):
+        return should_recompute_early(self.expire_at - time.time(), self.delta)
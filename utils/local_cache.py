@@ -0,0 +1,174 @@
+from collections import OrderedDict
+from django.conf import settings
+from utils.redis_client import RedisClient
+
+import copy
+import json
+import redis
+import threading
+import time
+
+# the processes publish the keys they invalidate on this redis channel
+LOCAL_CACHE_CHANNEL = 'local_cache_invalidation'
+
+
+class LocalCache:
+    """
+    Bounded in process LRU with a TTL, one per cached model (see settings.LOCAL_CACHE_SIZES).
+    It sits in front of memcached for the hot objects, the objects deleted in memcached by
+    any process are deleted here through LOCAL_CACHE_CHANNEL, the TTL bounds how long a
+    missed invalidation can be served.
+    """
+    # name => LocalCache
+    caches = {}
+    caches_lock = threading.Lock()
+
+    def __init__(self, name, max_size, ttl):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        # key => (expire_at, value), the least recently used first
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def is_enabled(cls, name):
+        return settings.LOCAL_CACHE_ENABLED and name in settings.LOCAL_CACHE_SIZES
+
+    @classmethod
+    def get_cache(cls, name):
+        # None if the objects of name are not cached in process
+        if not cls.is_enabled(name):
+            return None
+        local_cache = cls.caches.get(name)
+        if local_cache is not None:
+            return local_cache
+        with cls.caches_lock:
+            if name not in cls.caches:
+                cls.caches[name] = LocalCache(
+                    name,
+                    settings.LOCAL_CACHE_SIZES[name],
+                    settings.LOCAL_CACHE_TTL,
+                )
+        LocalCacheInvalidator.ensure_listening()
+        return cls.caches[name]
+
+    def get(self, key):
+        # returns (hit, value)
+        with self.lock:
+            item = self.items.get(key)
+            if item is None or item[0] <= time.monotonic():
+                self.misses += 1
+                return False, None
+            self.items.move_to_end(key)
+            self.hits += 1
+            return True, item[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.items[key] = (time.monotonic() + self.ttl, value)
+            self.items.move_to_end(key)
+            while len(self.items) > self.max_size:
+                self.items.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.items.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+    def get_metrics(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0,
+                'size': len(self.items),
+            }
+
+    @classmethod
+    def get_all_metrics(cls):
+        return {name: local_cache.get_metrics() for name, local_cache in list(cls.caches.items())}
+
+    @classmethod
+    def clear_all(cls):
+        for local_cache in list(cls.caches.values()):
+            local_cache.clear()
+
+    @classmethod
+    def invalidate(cls, name, key):
+        # delete the key in this process and tell the other processes to do the same
+        local_cache = cls.get_cache(name)
+        if local_cache is None:
+            return
+        local_cache.delete(key)
+        RedisClient.get_connection().publish(LOCAL_CACHE_CHANNEL, json.dumps([name, key]))
+
+
+class LocalCacheInvalidator:
+    """
+    A daemon thread per process subscribed to LOCAL_CACHE_CHANNEL. It is started by the first
+    local cache of the process, so a forked worker starts its own. The messages published while
+    it is not subscribed are lost, so every (re)subscription clears the local caches.
+    """
+    thread = None
+    lock = threading.Lock()
+    # set while the channel is subscribed
+    subscribed = threading.Event()
+    # seconds to wait before subscribing again after a redis error
+    retry_interval = 1
+    # seconds to wait for a message in one poll of the channel
+    poll_timeout = 1
+
+    @classmethod
+    def ensure_listening(cls):
+        if cls.thread is not None and cls.thread.is_alive():
+            return
+        with cls.lock:
+            if cls.thread is not None and cls.thread.is_alive():
+                return
+            cls.thread = threading.Thread(target=cls.listen, name='local-cache-invalidator', daemon=True)
+            cls.thread.start()
+
+    @classmethod
+    def handle_message(cls, data):
+        name, key = json.loads(data)
+        local_cache = LocalCache.caches.get(name)
+        if local_cache is not None:
+            local_cache.delete(key)
+
+    @classmethod
+    def listen(cls):
+        while True:
+            pubsub = RedisClient.get_connection().pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(LOCAL_CACHE_CHANNEL)
+                LocalCache.clear_all()
+                cls.subscribed.set()
+                while True:
+                    # listen() would raise on the socket timeout of an idle channel
+                    message = pubsub.get_message(timeout=cls.poll_timeout)
+                    if message is not None:
+                        cls.handle_message(message['data'])
+            except redis.RedisError:
+                # the invalidations can be missed until the channel is subscribed again
+                cls.subscribed.clear()
+                LocalCache.clear_all()
+                time.sleep(cls.retry_interval)
+            finally:
+                # gives the connection back to the pool
+                pubsub.close()
+
+
+def copy_instance(instance):
+    # the instances in a local cache are shared by the threads of the process,
+    # every caller gets its own copy, which is much cheaper than unpickling it
+    copied = copy.copy(instance)
+    copied._state = copy.copy(instance._state)
+    copied._state.fields_cache = {}
+    return copied
@@ -1,7 +1,23 @@
 from django.conf import settings
 from django.core.cache import caches
+from utils.cache_expiration import CachedValue, jitter
+from utils.local_cache import LocalCache, copy_instance
+from utils.request_cache import RequestCache
+from utils.single_flight import SingleFlight
+
+import time
 
 cache = caches['testing'] if settings.TESTING else caches['default']
+# namespace of the objects in the request scoped memo, see utils.request_cache
+MEMO_NAMESPACE = 'memcached'
+
+
+class Tombstone:
+    """
+    Cached for MEMCACHED_TOMBSTONE_TIMEOUT seconds in place of an id that does not exist
+    (a deleted object, a stale newsfeed or a scraper), so that it does not hit the database again
+    """
+    pass
 
 
 class MemcachedHelper:
@@ -10,21 +26,183 @@ class MemcachedHelper:
     def get_key(cls, model_class, object_id):
         return '{}:{}'.format(model_class.__name__, object_id)
 
+    @classmethod
+    def get_expire_time(cls):
+        # the default expire time jittered, so that the objects cached together do not expire together
+        return jitter(cache.default_timeout)
+
+    @classmethod
+    def unwrap(cls, value):
+        # returns the cached object and whether it should be recomputed early,
+        # the objects cached before CachedValue was used are returned as they are
+        if isinstance(value, CachedValue):
+            return value.value, value.should_recompute_early()
+        return value, False
+
     @classmethod
     def get_object_through_cache(cls, model_class, object_id):
+        # an object is fetched at most once per request, None if it does not exist
+        key = cls.get_key(model_class, object_id)
+        return RequestCache.get_or_load(
+            MEMO_NAMESPACE,
+            key,
+            lambda: cls._get_object_through_cache(model_class, object_id),
+        )
+
+    @classmethod
+    def _get_object_through_cache(cls, model_class, object_id):
+        key = cls.get_key(model_class, object_id)
+        # the hot models are kept in process in front of memcached, see utils.local_cache
+        local_cache = LocalCache.get_cache(model_class.__name__)
+        if local_cache is None:
+            return cls._get_object_through_memcached(model_class, object_id)
+        hit, obj = local_cache.get(key)
+        if hit:
+            return copy_instance(obj)
+        obj = cls._get_object_through_memcached(model_class, object_id)
+        # the missing ones are left to the tombstones in memcached
+        if obj is not None:
+            local_cache.set(key, copy_instance(obj))
+        return obj
+
+    @classmethod
+    def _get_object_through_memcached(cls, model_class, object_id):
         key = cls.get_key(model_class, object_id)
+        if object_id is None:
+            # e.g. the user of a tweet is SET_NULL
+            return None
         # cache hit
-        obj = cache.get(key)
-        if obj:
+        obj, recompute_early = cls.unwrap(cache.get(key))
+        if isinstance(obj, Tombstone):
+            return None
+        if obj and not recompute_early:
             return obj
 
-        # cache miss
-        obj = model_class.objects.get(id=object_id)
-        # using default expire time
-        cache.set(key, obj)
+        # cache miss or early recompute, the concurrent loads of a hot object in this process share one query
+        return SingleFlight.do(key, lambda: cls._load_object_to_cache(model_class, object_id))
+
+    @classmethod
+    def _load_object_to_cache(cls, model_class, object_id):
+        start = time.monotonic()
+        obj = model_class.objects.filter(id=object_id).first()
+        delta = time.monotonic() - start
+        if obj is None:
+            cache.set(cls.get_key(model_class, object_id), Tombstone(), settings.MEMCACHED_TOMBSTONE_TIMEOUT)
+            return None
+        expire_time = cls.get_expire_time()
+        cache.set(cls.get_key(model_class, object_id), CachedValue(obj, expire_time, delta), expire_time)
         return obj
 
+    @classmethod
+    def get_objects_through_cache(cls, model_class, object_ids):
+        """
+        Bulk version of get_object_through_cache, costs one get_many round trip to memcached,
+        plus one id__in query and one set_many round trip for the cache misses.
+        The returned list keeps the order of object_ids, ids that can not be found are None,
+        they are cached as tombstones and are not queried again until the tombstones expire
+        """
+        keys = [cls.get_key(model_class, object_id) for object_id in object_ids]
+        # the objects already fetched by this request
+        memo = RequestCache.get_namespace(MEMO_NAMESPACE)
+        cached_objects = {}
+        if memo is not None:
+            cached_objects = {key: memo[key] for key in keys if key in memo}
+
+        # the objects kept in process
+        local_cache = LocalCache.get_cache(model_class.__name__)
+        if local_cache is not None:
+            for key in keys:
+                if key in cached_objects:
+                    continue
+                hit, obj = local_cache.get(key)
+                if hit:
+                    cached_objects[key] = copy_instance(obj)
+        # the objects found in the memo or in process are not put in the local cache again
+        local_keys = set(cached_objects)
+
+        # cache hit, the ids known not to exist are not queried again
+        tombstone_keys = set()
+        missing_keys = [key for key in keys if key not in cached_objects]
+        if missing_keys:
+            for key, value in cache.get_many(missing_keys).items():
+                obj, recompute_early = cls.unwrap(value)
+                if isinstance(obj, Tombstone):
+                    tombstone_keys.add(key)
+                elif obj and not recompute_early:
+                    cached_objects[key] = obj
+
+        # cache miss, load all missing objects in one query
+        missing_ids = set(
+            object_id
+            for object_id, key in zip(object_ids, keys)
+            if key not in cached_objects and key not in tombstone_keys and object_id is not None
+        )
+        if missing_ids:
+            start = time.monotonic()
+            objects_to_cache = {
+                cls.get_key(model_class, obj.id): obj
+                for obj in model_class.objects.filter(id__in=missing_ids)
+            }
+            delta = time.monotonic() - start
+            # set_many takes one expire time for the whole batch
+            expire_time = cls.get_expire_time()
+            cache.set_many(
+                {
+                    key: CachedValue(obj, expire_time, delta)
+                    for key, obj in objects_to_cache.items()
+                },
+                expire_time,
+            )
+            cached_objects.update(objects_to_cache)
+            not_found_keys = [
+                cls.get_key(model_class, object_id)
+                for object_id in missing_ids
+                if cls.get_key(model_class, object_id) not in objects_to_cache
+            ]
+            if not_found_keys:
+                cache.set_many(
+                    {key: Tombstone() for key in not_found_keys},
+                    settings.MEMCACHED_TOMBSTONE_TIMEOUT,
+                )
+
+        if local_cache is not None:
+            for key, obj in cached_objects.items():
+                if key not in local_keys:
+                    local_cache.set(key, copy_instance(obj))
+        if memo is not None:
+            memo.update(cached_objects)
+            # the ones that do not exist are remembered as None
+            memo.update((key, None) for key in keys if key not in cached_objects)
+        return [cached_objects.get(key) for key in keys]
+
+    @classmethod
+    def get_context_key(cls, model_class):
+        return 'prefetched:{}'.format(model_class.__name__)
+
+    @classmethod
+    def prefetch_objects(cls, context, model_class, object_ids):
+        """
+        List serializers call this once per page to load all objects the page needs,
+        the objects are kept in the serializer context so that every row can take them out
+        without going to memcached again
+        """
+        objects = cls.get_objects_through_cache(model_class, object_ids)
+        prefetched = context.setdefault(cls.get_context_key(model_class), {})
+        # the ids that do not exist are kept as None, the rows skip them without asking again
+        for object_id, obj in zip(object_ids, objects):
+            prefetched[object_id] = obj
+        return objects
+
+    @classmethod
+    def get_object_from_context(cls, context, model_class, object_id):
+        prefetched = context.get(cls.get_context_key(model_class), {})
+        if object_id in prefetched:
+            return prefetched[object_id]
+        return cls.get_object_through_cache(model_class, object_id)
+
     @classmethod
     def invalidate_cached_object(cls, model_class, object_id):
         key = cls.get_key(model_class, object_id)
-        cache.delete(key)
\ No newline at end of file
+        cache.delete(key)
+        RequestCache.delete(MEMO_NAMESPACE, key)
+        LocalCache.invalidate(model_class.__name__, key)
@@ -46,11 +46,12 @@ class EndlessPagination(BasePagination):
             # created_at__gt 用于下拉刷新的时候加载最新的内容进来
             # 为了简便起见，下拉刷新不做翻页机制，直接加载所有更新的数据
             # 因为如果数据很久没有更新的话，不会采用下拉刷新的方式进行更新，而是重新加载最新的数据
-            created_at__gt = request.query_params['created_at__gt']
+            # the binary row key packs the timestamp as an int
+            created_at__gt = int(request.query_params['created_at__gt'])
             start = (*row_key_prefix, created_at__gt)
             stop = (*row_key_prefix, MAX_TIMESTAMP)
             objects = hb_model.filter(start=start, stop=stop)
-            if len(objects) and objects[0].created_at == int(created_at__gt):
+            if len(objects) and objects[0].created_at == created_at__gt:
                 objects = objects[:0:-1]
             else:
                 objects = objects[::-1]
@@ -63,11 +64,11 @@ class EndlessPagination(BasePagination):
             # 比如目前的 timestamp 列表是 [1, 2, 3, 4, 5, 6, 7, 8, 9, 10] 如果 created_at__lt=5, page_size = 2
             # 则应该返回 [4, 3, 2]，多返回一个 object 的原因是为了判断是否还有下一页从而减少一次空加载。
             # 由于 hbase 只支持 <= 的查询而不支持 <, 因此我们还需要再多取一个 item 保证 < 的 item 有 page_size + 1 个
-            created_at__lt = request.query_params['created_at__lt']
+            created_at__lt = int(request.query_params['created_at__lt'])
             start = (*row_key_prefix, created_at__lt)
             stop = (*row_key_prefix, None)
             objects = hb_model.filter(start=start, stop=stop, limit=self.page_size + 2, reverse=True)
-            if len(objects) and objects[0].created_at == int(created_at__lt):
+            if len(objects) and objects[0].created_at == created_at__lt:
                 objects = objects[1:]
             if len(objects) > self.page_size:
                 self.has_next_page = True
@@ -125,7 +126,20 @@ class EndlessPagination(BasePagination):
         self.has_next_page = len(reverse_ordered_list) > index + self.page_size
         return reverse_ordered_list[index: index + self.page_size]
 
-    def paginate_cached_list(self, cached_list, request):
+    def get_cached_list_window(self, request):
+        """
+        The [start, stop] range of the cached list needed by paginate_cached_list.
+        Loading the first page only needs the first page_size + 1 objects (one more to know
+        whether there is a next page), created_at__gt / created_at__lt need to search
+        the whole list for the position of created_at.
+        """
+        if 'created_at__gt' in request.query_params:
+            return 0, -1
+        if 'created_at__lt' in request.query_params:
+            return 0, -1
+        return 0, self.page_size
+
+    def paginate_cached_list(self, cached_list, request, is_complete=None):
         paginated_list = self.paginate_ordered_list(cached_list, request)
         # If it is a page up, paginated_list contains all the latest data, return directly
         if 'created_at__gt' in request.query_params:
@@ -136,7 +150,11 @@ class EndlessPagination(BasePagination):
             return paginated_list
         # If the length of the cached_list is less than the maximum limit,
         # it means that the cached_list already contains all the data
-        if len(cached_list) < settings.REDIS_LIST_LENGTH_LIMIT:
+        # (a window from get_cached_list_window that is not full is the whole cached list)
+        # is_complete is given when cached_list is merged from several cached lists
+        if is_complete is None:
+            is_complete = len(cached_list) < settings.REDIS_LIST_LENGTH_LIMIT
+        if is_complete:
             return paginated_list
         # If enter here, it means that there may be data in the database that is not loaded in the cache,
         # need to go directly to the database to query
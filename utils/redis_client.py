@@ -1,26 +1,141 @@
 from django.conf import settings
 import redis
+import threading
+
+
+# the message of the ConnectionError raised by BlockingConnectionPool
+# when no connection is returned to the pool within the timeout
+POOL_EXHAUSTED_MESSAGE = 'No connection available.'
+
+
+class MeteredConnection(redis.Connection):
+    """
+    Counts the commands failing on the socket (including the pipelines and pubsub)
+    in the metrics of the pool that created the connection
+    """
+    metered_pool = None
+
+    def send_packed_command(self, *args, **kwargs):
+        try:
+            return super(MeteredConnection, self).send_packed_command(*args, **kwargs)
+        except (redis.ConnectionError, redis.TimeoutError) as e:
+            if self.metered_pool is not None:
+                self.metered_pool.count_error(e)
+            raise
+
+    def read_response(self, *args, **kwargs):
+        try:
+            return super(MeteredConnection, self).read_response(*args, **kwargs)
+        except (redis.ConnectionError, redis.TimeoutError) as e:
+            if self.metered_pool is not None:
+                self.metered_pool.count_error(e)
+            raise
+
+
+class MeteredConnectionPool(redis.BlockingConnectionPool):
+    """
+    BlockingConnectionPool waits up to `timeout` seconds for a free connection instead of
+    raising when all max_connections are in use. Counts the connections in use,
+    the checkouts that had to wait, the checkouts that timed out waiting (pool_timeouts)
+    and the connection errors of the checkouts and of the commands (errors).
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('connection_class', MeteredConnection)
+        super(MeteredConnectionPool, self).__init__(*args, **kwargs)
+        self.metrics_lock = threading.Lock()
+        self.metrics = {'waits': 0, 'pool_timeouts': 0, 'errors': 0}
+        self.checked_out_connections = set()
+
+    def get_metrics(self):
+        with self.metrics_lock:
+            return dict(
+                self.metrics,
+                in_use=len(self.checked_out_connections),
+                size=self.max_connections,
+            )
+
+    def incr_metric(self, name):
+        with self.metrics_lock:
+            self.metrics[name] += 1
+
+    def count_error(self, e):
+        # an error is counted once, e.g. a failed command while connecting
+        # is seen by the connection and by the checkout
+        if getattr(e, 'counted', False):
+            return
+        e.counted = True
+        self.incr_metric('errors')
+
+    def make_connection(self):
+        connection = super(MeteredConnectionPool, self).make_connection()
+        connection.metered_pool = self
+        return connection
+
+    def get_connection(self, command_name, *keys, **options):
+        with self.metrics_lock:
+            if len(self.checked_out_connections) >= self.max_connections:
+                self.metrics['waits'] += 1
+        try:
+            connection = super(MeteredConnectionPool, self).get_connection(
+                command_name,
+                *keys,
+                **options,
+            )
+        except redis.ConnectionError as e:
+            if str(e) == POOL_EXHAUSTED_MESSAGE:
+                self.incr_metric('pool_timeouts')
+            else:
+                self.count_error(e)
+            raise
+        with self.metrics_lock:
+            self.checked_out_connections.add(connection)
+        return connection
+
+    def release(self, connection):
+        # the parent class also releases the connections that failed to connect,
+        # they were never counted as checked out
+        with self.metrics_lock:
+            self.checked_out_connections.discard(connection)
+        super(MeteredConnectionPool, self).release(connection)
 
 
 class RedisClient:
+    # redis.Redis is thread-safe, every command checks out a connection from the pool
     conn = None
+    lock = threading.Lock()
 
     @classmethod
     def get_connection(cls):
-        # Using singleton mode, only one connection is created globally
+        # Using singleton mode, only one client (and one connection pool) is created globally
         if cls.conn:
             return cls.conn
-        cls.conn = redis.Redis(
-            host=settings.REDIS_HOST,
-            port=settings.REDIS_PORT,
-            db=settings.REDIS_DB,
-        )
+        with cls.lock:
+            if cls.conn is None:
+                pool = MeteredConnectionPool(
+                    host=settings.REDIS_HOST,
+                    port=settings.REDIS_PORT,
+                    db=settings.REDIS_DB,
+                    max_connections=settings.REDIS_POOL_SIZE,
+                    timeout=settings.REDIS_POOL_TIMEOUT,
+                    socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+                    # retry a command once when the socket times out, the other connection errors
+                    # are raised right away, both are counted in the errors of the pool metrics
+                    retry_on_timeout=True,
+                    # ping connections that have been idle for a while before using them
+                    health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL,
+                )
+                cls.conn = redis.Redis(connection_pool=pool)
         return cls.conn
 
+    @classmethod
+    def get_pool_metrics(cls):
+        return cls.get_connection().connection_pool.get_metrics()
+
     @classmethod
     def clear(cls):
         # clear all keys in redis, for testing purpose
         if not settings.TESTING:
             raise Exception("You can not flush redis in production environment")
         conn = cls.get_connection()
-        conn.flushdb()
\ No newline at end of file
+        conn.flushdb()
@@ -1,68 +1,446 @@
 from django.conf import settings
+from django.utils.module_loading import import_string
 from django_hbase.models import HBaseModel
+from utils.cache_expiration import jitter, should_recompute_early
 from utils.redis_client import RedisClient
-from utils.redis_serializers import DjangoModelSerializer, HBaseModelSerializer
+from utils.redis_scripts import (
+    ADD_TO_ID_SET_SCRIPT,
+    ADD_TO_WINDOW_SET_SCRIPT,
+    FILL_ID_SET_SCRIPT,
+    FILL_LIST_SCRIPT,
+    FILL_WINDOW_SET_SCRIPT,
+    PUSH_OBJECT_SCRIPT,
+)
+from utils.single_flight import SingleFlight
+from utils.redis_serializers import (
+    DjangoModelSerializer,
+    HBaseModelSerializer,
+    SchemaVersionError,
+)
+
+import time
+import uuid
+
+# returned by RedisHelper.load_objects when the key is not in the cache
+CACHE_MISS = object()
+# always added to a cached id set, ids start from 1 so it is never a real member.
+# It keeps the key of an empty set, and a set without it (created by a sadd racing
+# with the expiration of the key) is known to be incomplete and is reloaded
+ID_SET_PLACEHOLDER = 0
+# always added to a cached window set, scored by the start of the window, see ADD_TO_WINDOW_SET_SCRIPT
+WINDOW_SET_PLACEHOLDER = '0'
 
 
 class RedisHelper:
+    # lua script => registered Script, which runs EVALSHA and falls back to EVAL on NOSCRIPT
+    scripts = {}
+
+    @classmethod
+    def get_serializer(cls, key_pattern, default=DjangoModelSerializer):
+        # the serializer of a key pattern can be switched in settings.REDIS_LIST_SERIALIZERS
+        serializer_path = settings.REDIS_LIST_SERIALIZERS.get(key_pattern)
+        if serializer_path is None:
+            return default
+        return import_string(serializer_path)
+
+    @classmethod
+    def run_script(cls, script, keys, args):
+        if script not in cls.scripts:
+            cls.scripts[script] = RedisClient.get_connection().register_script(script)
+        return cls.scripts[script](keys=keys, args=args, client=RedisClient.get_connection())
 
     @classmethod
-    def _load_objects_to_cache(cls, key, objects, serializer):
+    def get_fill_lock_key(cls, key):
+        return 'fill_lock:{}'.format(key)
+
+    @classmethod
+    def acquire_fill_lock(cls, key):
+        # returns the token of the lock, None if another loader is filling the key
         conn = RedisClient.get_connection()
+        token = uuid.uuid4().hex
+        acquired = conn.set(
+            cls.get_fill_lock_key(key),
+            token,
+            nx=True,
+            px=settings.REDIS_FILL_LOCK_TIMEOUT,
+        )
+        return token if acquired else None
+
+    @classmethod
+    def get_refresh_flight_key(cls, key):
+        # a refresh returns None when it does not get the fill lock,
+        # the cold loads of the key must not share its result
+        return '{}:refresh'.format(key)
+
+    @classmethod
+    def get_delta_key(cls, key):
+        return 'delta:{}'.format(key)
 
+    @classmethod
+    def get_expire_time(cls):
+        # jittered, the lists filled together (by a fanout for example) do not expire together
+        return jitter(settings.REDIS_KEY_EXPIRE_TIME)
+
+    @classmethod
+    def _load_objects_to_cache(cls, key, objects, serializer, token, delta=0, replace=False):
         serialized_list = []
         for obj in objects:
             serialized_data = serializer.serialize(obj)
             serialized_list.append(serialized_data)
 
-        if serialized_list:
-            conn.rpush(key, *serialized_list)
-            conn.expire(key, settings.REDIS_KEY_EXPIRE_TIME)
+        # check the lock + rpush + expire in one atomic script, see FILL_LIST_SCRIPT
+        return cls.run_script(
+            FILL_LIST_SCRIPT,
+            keys=[key, cls.get_fill_lock_key(key), cls.get_delta_key(key)],
+            args=[token, cls.get_expire_time(), delta, 1 if replace else 0, *serialized_list],
+        )
 
     @classmethod
-    def load_objects(cls, key, lazy_load_objects, serializer=DjangoModelSerializer):
-        conn = RedisClient.get_connection()
+    def _lazy_load_objects(cls, lazy_load_objects):
+        # returns the objects and the milliseconds it took to load them
+        start = time.monotonic()
+        objects = list(lazy_load_objects(settings.REDIS_LIST_LENGTH_LIMIT))
+        return objects, int((time.monotonic() - start) * 1000) + 1
 
-        # If it exists in the cache, take it out directly and return
-        if conn.exists(key):
-            serialized_list = conn.lrange(key, 0, -1)
-            objects = []
-            for serialized_data in serialized_list:
-                deserialized_obj = serializer.deserialize(serialized_data)
-                objects.append(deserialized_obj)
-            # print(f'cache hit {key}, len(objects)={len(objects)}')
-            return objects
+    @classmethod
+    def wait_for_fill(cls, key, serializer):
+        # wait for the holder of the fill lock to fill the list, CACHE_MISS on timeout
+        SingleFlight.incr_metric('fill_waits')
+        conn = RedisClient.get_connection()
+        deadline = time.monotonic() + settings.REDIS_FILL_WAIT_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(settings.REDIS_FILL_WAIT_INTERVAL)
+            objects = cls.load_objects(key, serializer=serializer)
+            if objects is not CACHE_MISS:
+                SingleFlight.incr_metric('fill_wait_hits')
+                return objects
+            # the lock is released without a list when there is nothing to cache
+            # (or the fill was invalidated), no need to wait any longer
+            if not conn.exists(cls.get_fill_lock_key(key)):
+                break
+        return CACHE_MISS
 
+    @classmethod
+    def lazy_load_objects_to_cache(cls, key, lazy_load_objects, serializer):
+        """
+        Load the objects from the database and fill the cached list with them.
+        Only the loader holding the fill lock hits the database and fills the list,
+        the loaders in other processes wait for it briefly, and load the objects without
+        filling the list if it takes too long.
+        """
+        token = cls.acquire_fill_lock(key)
+        if token is None:
+            objects = cls.wait_for_fill(key, serializer)
+            if objects is not CACHE_MISS:
+                return objects
         # At most, only cache REDIS_LIST_LENGTH_LIMIT so many objects that exceed this limit will be read from the database.
         # Generally, this limit will be relatively large, such as 1000,
         # so the number of users who turn the page to 1000 will be less,
         # and reading from the database is not a big problem
-        objects = lazy_load_objects(settings.REDIS_LIST_LENGTH_LIMIT)
-        cls._load_objects_to_cache(key, objects, serializer)
-
         # The reason for converting to list is to keep the return type uniform,
         # because the data stored in redis is in the form of list
+        objects, delta = cls._lazy_load_objects(lazy_load_objects)
+        if token is not None:
+            cls._load_objects_to_cache(key, objects, serializer, token, delta)
+        return objects
+
+    @classmethod
+    def refresh_objects_in_cache(cls, key, lazy_load_objects, serializer):
+        """
+        Reload the cached list from the database and replace it atomically.
+        Returns None if someone else is filling or refreshing the list.
+        """
+        token = cls.acquire_fill_lock(key)
+        if token is None:
+            return None
+        objects, delta = cls._lazy_load_objects(lazy_load_objects)
+        cls._load_objects_to_cache(key, objects, serializer, token, delta, replace=True)
+        return objects
+
+    @classmethod
+    def schedule_refresh(cls, key, refresh):
+        # only one refresh of the key is scheduled every REDIS_REFRESH_INTERVAL
+        conn = RedisClient.get_connection()
+        if conn.set('refresh_scheduled:{}'.format(key), 1, nx=True, ex=settings.REDIS_REFRESH_INTERVAL):
+            refresh()
+
+    @classmethod
+    def _load_objects(cls, key, start, stop, serializer):
+        # returns the objects (or CACHE_MISS) and whether the list should be recomputed early
+        conn = RedisClient.get_connection()
+        pipeline = conn.pipeline()
+        pipeline.exists(key)
+        pipeline.lrange(key, start, stop)
+        pipeline.pttl(key)
+        pipeline.get(cls.get_delta_key(key))
+        exists, serialized_list, ttl, delta = pipeline.execute()
+        if not exists:
+            return CACHE_MISS, False
+
+        try:
+            objects = [
+                serializer.deserialize(serialized_data)
+                for serialized_data in serialized_list
+            ]
+        except SchemaVersionError:
+            # the list was cached before the model changed, drop it so that it is reloaded
+            conn.delete(key)
+            return CACHE_MISS, False
+        return objects, should_recompute_early(ttl, int(delta or 0))
+
+    @classmethod
+    def load_objects(cls, key, start=0, stop=-1, serializer=DjangoModelSerializer):
+        """
+        Read the objects in [start, stop] (both inclusive, same as LRANGE) of the cached list.
+        EXISTS and LRANGE are sent in one pipeline so that it costs only one round trip,
+        and only the requested slice is deserialized.
+        Returns CACHE_MISS if the key is not in the cache, an empty list only means
+        the slice is out of range.
+        """
+        objects, _ = cls._load_objects(key, start, stop, serializer)
+        return objects
+
+    @classmethod
+    def load_objects_through_cache(
+        cls,
+        key,
+        lazy_load_objects,
+        serializer=DjangoModelSerializer,
+        start=0,
+        stop=-1,
+        refresh=None,
+    ):
+        """
+        refresh schedules a background refresh of the list (a celery task calling
+        refresh_objects_in_cache), it is called when the list is recomputed early
+        in the stale-while-revalidate mode.
+        """
+        # If it exists in the cache, take it out directly and return
+        objects, recompute_early = cls._load_objects(key, start, stop, serializer)
+        if objects is not CACHE_MISS and not recompute_early:
+            # print(f'cache hit {key}, len(objects)={len(objects)}')
+            return objects
+
+        if objects is not CACHE_MISS:
+            # the list is going to expire soon, see utils.cache_expiration
+            if settings.REDIS_STALE_WHILE_REVALIDATE and refresh is not None:
+                # keep serving the cached list while it is refreshed in the background
+                cls.schedule_refresh(key, refresh)
+                return objects
+            refreshed_objects = SingleFlight.do(
+                cls.get_refresh_flight_key(key),
+                lambda: cls.refresh_objects_in_cache(key, lazy_load_objects, serializer),
+            )
+            # someone else is refreshing the list
+            if refreshed_objects is None:
+                return objects
+            return cls._slice(refreshed_objects, start, stop)
+
+        # the concurrent cold loads of the key in this process share one load
+        objects = SingleFlight.do(
+            key,
+            lambda: cls.lazy_load_objects_to_cache(key, lazy_load_objects, serializer),
+        )
+
         # print(f'cache miss {key}, len(objects)={len(objects)}')
-        return list(objects)
+        return cls._slice(objects, start, stop)
 
     @classmethod
-    def push_object(cls, key, obj, lazy_load_objects):
-        if isinstance(obj, HBaseModel):
+    def _slice(cls, objects, start, stop):
+        # stop is inclusive like LRANGE, -1 means till the end of the list
+        if stop == -1:
+            return objects[start:]
+        return objects[start:stop + 1]
+
+    @classmethod
+    def push_object(cls, key, obj, lazy_load_objects, serializer=None):
+        if serializer is None and isinstance(obj, HBaseModel):
             serializer = HBaseModelSerializer
-        else:
+        elif serializer is None:
             serializer = DjangoModelSerializer
+        # If it exists in the cache, put obj directly at the top of the list, then trim the length,
+        # exists + lpush + ltrim are done in one atomic script, see PUSH_OBJECT_SCRIPT
+        pushed = cls.run_script(
+            PUSH_OBJECT_SCRIPT,
+            keys=[key, cls.get_fill_lock_key(key)],
+            args=[serializer.serialize(obj), settings.REDIS_LIST_LENGTH_LIMIT],
+        )
+        if pushed:
+            return
+        # If the key does not exist, load directly from the database without adding a single push to the cache.
+        # The list is being filled by someone else if the fill lock is taken, it may have read the database
+        # before obj was saved, so its fill is dropped and the list is loaded again on the next read
+        token = cls.acquire_fill_lock(key)
+        if token is None:
+            cls.invalidate_objects(key)
+            return
+        objects, delta = cls._lazy_load_objects(lazy_load_objects)
+        cls._load_objects_to_cache(key, objects, serializer, token, delta)
+
+    @classmethod
+    def invalidate_objects(cls, key):
+        # the fill lock is dropped as well, a loader that read the database before
+        # the invalidation can not fill the list with the outdated objects
         conn = RedisClient.get_connection()
-        # If it exists in the cache, put obj directly at the top of the list, then trim the length
-        if conn.exists(key):
-            # print(f'push cache hit {key}')
-            serialized_data = serializer.serialize(obj)
-            conn.lpush(key, serialized_data)
-            conn.ltrim(key, 0, settings.REDIS_LIST_LENGTH_LIMIT - 1)
+        conn.delete(key, cls.get_delta_key(key), cls.get_fill_lock_key(key))
+
+    @classmethod
+    def push_objects_bulk(cls, key_object_pairs, serializer=DjangoModelSerializer):
+        """
+        Push each obj to the top of the cached list of its key, in one pipelined round trip.
+        LPUSHX only pushes to the keys that are cached, the other keys are skipped instead of
+        being reloaded, they will be loaded from the database when they are read.
+        The fill locks are dropped, a fill or refresh that read the database before the push
+        can not overwrite the list with its outdated objects.
+        Returns the number of objects pushed.
+        """
+        if not key_object_pairs:
+            return 0
+        conn = RedisClient.get_connection()
+        pipeline = conn.pipeline(transaction=False)
+        for key, obj in key_object_pairs:
+            pipeline.lpushx(key, serializer.serialize(obj))
+            # ltrim does nothing to a key that does not exist
+            pipeline.ltrim(key, 0, settings.REDIS_LIST_LENGTH_LIMIT - 1)
+            pipeline.delete(cls.get_fill_lock_key(key))
+        results = pipeline.execute()
+        # the results are [len after lpushx, ltrim ok, del, ...], lpushx returns 0 for a missing key
+        return sum(1 for length in results[::3] if length)
+
+    @classmethod
+    def _load_id_set_to_cache(cls, key, ids, token):
+        # check the lock + delete + sadd + expire in one atomic script, see FILL_ID_SET_SCRIPT
+        return cls.run_script(
+            FILL_ID_SET_SCRIPT,
+            keys=[key, cls.get_fill_lock_key(key)],
+            args=[token, cls.get_expire_time(), ID_SET_PLACEHOLDER, *ids],
+        )
+
+    @classmethod
+    def _lazy_load_id_set(cls, key, lazy_load_ids):
+        # the lock is taken before reading the database, a write to the set meanwhile drops it
+        # and the outdated ids are not cached, the loaders without the lock do not fill the set
+        token = cls.acquire_fill_lock(key)
+        id_set = set(lazy_load_ids())
+        if token is not None:
+            cls._load_id_set_to_cache(key, id_set, token)
+        return id_set
+
+    @classmethod
+    def load_id_set_through_cache(cls, key, lazy_load_ids):
+        conn = RedisClient.get_connection()
+        members = conn.smembers(key)
+        id_set = set(int(member) for member in members)
+        if ID_SET_PLACEHOLDER in id_set:
+            id_set.remove(ID_SET_PLACEHOLDER)
+            return id_set
+        return cls._lazy_load_id_set(key, lazy_load_ids)
+
+    @classmethod
+    def get_ids_in_set(cls, key, ids, lazy_load_ids):
+        """
+        Return the ones of ids that are members of the cached id set.
+        All the SISMEMBER are sent in one pipeline (SMISMEMBER needs redis 6.2),
+        so it costs one round trip no matter how many ids are checked.
+        """
+        conn = RedisClient.get_connection()
+        pipeline = conn.pipeline(transaction=False)
+        pipeline.sismember(key, ID_SET_PLACEHOLDER)
+        for member_id in ids:
+            pipeline.sismember(key, member_id)
+        loaded, *is_members = pipeline.execute()
+        if loaded:
+            return set(
+                member_id
+                for member_id, is_member in zip(ids, is_members)
+                if is_member
+            )
+        return cls._lazy_load_id_set(key, lazy_load_ids) & set(ids)
+
+    @classmethod
+    def add_id_to_set(cls, key, member_id):
+        # only update the set that is already cached, a missing set is loaded on the next read.
+        # The fill lock is dropped in the same script, see ADD_TO_ID_SET_SCRIPT
+        return cls.run_script(
+            ADD_TO_ID_SET_SCRIPT,
+            keys=[key, cls.get_fill_lock_key(key)],
+            args=[member_id],
+        )
+
+    @classmethod
+    def remove_id_from_set(cls, key, member_id):
+        conn = RedisClient.get_connection()
+        pipeline = conn.pipeline()
+        # srem does not create the key if it does not exist
+        pipeline.srem(key, member_id)
+        pipeline.delete(cls.get_fill_lock_key(key))
+        pipeline.execute()
+
+    @classmethod
+    def invalidate_id_sets(cls, keys):
+        # the fill locks are dropped as well, see invalidate_objects
+        if not keys:
             return
-        # If the key does not exist, load directly from the database without adding a single push to the cache
-        objects = lazy_load_objects(settings.REDIS_LIST_LENGTH_LIMIT)
-        cls._load_objects_to_cache(key, objects, serializer)
-        # print(f'push cache miss {key}, len={len(objects)}')
+        conn = RedisClient.get_connection()
+        conn.delete(*keys, *[cls.get_fill_lock_key(key) for key in keys])
+
+    @classmethod
+    def _load_window_set_to_cache(cls, key, scored_members, window_start, token):
+        # check the lock + delete + zadd + expire in one atomic script, see FILL_WINDOW_SET_SCRIPT
+        args = [token, cls.get_expire_time(), window_start, WINDOW_SET_PLACEHOLDER]
+        for member, score in scored_members.items():
+            args.extend([score, member])
+        return cls.run_script(FILL_WINDOW_SET_SCRIPT, keys=[key, cls.get_fill_lock_key(key)], args=args)
+
+    @classmethod
+    def get_scores_in_window_set(cls, key, members, lazy_load_window):
+        """
+        A window set is a sorted set of the newest members scored by time, every member newer
+        than the start of the window is in the set, the older ones may have been dropped.
+        Return (window_start, {member: score}) for the ones of members found in the set.
+        All the ZSCORE are sent in one pipeline (ZMSCORE needs redis 6.2).
+        lazy_load_window() returns ({member: score}, window_start) to fill a missing set.
+        """
+        conn = RedisClient.get_connection()
+        pipeline = conn.pipeline(transaction=False)
+        pipeline.zscore(key, WINDOW_SET_PLACEHOLDER)
+        for member in members:
+            pipeline.zscore(key, member)
+        window_start, *scores = pipeline.execute()
+        if window_start is not None:
+            return window_start, {
+                member: score
+                for member, score in zip(members, scores)
+                if score is not None
+            }
+
+        # same as the id sets, a write to the set while it is loaded drops the lock and the fill
+        token = cls.acquire_fill_lock(key)
+        scored_members, window_start = lazy_load_window()
+        if token is not None:
+            cls._load_window_set_to_cache(key, scored_members, window_start, token)
+        return window_start, {
+            member: scored_members[member]
+            for member in members
+            if member in scored_members
+        }
+
+    @classmethod
+    def add_to_window_set(cls, key, member, score, max_length):
+        # zadd + trim + move the window in one atomic script, a missing set is loaded on the next read
+        return cls.run_script(
+            ADD_TO_WINDOW_SET_SCRIPT,
+            keys=[key, cls.get_fill_lock_key(key)],
+            args=[member, score, max_length],
+        )
+
+    @classmethod
+    def remove_from_window_set(cls, key, member):
+        conn = RedisClient.get_connection()
+        pipeline = conn.pipeline()
+        pipeline.zrem(key, member)
+        pipeline.delete(cls.get_fill_lock_key(key))
+        pipeline.execute()
 
     @classmethod
     def get_count_key(cls, obj, attr):
@@ -74,7 +452,7 @@ class RedisHelper:
         key = cls.get_count_key(obj, attr)
         if not conn.exists(key):
             conn.set(key, getattr(obj, attr))
-            conn.expire(key, settings.REDIS_KEY_EXPIRE_TIME)
+            conn.expire(key, cls.get_expire_time())
             return getattr(obj, attr)
         return conn.incr(key)
 
@@ -84,7 +462,7 @@ class RedisHelper:
         key = cls.get_count_key(obj, attr)
         if not conn.exists(key):
             conn.set(key, getattr(obj, attr))
-            conn.expire(key, settings.REDIS_KEY_EXPIRE_TIME)
+            conn.expire(key, cls.get_expire_time())
             return getattr(obj, attr)
         return conn.decr(key)
 
@@ -98,5 +476,73 @@ class RedisHelper:
 
         obj.refresh_from_db()
         count = getattr(obj, attr)
-        conn.set(key, count)
-        return count
\ No newline at end of file
+        conn.set(key, count, ex=cls.get_expire_time())
+        return count
+
+    @classmethod
+    def get_counts(cls, objs, attrs):
+        """
+        Batch version of get_count for objects of the same model, returns {obj.id: {attr: count}}.
+        All the counts are read by one MGET, the objects with missing counts are reloaded
+        by one values_list query and their counts are cached in one pipeline.
+        """
+        objs = list(objs)
+        if not objs:
+            return {}
+        conn = RedisClient.get_connection()
+        keys = [cls.get_count_key(obj, attr) for obj in objs for attr in attrs]
+        values = iter(conn.mget(keys))
+
+        counts = {}
+        missing_objs = {}
+        for obj in objs:
+            counts[obj.id] = {}
+            for attr in attrs:
+                count = next(values)
+                if count is None:
+                    missing_objs[obj.id] = obj
+                else:
+                    counts[obj.id][attr] = int(count)
+        if not missing_objs:
+            return counts
+
+        model_class = objs[0].__class__
+        rows = model_class.objects.filter(id__in=missing_objs).values_list('id', *attrs)
+        pipeline = conn.pipeline(transaction=False)
+        for object_id, *row_counts in rows:
+            for attr, count in zip(attrs, row_counts):
+                count = count or 0
+                counts[object_id][attr] = count
+                # nx: do not overwrite the count loaded and increased by someone else meanwhile
+                key = cls.get_count_key(missing_objs[object_id], attr)
+                pipeline.set(key, count, ex=cls.get_expire_time(), nx=True)
+        pipeline.execute()
+
+        # the objects deleted from the database keep their own counts
+        for object_id, obj in missing_objs.items():
+            for attr in attrs:
+                counts[object_id].setdefault(attr, getattr(obj, attr))
+        return counts
+
+    @classmethod
+    def get_counts_context_key(cls, model_class):
+        return 'prefetched_counts:{}'.format(model_class.__name__)
+
+    @classmethod
+    def prefetch_counts(cls, context, objs, attrs):
+        """
+        List serializers call this once per page, the counts are kept in the serializer context
+        """
+        objs = list(objs)
+        if not objs:
+            return
+        prefetched = context.setdefault(cls.get_counts_context_key(objs[0].__class__), {})
+        prefetched.update(cls.get_counts(objs, attrs))
+
+    @classmethod
+    def get_count_from_context(cls, context, obj, attr):
+        prefetched = context.get(cls.get_counts_context_key(obj.__class__), {})
+        counts = prefetched.get(obj.id, {})
+        if attr in counts:
+            return counts[attr]
+        return cls.get_count(obj, attr)
\ No newline at end of file
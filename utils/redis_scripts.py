@@ -0,0 +1,108 @@
+# Lua scripts of the cached lists, a script is executed atomically by redis in one round trip.
+# They are registered by RedisHelper and sent with EVALSHA.
+
+# KEYS[1]: list key, KEYS[2]: fill lock key
+# ARGV[1]: serialized object, ARGV[2]: max length of the list
+# push the object to the top of the list only if the list is cached, then trim the list.
+# The fill lock is dropped, a refresh that read the database before the push can not replace the list
+PUSH_OBJECT_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('LPUSH', KEYS[1], ARGV[1])
+redis.call('LTRIM', KEYS[1], 0, tonumber(ARGV[2]) - 1)
+redis.call('DEL', KEYS[2])
+return 1
+"""
+
+# KEYS[1]: list key, KEYS[2]: fill lock key, KEYS[3]: delta key
+# ARGV[1]: fill lock token, ARGV[2]: expire time in seconds, ARGV[3]: milliseconds it took to load the objects,
+# ARGV[4]: '1' to replace the cached list, ARGV[5...]: serialized objects
+# fill the list only if the caller still holds the fill lock and the list is not cached (or is being replaced),
+# so that two loaders can never both fill the list, the lock is released anyway.
+# The load time is kept in the delta key for the early recompute, see utils.cache_expiration
+FILL_LIST_SCRIPT = """
+if redis.call('GET', KEYS[2]) ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[2])
+if ARGV[4] == '1' then
+    redis.call('DEL', KEYS[1])
+elseif redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+if #ARGV < 5 then
+    return 0
+end
+redis.call('RPUSH', KEYS[1], unpack(ARGV, 5))
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+redis.call('SET', KEYS[3], ARGV[3], 'EX', ARGV[2])
+return 1
+"""
+
+# KEYS[1]: id set key, KEYS[2]: fill lock key
+# ARGV[1]: fill lock token, ARGV[2]: expire time in seconds, ARGV[3...]: members (with the placeholder)
+# replace the set only if the caller still holds the fill lock, which is dropped by the writes
+# to the set, so that a loader can not fill the set with ids read before a write. The members are
+# added in chunks, unpack can not take too many values at once
+FILL_ID_SET_SCRIPT = """
+if redis.call('GET', KEYS[2]) ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[2])
+redis.call('DEL', KEYS[1])
+for i = 3, #ARGV, 1000 do
+    redis.call('SADD', KEYS[1], unpack(ARGV, i, math.min(i + 999, #ARGV)))
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+# KEYS[1]: id set key, KEYS[2]: fill lock key
+# ARGV[1]: member
+# drop the fill lock, then add the member only if the set is cached
+ADD_TO_ID_SET_SCRIPT = """
+redis.call('DEL', KEYS[2])
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('SADD', KEYS[1], ARGV[1])
+return 1
+"""
+
+# KEYS[1]: window set key, KEYS[2]: fill lock key
+# ARGV[1]: fill lock token, ARGV[2]: expire time in seconds, ARGV[3...]: score, member pairs (with the placeholder)
+# same as FILL_ID_SET_SCRIPT for a window set
+FILL_WINDOW_SET_SCRIPT = """
+if redis.call('GET', KEYS[2]) ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[2])
+redis.call('DEL', KEYS[1])
+for i = 3, #ARGV, 1000 do
+    redis.call('ZADD', KEYS[1], unpack(ARGV, i, math.min(i + 999, #ARGV)))
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+# KEYS[1]: window set key (a sorted set scored by time), KEYS[2]: fill lock key
+# ARGV[1]: member, ARGV[2]: score, ARGV[3]: max number of members
+# The placeholder member '0' is scored by the start of the window, every member newer than it is in the set.
+# Drop the fill lock (see FILL_WINDOW_SET_SCRIPT), add the member only if the set is cached,
+# then drop the oldest members over the limit and move the start of the window to the newest dropped one
+ADD_TO_WINDOW_SET_SCRIPT = """
+redis.call('DEL', KEYS[2])
+if redis.call('ZSCORE', KEYS[1], '0') == false then
+    return 0
+end
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+local overflow = redis.call('ZCARD', KEYS[1]) - 1 - tonumber(ARGV[3])
+if overflow > 0 then
+    redis.call('ZREM', KEYS[1], '0')
+    local dropped = redis.call('ZRANGE', KEYS[1], 0, overflow - 1, 'WITHSCORES')
+    redis.call('ZREMRANGEBYRANK', KEYS[1], 0, overflow - 1)
+    redis.call('ZADD', KEYS[1], dropped[#dropped], '0')
+end
+return 1
+"""
@@ -1,8 +1,15 @@
+from django.apps import apps
 from django.core import serializers
+from django.utils.encoding import is_protected_type
 from django_hbase.models import HBaseModel
 from utils.json_encoder import JSONEncoder
 
 import json
+import zlib
+
+
+class SchemaVersionError(Exception):
+    pass
 
 
 class DjangoModelSerializer:
@@ -20,6 +27,60 @@ class DjangoModelSerializer:
         return list(serializers.deserialize('json', serialized_data))[0].object
 
 
+class DjangoModelCompactSerializer:
+    """
+    Store the instance as a json array of its concrete field values in field order:
+    ["app_label.model_name", schema_version, value1, value2, ...]
+    There is no field name in the data, so the size is about half of DjangoModelSerializer,
+    and the deserialization does not go through the django serialization framework.
+    schema_version changes when the fields of the model change (e.g. a migration adds a field),
+    data of another schema_version can not be read and SchemaVersionError is raised.
+    """
+    schema_versions = {}
+
+    @classmethod
+    def get_schema_version(cls, model_class):
+        if model_class in cls.schema_versions:
+            return cls.schema_versions[model_class]
+        attnames = ','.join(field.attname for field in model_class._meta.concrete_fields)
+        schema_version = zlib.crc32(attnames.encode('utf-8'))
+        cls.schema_versions[model_class] = schema_version
+        return schema_version
+
+    @classmethod
+    def serialize(cls, instance):
+        model_class = instance.__class__
+        data = [model_class._meta.label_lower, cls.get_schema_version(model_class)]
+        for field in model_class._meta.concrete_fields:
+            # the same as django's python serializer, types like datetime are kept
+            # and encoded by JSONEncoder, the others are converted to string by the field
+            value = field.value_from_object(instance)
+            if not is_protected_type(value):
+                value = field.value_to_string(instance)
+            data.append(value)
+        return json.dumps(data, cls=JSONEncoder, separators=(',', ':'))
+
+    @classmethod
+    def deserialize(cls, serialized_data):
+        data = json.loads(serialized_data)
+        # data cached by DjangoModelSerializer before the key pattern switched to this serializer
+        if isinstance(data[0], dict):
+            return list(serializers.deserialize('python', data))[0].object
+
+        model_label, schema_version, *values = data
+        model_class = apps.get_model(model_label)
+        if schema_version != cls.get_schema_version(model_class):
+            raise SchemaVersionError(
+                f'{model_label} is cached with schema version {schema_version}'
+            )
+        fields = model_class._meta.concrete_fields
+        return model_class.from_db(
+            None,
+            [field.attname for field in fields],
+            [field.to_python(value) for field, value in zip(fields, values)],
+        )
+
+
 class HBaseModelSerializer:
 
     @classmethod
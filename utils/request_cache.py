@@ -0,0 +1,85 @@
+from contextlib import contextmanager
+
+import contextvars
+
+# {namespace: {key: value}} of the current scope, None outside of a scope
+_scope = contextvars.ContextVar('request_cache_scope', default=None)
+
+
+class RequestCache:
+    """
+    Request scoped memo. RequestCacheMiddleware opens a scope for every request and
+    twitter.celery opens one for every task, the services keep what they fetched in it
+    so that an object or a flag is fetched at most once per scope. The cached objects are
+    shared by the whole scope (an identity map). Outside of a scope nothing is kept.
+    """
+    # celery task id => token to close the scope of the task
+    task_tokens = {}
+
+    @classmethod
+    def open(cls):
+        return _scope.set({})
+
+    @classmethod
+    def close(cls, token):
+        # the enclosing scope comes back, e.g. a celery task run eagerly inside a request
+        _scope.reset(token)
+
+    @classmethod
+    @contextmanager
+    def scope(cls):
+        token = cls.open()
+        try:
+            yield
+        finally:
+            cls.close(token)
+
+    @classmethod
+    def open_task_scope(cls, task_id):
+        cls.task_tokens[task_id] = cls.open()
+
+    @classmethod
+    def close_task_scope(cls, task_id):
+        token = cls.task_tokens.pop(task_id, None)
+        if token is not None:
+            cls.close(token)
+
+    @classmethod
+    def get_namespace(cls, namespace):
+        # the memo of namespace in the current scope, None outside of a scope
+        scope = _scope.get()
+        if scope is None:
+            return None
+        return scope.setdefault(namespace, {})
+
+    @classmethod
+    def get_or_load(cls, namespace, key, load):
+        memo = cls.get_namespace(namespace)
+        if memo is None:
+            return load()
+        if key not in memo:
+            memo[key] = load()
+        return memo[key]
+
+    @classmethod
+    def set(cls, namespace, key, value):
+        memo = cls.get_namespace(namespace)
+        if memo is not None:
+            memo[key] = value
+
+    @classmethod
+    def delete(cls, namespace, key):
+        memo = cls.get_namespace(namespace)
+        if memo is not None:
+            memo.pop(key, None)
+
+
+class RequestCacheMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        # the memo is dropped when the response is returned
+        with RequestCache.scope():
+            return self.get_response(request)
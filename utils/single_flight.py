@@ -0,0 +1,61 @@
+from concurrent.futures import Future
+
+import threading
+
+
+class SingleFlight:
+    """
+    Coalesce the concurrent loads of the same key in this process: the first caller (the leader)
+    runs the load, the others wait for its future and share the result (or the exception).
+    Across processes the loads of the cached lists are coalesced by the fill lock in redis,
+    see RedisHelper.lazy_load_objects_to_cache.
+    """
+    lock = threading.Lock()
+    futures = {}
+    metrics = {
+        # loads run by a leader
+        'loads': 0,
+        # loads that waited for the leader in this process instead of hitting the database
+        'coalesced': 0,
+        # loads that waited for the fill lock holder in another process
+        'fill_waits': 0,
+        # fill_waits served by the list filled by the lock holder
+        'fill_wait_hits': 0,
+    }
+
+    @classmethod
+    def incr_metric(cls, name):
+        with cls.lock:
+            cls.metrics[name] += 1
+
+    @classmethod
+    def get_metrics(cls):
+        with cls.lock:
+            return dict(cls.metrics)
+
+    @classmethod
+    def do(cls, key, load):
+        with cls.lock:
+            future = cls.futures.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = Future()
+                cls.futures[key] = future
+                cls.metrics['loads'] += 1
+            else:
+                cls.metrics['coalesced'] += 1
+
+        if not is_leader:
+            return future.result()
+
+        try:
+            result = load()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with cls.lock:
+                del cls.futures[key]
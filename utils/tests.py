@@ -1,5 +1,28 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import override_settings
+from django_hbase.client import HBaseClient
 from testing.testcases import TestCase
-from utils.redis_client import RedisClient
+from tweets.services import TweetService
+from tweets.models import Tweet
+from twitter.cache import USER_TWEETS_PATTERN
+from utils.cache_expiration import CachedValue, jitter, should_recompute_early
+from utils.local_cache import LocalCache, LocalCacheInvalidator, LOCAL_CACHE_CHANNEL
+from utils.memcached_helper import MemcachedHelper, cache
+from utils.redis_client import MeteredConnectionPool, RedisClient
+from utils.redis_helper import RedisHelper, CACHE_MISS
+from utils.request_cache import RequestCache
+from utils.single_flight import SingleFlight
+from utils.redis_serializers import (
+    DjangoModelSerializer,
+    DjangoModelCompactSerializer,
+    SchemaVersionError,
+)
+
+import json
+import redis
+import threading
+import time
 
 
 class UtilsTests(TestCase):
@@ -16,4 +39,593 @@ class UtilsTests(TestCase):
 
         RedisClient.clear()
         cached_list = conn.lrange('redis_key', 0, -1)
-        self.assertEqual(cached_list, [])
\ No newline at end of file
+        self.assertEqual(cached_list, [])
+
+    def test_redis_pool_metrics(self):
+        conn = RedisClient.get_connection()
+        conn.set('redis_key', 1)
+        pipeline = conn.pipeline()
+        pipeline.get('redis_key')
+        pipeline.execute()
+        # connections go back to the pool after every command
+        metrics = RedisClient.get_pool_metrics()
+        self.assertEqual(metrics['in_use'], 0)
+        self.assertEqual(metrics['size'], settings.REDIS_POOL_SIZE)
+
+    def test_redis_pool_timeouts(self):
+        pool = MeteredConnectionPool(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            db=settings.REDIS_DB,
+            max_connections=1,
+            timeout=0.01,
+        )
+        connection = pool.get_connection('GET')
+        # the only connection is checked out, the next checkout waits and times out
+        with self.assertRaises(redis.ConnectionError):
+            pool.get_connection('GET')
+        pool.release(connection)
+        metrics = pool.get_metrics()
+        self.assertEqual(metrics['waits'], 1)
+        self.assertEqual(metrics['pool_timeouts'], 1)
+        self.assertEqual(metrics['errors'], 0)
+        self.assertEqual(metrics['in_use'], 0)
+        pool.disconnect()
+
+    def test_hbase_pool_metrics(self):
+        in_use = HBaseClient.get_pool_metrics()['in_use']
+        with HBaseClient.connection() as conn:
+            # a nested checkout gets the same connection and is not counted again
+            with HBaseClient.connection() as nested_conn:
+                self.assertEqual(nested_conn is conn, True)
+                self.assertEqual(HBaseClient.get_pool_metrics()['in_use'], in_use + 1)
+            self.assertEqual(HBaseClient.get_pool_metrics()['in_use'], in_use + 1)
+        self.assertEqual(HBaseClient.get_pool_metrics()['in_use'], in_use)
+
+
+class MemcachedHelperTests(TestCase):
+
+    def setUp(self):
+        super(MemcachedHelperTests, self).setUp()
+        self.users = [self.create_user('user{}'.format(i)) for i in range(3)]
+
+    def test_get_objects_through_cache(self):
+        user_ids = [user.id for user in self.users][::-1]
+
+        # cache miss, keep the order of the given ids
+        users = MemcachedHelper.get_objects_through_cache(User, user_ids)
+        self.assertEqual([user.id for user in users], user_ids)
+
+        # cache hit, no more db queries
+        with self.assertNumQueries(0):
+            users = MemcachedHelper.get_objects_through_cache(User, user_ids)
+        self.assertEqual([user.id for user in users], user_ids)
+
+        # partial cache miss and duplicated ids
+        new_user = self.create_user('new_user')
+        user_ids = [new_user.id, user_ids[0], new_user.id]
+        with self.assertNumQueries(1):
+            users = MemcachedHelper.get_objects_through_cache(User, user_ids)
+        self.assertEqual([user.id for user in users], user_ids)
+
+        # ids that do not exist are None
+        users = MemcachedHelper.get_objects_through_cache(User, [new_user.id, -1])
+        self.assertEqual(users[0].id, new_user.id)
+        self.assertEqual(users[1], None)
+
+    def test_tombstones(self):
+        # the ids that do not exist are cached as tombstones
+        with self.assertNumQueries(1):
+            self.assertEqual(MemcachedHelper.get_object_through_cache(User, -1), None)
+        with self.assertNumQueries(0):
+            self.assertEqual(MemcachedHelper.get_object_through_cache(User, -1), None)
+            self.assertEqual(MemcachedHelper.get_object_through_cache(User, None), None)
+            users = MemcachedHelper.get_objects_through_cache(User, [-1])
+        self.assertEqual(users, [None])
+
+        with self.assertNumQueries(1):
+            users = MemcachedHelper.get_objects_through_cache(User, [self.users[0].id, -2])
+        self.assertEqual(users[1], None)
+        with self.assertNumQueries(0):
+            users = MemcachedHelper.get_objects_through_cache(User, [self.users[0].id, -2])
+            self.assertEqual(MemcachedHelper.get_object_through_cache(User, -2), None)
+        self.assertEqual(users[0].id, self.users[0].id)
+
+        # a tombstone is deleted like a cached object
+        MemcachedHelper.invalidate_cached_object(User, -1)
+        with self.assertNumQueries(1):
+            MemcachedHelper.get_object_through_cache(User, -1)
+
+    def test_prefetch_objects(self):
+        context = {}
+        MemcachedHelper.prefetch_objects(context, User, [user.id for user in self.users])
+        with self.assertNumQueries(0):
+            for user in self.users:
+                cached_user = MemcachedHelper.get_object_from_context(context, User, user.id)
+                self.assertEqual(cached_user.username, user.username)
+
+
+class RedisHelperTests(TestCase):
+
+    def setUp(self):
+        super(RedisHelperTests, self).setUp()
+        self.wl = self.create_user('wl')
+
+    def test_load_objects(self):
+        tweet_ids = [self.create_tweet(self.wl).id for i in range(3)][::-1]
+        key = USER_TWEETS_PATTERN.format(user_id=self.wl.id)
+
+        RedisClient.clear()
+        self.assertEqual(RedisHelper.load_objects(key) is CACHE_MISS, True)
+
+        # cache miss, only the window is returned but the whole list is cached
+        tweets = TweetService.get_cached_tweets(self.wl.id, 0, 1)
+        self.assertEqual([t.id for t in tweets], tweet_ids[:2])
+        tweets = RedisHelper.load_objects(key)
+        self.assertEqual([t.id for t in tweets], tweet_ids)
+
+        # cache hit
+        tweets = RedisHelper.load_objects(key, 1, 2)
+        self.assertEqual([t.id for t in tweets], tweet_ids[1:])
+        tweets = RedisHelper.load_objects(key, 2, -1)
+        self.assertEqual([t.id for t in tweets], tweet_ids[2:])
+
+        # out of range is not a cache miss
+        self.assertEqual(RedisHelper.load_objects(key, 10, 20), [])
+
+    def test_get_counts(self):
+        tweets = [self.create_tweet(self.wl) for i in range(3)]
+        Tweet.objects.filter(id=tweets[0].id).update(likes_count=2, comments_count=1)
+        RedisClient.clear()
+        self.assertEqual(RedisHelper.get_counts([], ['likes_count']), {})
+
+        # one query for all the missing counts
+        with self.assertNumQueries(1):
+            counts = RedisHelper.get_counts(tweets, ['likes_count', 'comments_count'])
+        self.assertEqual(counts[tweets[0].id], {'likes_count': 2, 'comments_count': 1})
+        self.assertEqual(counts[tweets[2].id], {'likes_count': 0, 'comments_count': 0})
+
+        RedisHelper.incr_count(tweets[0], 'likes_count')
+        with self.assertNumQueries(0):
+            counts = RedisHelper.get_counts(tweets, ['likes_count', 'comments_count'])
+        self.assertEqual(counts[tweets[0].id], {'likes_count': 3, 'comments_count': 1})
+
+        context = {}
+        RedisHelper.prefetch_counts(context, tweets, ['likes_count'])
+        self.assertEqual(RedisHelper.get_count_from_context(context, tweets[0], 'likes_count'), 3)
+        self.assertEqual(RedisHelper.get_count_from_context(context, tweets[0], 'comments_count'), 1)
+
+    def test_fill_lock(self):
+        tweets = [self.create_tweet(self.wl) for i in range(2)]
+        key = 'test_fill_lock'
+        conn = RedisClient.get_connection()
+
+        # another loader is filling the key but takes too long, the objects are loaded without filling the list
+        token = RedisHelper.acquire_fill_lock(key)
+        self.assertEqual(RedisHelper.acquire_fill_lock(key), None)
+        objects = RedisHelper.load_objects_through_cache(key, lambda limit: tweets)
+        self.assertEqual(len(objects), 2)
+        self.assertEqual(conn.exists(key), False)
+
+        # only the holder of the lock fills the list, and only once
+        self.assertEqual(RedisHelper._load_objects_to_cache(key, tweets, DjangoModelSerializer, 'x'), 0)
+        self.assertEqual(RedisHelper._load_objects_to_cache(key, tweets, DjangoModelSerializer, token), 1)
+        self.assertEqual(RedisHelper._load_objects_to_cache(key, tweets, DjangoModelSerializer, token), 0)
+        self.assertEqual(conn.llen(key), 2)
+
+        # push_object only pushes to a cached list
+        RedisHelper.push_object(key, tweets[0], lambda limit: [])
+        self.assertEqual(conn.llen(key), 3)
+        conn.delete(key)
+        RedisHelper.push_object(key, tweets[0], lambda limit: tweets)
+        self.assertEqual(conn.llen(key), 2)
+
+    def test_push_while_filling(self):
+        tweets = [self.create_tweet(self.wl) for i in range(2)]
+        key = 'test_push_while_filling'
+        # a loader read the database before tweets[1] was created and is filling the list
+        token = RedisHelper.acquire_fill_lock(key)
+        RedisHelper.push_object(key, tweets[1], lambda limit: tweets[::-1])
+        # the outdated fill is dropped, the list is loaded again on the next read
+        self.assertEqual(RedisHelper._load_objects_to_cache(key, tweets[:1], DjangoModelSerializer, token), 0)
+        objects = RedisHelper.load_objects_through_cache(key, lambda limit: tweets[::-1])
+        self.assertEqual([t.id for t in objects], [tweets[1].id, tweets[0].id])
+
+    def test_push_while_refreshing(self):
+        tweets = [self.create_tweet(self.wl) for i in range(3)]
+        key = 'test_push_while_refreshing'
+        RedisHelper.load_objects_through_cache(key, lambda limit: tweets[:1])
+
+        # a refresh read the database before tweets[1] and tweets[2] were pushed
+        token = RedisHelper.acquire_fill_lock(key)
+        RedisHelper.push_object(key, tweets[1], lambda limit: [])
+        self.assertEqual(
+            RedisHelper._load_objects_to_cache(key, tweets[:1], DjangoModelSerializer, token, replace=True),
+            0,
+        )
+        token = RedisHelper.acquire_fill_lock(key)
+        RedisHelper.push_objects_bulk([(key, tweets[2])])
+        self.assertEqual(
+            RedisHelper._load_objects_to_cache(key, tweets[:1], DjangoModelSerializer, token, replace=True),
+            0,
+        )
+        cached_tweets = RedisHelper.load_objects(key)
+        self.assertEqual([t.id for t in cached_tweets], [tweets[2].id, tweets[1].id, tweets[0].id])
+
+    def test_push_objects_bulk(self):
+        tweets = [self.create_tweet(self.wl) for i in range(3)]
+        key, missing_key = 'test_push_objects_bulk', 'test_push_objects_bulk_missing'
+        RedisHelper.load_objects_through_cache(key, lambda limit: tweets[:1])
+
+        pushed = RedisHelper.push_objects_bulk([
+            (key, tweets[1]),
+            (missing_key, tweets[1]),
+            (key, tweets[2]),
+        ])
+        self.assertEqual(pushed, 2)
+        # missing keys are skipped instead of being loaded
+        self.assertEqual(RedisClient.get_connection().exists(missing_key), False)
+        cached_tweets = RedisHelper.load_objects(key)
+        self.assertEqual([t.id for t in cached_tweets], [tweets[2].id, tweets[1].id, tweets[0].id])
+
+    def test_id_set(self):
+        key = 'test_id_set'
+        self.assertEqual(RedisHelper.load_id_set_through_cache(key, lambda: []), set())
+        # an empty set is cached as well
+        self.assertEqual(RedisHelper.load_id_set_through_cache(key, lambda: [1]), set())
+
+        RedisHelper.add_id_to_set(key, 2)
+        RedisHelper.add_id_to_set(key, 3)
+        RedisHelper.remove_id_from_set(key, 3)
+        self.assertEqual(RedisHelper.load_id_set_through_cache(key, lambda: []), {2})
+        self.assertEqual(RedisHelper.get_ids_in_set(key, [1, 2, 3], lambda: []), {2})
+
+        # a set without the placeholder is reloaded
+        RedisClient.clear()
+        RedisHelper.add_id_to_set(key, 4)
+        self.assertEqual(RedisClient.get_connection().exists(key), False)
+        RedisClient.get_connection().sadd(key, 4)
+        self.assertEqual(RedisHelper.get_ids_in_set(key, [1, 4, 5], lambda: [1, 5]), {1, 5})
+        self.assertEqual(RedisHelper.load_id_set_through_cache(key, lambda: []), {1, 5})
+
+
+    def test_id_set_write_while_loading(self):
+        key = 'test_id_set_write_while_loading'
+        conn = RedisClient.get_connection()
+
+        def lazy_load_ids():
+            # a follow is saved after the ids were read from the database
+            RedisHelper.add_id_to_set(key, 2)
+            return [1]
+
+        self.assertEqual(RedisHelper.load_id_set_through_cache(key, lazy_load_ids), {1})
+        # the outdated ids are not cached, they are loaded again on the next read
+        self.assertEqual(conn.exists(key), False)
+        self.assertEqual(RedisHelper.load_id_set_through_cache(key, lambda: [1, 2]), {1, 2})
+
+        RedisHelper.invalidate_id_sets([key])
+
+        def lazy_load_ids_before_unfollow():
+            RedisHelper.remove_id_from_set(key, 2)
+            return [1, 2]
+
+        self.assertEqual(RedisHelper.get_ids_in_set(key, [1, 2], lazy_load_ids_before_unfollow), {1, 2})
+        self.assertEqual(conn.exists(key), False)
+        self.assertEqual(RedisHelper.get_ids_in_set(key, [1, 2], lambda: [1]), {1})
+
+class SingleFlightTests(TestCase):
+
+    def setUp(self):
+        super(SingleFlightTests, self).setUp()
+        self.wl = self.create_user('wl')
+
+    def test_thundering_herd(self):
+        tweets = [self.create_tweet(self.wl) for i in range(3)]
+        key = 'test_thundering_herd'
+        loads = []
+
+        def lazy_load(limit):
+            loads.append(limit)
+            # keep the leader loading while the others arrive
+            time.sleep(0.2)
+            return tweets
+
+        results = []
+        barrier = threading.Barrier(10)
+
+        def request():
+            barrier.wait()
+            objects = RedisHelper.load_objects_through_cache(key, lazy_load, start=0, stop=1)
+            results.append([obj.id for obj in objects])
+
+        metrics = SingleFlight.get_metrics()
+        threads = [threading.Thread(target=request) for i in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(loads), 1)
+        self.assertEqual(results, [[tweets[0].id, tweets[1].id]] * 10)
+        self.assertEqual(SingleFlight.get_metrics()['coalesced'] - metrics['coalesced'], 9)
+        self.assertEqual(RedisClient.get_connection().llen(key), 3)
+
+    def test_refresh_not_shared_with_cold_load(self):
+        tweets = [self.create_tweet(self.wl) for i in range(2)]
+        key = 'test_refresh_not_shared_with_cold_load'
+        refresh_started, cold_load_done = threading.Event(), threading.Event()
+
+        def refresh():
+            # a refresh that did not get the fill lock
+            refresh_started.set()
+            cold_load_done.wait(1)
+            return None
+
+        thread = threading.Thread(
+            target=lambda: SingleFlight.do(RedisHelper.get_refresh_flight_key(key), refresh),
+        )
+        thread.start()
+        refresh_started.wait(1)
+        objects = RedisHelper.load_objects_through_cache(key, lambda limit: tweets)
+        cold_load_done.set()
+        thread.join()
+        self.assertEqual([obj.id for obj in objects], [tweet.id for tweet in tweets])
+
+    def test_wait_for_fill(self):
+        tweets = [self.create_tweet(self.wl) for i in range(2)]
+        key = 'test_wait_for_fill'
+        # another process holds the fill lock and fills the list while we are waiting
+        token = RedisHelper.acquire_fill_lock(key)
+        timer = threading.Timer(
+            0.05,
+            lambda: RedisHelper._load_objects_to_cache(key, tweets, DjangoModelSerializer, token),
+        )
+        timer.start()
+
+        metrics = SingleFlight.get_metrics()
+        objects = RedisHelper.load_objects_through_cache(key, lambda limit: [])
+        timer.join()
+        self.assertEqual([obj.id for obj in objects], [tweet.id for tweet in tweets])
+        self.assertEqual(SingleFlight.get_metrics()['fill_wait_hits'] - metrics['fill_wait_hits'], 1)
+
+    def test_wait_for_empty_fill(self):
+        key = 'test_wait_for_empty_fill'
+        # another process holds the fill lock and finds nothing to cache
+        token = RedisHelper.acquire_fill_lock(key)
+        timer = threading.Timer(
+            0.05,
+            lambda: RedisHelper._load_objects_to_cache(key, [], DjangoModelSerializer, token),
+        )
+        timer.start()
+
+        # the lock is released without a list, the waiter stops waiting and loads the objects itself
+        start = time.monotonic()
+        objects = RedisHelper.load_objects_through_cache(key, lambda limit: [])
+        timer.join()
+        self.assertEqual(objects, [])
+        self.assertEqual(time.monotonic() - start < settings.REDIS_FILL_WAIT_TIMEOUT, True)
+
+
+class CacheExpirationTests(TestCase):
+
+    def setUp(self):
+        super(CacheExpirationTests, self).setUp()
+        self.wl = self.create_user('wl')
+
+    def test_should_recompute_early(self):
+        self.assertEqual(should_recompute_early(None, 10), False)
+        self.assertEqual(should_recompute_early(1000, 0), False)
+        self.assertEqual(should_recompute_early(1, 10 ** 9), True)
+        self.assertEqual(should_recompute_early(10 ** 9, 1), False)
+        for i in range(100):
+            expire_time = jitter(1000)
+            self.assertEqual(900 <= expire_time <= 1100, True)
+
+    def test_stale_while_revalidate(self):
+        tweets = [self.create_tweet(self.wl) for i in range(2)]
+        key = 'test_stale_while_revalidate'
+        RedisHelper.load_objects_through_cache(key, lambda limit: tweets[:1])
+        # it took so long to load the list that it is always recomputed early
+        RedisClient.get_connection().set(RedisHelper.get_delta_key(key), 10 ** 15)
+
+        refreshes = []
+        for i in range(2):
+            objects = RedisHelper.load_objects_through_cache(
+                key,
+                lambda limit: tweets,
+                refresh=lambda: refreshes.append(key),
+            )
+            # the stale list is served, and the refresh is scheduled only once
+            self.assertEqual([t.id for t in objects], [tweets[0].id])
+        self.assertEqual(refreshes, [key])
+
+        RedisHelper.refresh_objects_in_cache(key, lambda limit: tweets, DjangoModelSerializer)
+        self.assertEqual([t.id for t in RedisHelper.load_objects(key)], [tweets[0].id, tweets[1].id])
+
+    @override_settings(REDIS_STALE_WHILE_REVALIDATE=False)
+    def test_recompute_early(self):
+        tweets = [self.create_tweet(self.wl) for i in range(2)]
+        key = 'test_recompute_early'
+        RedisHelper.load_objects_through_cache(key, lambda limit: tweets[:1])
+        RedisClient.get_connection().set(RedisHelper.get_delta_key(key), 10 ** 15)
+
+        objects = RedisHelper.load_objects_through_cache(key, lambda limit: tweets, stop=0)
+        self.assertEqual([t.id for t in objects], [tweets[0].id])
+        self.assertEqual(RedisClient.get_connection().llen(key), 2)
+
+    def test_memcached_recompute_early(self):
+        tweet = self.create_tweet(self.wl)
+        key = MemcachedHelper.get_key(Tweet, tweet.id)
+        MemcachedHelper.get_object_through_cache(Tweet, tweet.id)
+        self.assertEqual(isinstance(cache.get(key), CachedValue), True)
+
+        Tweet.objects.filter(id=tweet.id).update(content='recomputed')
+        self.assertEqual(MemcachedHelper.get_object_through_cache(Tweet, tweet.id).content, tweet.content)
+        cache.set(key, CachedValue(tweet, 1, 10 ** 9))
+        self.assertEqual(MemcachedHelper.get_object_through_cache(Tweet, tweet.id).content, 'recomputed')
+
+
+class RequestCacheTests(TestCase):
+
+    def setUp(self):
+        super(RequestCacheTests, self).setUp()
+        self.wl = self.create_user('wl')
+
+    def test_scope(self):
+        loads = []
+
+        def load():
+            loads.append(1)
+            return len(loads)
+
+        # nothing is kept outside of a scope
+        self.assertEqual(RequestCache.get_or_load('namespace', 'key', load), 1)
+        self.assertEqual(RequestCache.get_or_load('namespace', 'key', load), 2)
+
+        with RequestCache.scope():
+            self.assertEqual(RequestCache.get_or_load('namespace', 'key', load), 3)
+            self.assertEqual(RequestCache.get_or_load('namespace', 'key', load), 3)
+            # a nested scope starts empty and the outer scope comes back after it
+            with RequestCache.scope():
+                self.assertEqual(RequestCache.get_or_load('namespace', 'key', load), 4)
+            self.assertEqual(RequestCache.get_or_load('namespace', 'key', load), 3)
+            RequestCache.delete('namespace', 'key')
+            self.assertEqual(RequestCache.get_or_load('namespace', 'key', load), 5)
+        self.assertEqual(RequestCache.get_namespace('namespace'), None)
+
+    def test_identity_map(self):
+        with RequestCache.scope():
+            user = MemcachedHelper.get_object_through_cache(User, self.wl.id)
+            cache.clear()
+            # fetched once per scope, the same instance every time
+            with self.assertNumQueries(0):
+                self.assertEqual(MemcachedHelper.get_object_through_cache(User, self.wl.id) is user, True)
+                users = MemcachedHelper.get_objects_through_cache(User, [self.wl.id])
+                self.assertEqual(users[0] is user, True)
+
+            # invalidation drops it from the scope as well
+            MemcachedHelper.invalidate_cached_object(User, self.wl.id)
+            with self.assertNumQueries(1):
+                MemcachedHelper.get_object_through_cache(User, self.wl.id)
+
+        cache.clear()
+        with self.assertNumQueries(1):
+            MemcachedHelper.get_object_through_cache(User, self.wl.id)
+
+
+@override_settings(LOCAL_CACHE_ENABLED=True)
+class LocalCacheTests(TestCase):
+
+    def setUp(self):
+        super(LocalCacheTests, self).setUp()
+        LocalCache.caches = {}
+        self.wl = self.create_user('wl')
+        # the invalidator clears the local caches once it has subscribed
+        self.assertEqual(LocalCacheInvalidator.subscribed.wait(1), True)
+
+    def test_lru(self):
+        local_cache = LocalCache('test', 2, 60)
+        local_cache.set('a', 1)
+        local_cache.set('b', 2)
+        self.assertEqual(local_cache.get('a'), (True, 1))
+        # b is the least recently used one
+        local_cache.set('c', 3)
+        self.assertEqual(local_cache.get('b'), (False, None))
+        self.assertEqual(local_cache.get('a'), (True, 1))
+        self.assertEqual(local_cache.get('c'), (True, 3))
+
+        metrics = local_cache.get_metrics()
+        self.assertEqual(metrics['hits'], 3)
+        self.assertEqual(metrics['misses'], 1)
+        self.assertEqual(metrics['hit_rate'], 0.75)
+        self.assertEqual(metrics['size'], 2)
+
+    def test_ttl(self):
+        local_cache = LocalCache('test', 2, 0.05)
+        local_cache.set('a', 1)
+        self.assertEqual(local_cache.get('a'), (True, 1))
+        time.sleep(0.1)
+        self.assertEqual(local_cache.get('a'), (False, None))
+
+    def test_get_object_through_cache(self):
+        user = MemcachedHelper.get_object_through_cache(User, self.wl.id)
+        cache.clear()
+        # served in process, every caller gets its own copy
+        with self.assertNumQueries(0):
+            cached_user = MemcachedHelper.get_object_through_cache(User, self.wl.id)
+            users = MemcachedHelper.get_objects_through_cache(User, [self.wl.id])
+        self.assertEqual(cached_user.username, 'wl')
+        self.assertEqual(cached_user is user, False)
+        self.assertEqual(users[0] is cached_user, False)
+        self.assertEqual(LocalCache.get_all_metrics()['User']['hits'], 2)
+
+        # models that are not listed in LOCAL_CACHE_SIZES are not kept in process
+        tweet = self.create_tweet(self.wl)
+        MemcachedHelper.get_object_through_cache(Tweet, tweet.id)
+        with override_settings(LOCAL_CACHE_SIZES={'User': 10}):
+            cache.clear()
+            with self.assertNumQueries(1):
+                MemcachedHelper.get_object_through_cache(Tweet, tweet.id)
+
+        # the invalidation of this process
+        self.wl.username = 'new_wl'
+        self.wl.save()
+        self.assertEqual(MemcachedHelper.get_object_through_cache(User, self.wl.id).username, 'new_wl')
+
+    def test_invalidation_channel(self):
+        MemcachedHelper.get_object_through_cache(User, self.wl.id)
+        key = MemcachedHelper.get_key(User, self.wl.id)
+        local_cache = LocalCache.get_cache('User')
+        self.assertEqual(local_cache.get(key)[0], True)
+
+        # another process invalidates the user
+        RedisClient.get_connection().publish(LOCAL_CACHE_CHANNEL, json.dumps(['User', key]))
+        for _ in range(50):
+            if not local_cache.get(key)[0]:
+                break
+            time.sleep(0.02)
+        self.assertEqual(local_cache.get(key)[0], False)
+        self.assertEqual(LocalCacheInvalidator.thread.is_alive(), True)
+
+
+class DjangoModelCompactSerializerTests(TestCase):
+
+    def setUp(self):
+        super(DjangoModelCompactSerializerTests, self).setUp()
+        self.wl = self.create_user('wl')
+        self.tweet = self.create_tweet(self.wl, 'compact tweet')
+
+    def test_serialize(self):
+        serialized_data = DjangoModelCompactSerializer.serialize(self.tweet)
+        self.assertEqual(
+            len(serialized_data) < len(DjangoModelSerializer.serialize(self.tweet)),
+            True,
+        )
+        tweet = DjangoModelCompactSerializer.deserialize(serialized_data)
+        self.assertEqual(tweet, self.tweet)
+        self.assertEqual(tweet.user_id, self.wl.id)
+        self.assertEqual(tweet.content, 'compact tweet')
+        self.assertEqual(tweet.created_at, self.tweet.created_at)
+
+    def test_read_django_json(self):
+        serialized_data = DjangoModelSerializer.serialize(self.tweet)
+        tweet = DjangoModelCompactSerializer.deserialize(serialized_data)
+        self.assertEqual(tweet, self.tweet)
+        self.assertEqual(tweet.content, 'compact tweet')
+
+    def test_schema_version(self):
+        data = json.loads(DjangoModelCompactSerializer.serialize(self.tweet))
+        data[1] += 1
+        with self.assertRaises(SchemaVersionError):
+            DjangoModelCompactSerializer.deserialize(json.dumps(data))
+
+        # the cached list is dropped and treated as a cache miss
+        key = USER_TWEETS_PATTERN.format(user_id=self.wl.id)
+        conn = RedisClient.get_connection()
+        conn.delete(key)
+        conn.rpush(key, json.dumps(data))
+        objects = RedisHelper.load_objects(key, serializer=DjangoModelCompactSerializer)
+        self.assertEqual(objects is CACHE_MISS, True)
+        self.assertEqual(conn.exists(key), False)
+        tweets = TweetService.get_cached_tweets(self.wl.id)
+        self.assertEqual([t.id for t in tweets], [self.tweet.id])
@@ -1,6 +1,14 @@
-from datetime import datetime
+from datetime import datetime, timedelta
+from dateutil import parser
 import pytz
 
 
 def utc_now():
-    return datetime.now().replace(tzinfo=pytz.utc)
\ No newline at end of file
+    return datetime.now().replace(tzinfo=pytz.utc)
+
+
+def parse_created_at(value):
+    # created_at is an iso datetime in mysql and a timestamp in micro seconds in hbase
+    if str(value).isdigit():
+        return datetime(1970, 1, 1, tzinfo=pytz.utc) + timedelta(microseconds=int(value))
+    return parser.isoparse(value)